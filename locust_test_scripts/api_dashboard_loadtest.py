@@ -0,0 +1,21 @@
+from realbrowserlocusts import LookerApiUser
+from locust import TaskSet, task, between
+
+
+DASH_ID = 1  # Change this!
+
+
+class LocustUserBehavior(TaskSet):
+
+    @task(1)
+    def dashboard_queries(self):
+        # runs every tile's query concurrently, reporting each tile and
+        # the dashboard as a whole
+        self.client.run_dashboard(DASH_ID)
+
+
+class LocustUser(LookerApiUser):
+
+    host = "dashboard api load test"
+    wait_time = between(2, 5)
+    task_set = LocustUserBehavior
@@ -0,0 +1,22 @@
+from pathlib import Path
+from realbrowserlocusts import LookerApiUser, ReplayPlan
+from locust import TaskSet, task, between
+
+
+# Create this plan with `nfo capture --config-file config.yaml --dashboard-id 1`
+PLAN = ReplayPlan.load(Path(__file__).parent.joinpath("replay_plans", "dashboard_1.json"))
+
+
+class LocustUserBehavior(TaskSet):
+
+    @task(1)
+    def replay_dashboard(self):
+        # replays the captured tile queries with the plan's tile concurrency
+        self.client.run_plan(PLAN)
+
+
+class LocustUser(LookerApiUser):
+
+    host = "dashboard replay load test"
+    wait_time = between(2, 5)
+    task_set = LocustUserBehavior
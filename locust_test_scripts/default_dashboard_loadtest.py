@@ -1,7 +1,5 @@
 import os
 from realbrowserlocusts import HeadlessChromeLocust
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from locust import TaskSet, task, between
 
@@ -38,21 +36,9 @@ class LocustUserBehavior(TaskSet):
         self.client.close()
 
     def open_dashboard(self):
-        script = """
-        window.awaitPerformanceObservation("rendered").then(function() {
-            var dash_render = document.createElement("div");
-            dash_render.id = "dash_listener";
-            document.body.appendChild(dash_render);
-        });"""
-
         try:
             self.client.get(f"{SITE}/embed/dashboards/{str(DASH_ID)}")
-            self.client.execute_script(script)
-            self.client.wait.until(
-                EC.presence_of_element_located(
-                    (By.ID, "dash_listener")
-                )
-            )
+            self.client.wait_for_render()
         except TimeoutException:
             print("hit timeout")
 
@@ -1,16 +1,27 @@
 import os
-from realbrowserlocusts import HeadlessChromeLocust
+from pathlib import Path
+from realbrowserlocusts import HeadlessChromeLocust, ContentMix, ContentMixTaskSet
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import TimeoutException
-from locust import TaskSet, task, between
+from locust import between
 
 # Change this
 SITE = "https://your.looker.com"
 
+# The content to load and how often, one row per dashboard or look. See the
+# "Content mixes" section of the README for the file format.
+CONTENT_MIX = ContentMix.load(Path(__file__).parent.joinpath("content_mixes", "multiple_content.csv"))
 
-class LocustUserBehavior(TaskSet):
+
+class LocustUserBehavior(ContentMixTaskSet):
+    """
+    Each task run opens one of the pieces of content in the content mix,
+    picked at random according to their weights. Content is reported in
+    locust under its group and name (e.g. "dashboard 683").
+    """
+    content_mix = CONTENT_MIX
+    site = SITE
 
     def on_start(self):
         self.login()
@@ -39,270 +50,6 @@ class LocustUserBehavior(TaskSet):
     def logout(self):
         print("stopping session")
 
-    def open(self, content_id, stem='dashboards'):
-        """
-        The script below is the appropriate way to detect when content has
-        finished rendering in Looker. The injected Javascript makes Looker
-        create a DOM element when finished, which Locust uses Selenium to
-        detect and wait for.
-        """
-        script = """
-        window.awaitPerformanceObservation("rendered").then(function() {
-            var render = document.createElement("div");
-            render.id = "finished";
-            document.body.appendChild(render);
-        });"""
-
-        try:
-            self.client.get(f"{SITE}/embed/{stem}/{content_id}")
-            self.client.execute_script(script)
-            self.client.wait.until(
-                EC.presence_of_element_located(
-                    (By.ID, "finished")
-                )
-            )
-        except TimeoutException:
-            print("hit timeout")
-
-    """
-    Each of these methods defines a load testing task to run randomly.
-    The decorator @task(n) indicates the relative weight of the task
-    versus all other tasks. If you decorate a method with @task(5)
-    it will be five times more likely to run than a method decorated
-    with @task(1).
-
-    The name of the methods don't matter, but they do need to be unique.
-    This is why there's a sequential ID appended to each method name.
-
-    The tasks below result in one of about 27 different pieces of content
-    being randomly loaded each time a Locust user executes this TaskSet.
-
-    """
-
-    # Operations
-    @task(1)
-    def dashboard_1(self):
-        id = "683"
-        self.client.timed_event_for_locust(
-            # The first and second parameters are
-            # used to tag and identify tasks
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_2(self):
-        id = "729"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            # stem can be used to override the default
-            # 'dashboards' route in the self.open method
-            self.open, content_id=id, stem='dashboards-next'
-        )
-
-    @task(1)
-    def dashboard_3(self):
-        id = "927"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id, stem='dashboards-next'
-        )
-
-    @task(1)
-    def dashboard_4(self):
-        id = "623"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_5(self):
-        id = "797"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id, stem='dashboards-next'
-        )
-
-    @task(1)
-    def dashboard_6(self):
-        id = "858"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id, stem='dashboards-next'
-        )
-
-    @task(1)
-    def dashboard_7(self):
-        id = "944"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_8(self):
-        id = "156"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_9(self):
-        id = "943"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id, stem='dashboards-next'
-        )
-
-    @task(1)
-    def dashboard_10(self):
-        id = "1014"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id, stem='dashboards-next'
-        )
-
-    @task(1)
-    def dashboard_11(self):
-        id = "702"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_12(self):
-        id = "517"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_13(self):
-        id = "693"
-        self.client.timed_event_for_locust(
-            "Operations", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    # Finance
-    @task(1)
-    def dashboard_14(self):
-        id = "1180"
-        self.client.timed_event_for_locust(
-            "Finance", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def look_1(self):
-        id = "5818"
-        self.client.timed_event_for_locust(
-            "Finance", f"look {id}",
-            self.open, content_id=id, stem='looks'
-        )
-
-    @task(1)
-    def look_2(self):
-        id = "6448"
-        self.client.timed_event_for_locust(
-            "Finance", f"look {id}",
-            self.open, content_id=id, stem='looks'
-        )
-
-    @task(1)
-    def look_3(self):
-        id = "6592"
-        self.client.timed_event_for_locust(
-            "Finance", f"look {id}",
-            self.open, content_id=id, stem='looks'
-        )
-
-    @task(1)
-    def look_4(self):
-        id = "5817"
-        self.client.timed_event_for_locust(
-            "Finance", f"look {id}",
-            self.open, content_id=id, stem='looks'
-        )
-
-    @task(1)
-    def look_5(self):
-        id = "4488"
-        self.client.timed_event_for_locust(
-            "Finance", f"look {id}",
-            self.open, content_id=id, stem='looks'
-        )
-
-    @task(1)
-    def look_6(self):
-        id = "2857"
-        self.client.timed_event_for_locust(
-            "Finance", f"look {id}",
-            self.open, content_id=id, stem='looks'
-        )
-
-    # Marketing
-    @task(1)
-    def dashboard_15(self):
-        id = "1114"
-        self.client.timed_event_for_locust(
-            "Marketing", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_16(self):
-        id = "1115"
-        self.client.timed_event_for_locust(
-            "Marketing", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_17(self):
-        id = "1126"
-        self.client.timed_event_for_locust(
-            "Marketing", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_18(self):
-        id = "1119"
-        self.client.timed_event_for_locust(
-            "Marketing", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_19(self):
-        id = "975"
-        self.client.timed_event_for_locust(
-            "Marketing", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    # HR
-    @task(1)
-    def dashboard_20(self):
-        id = "1087"
-        self.client.timed_event_for_locust(
-            "HR", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
-    @task(1)
-    def dashboard_21(self):
-        id = "1176"
-        self.client.timed_event_for_locust(
-            "HR", f"dashboard {id}",
-            self.open, content_id=id
-        )
-
 
 class LocustUser(HeadlessChromeLocust):
     host = "dashboard load test"
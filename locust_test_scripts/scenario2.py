@@ -1,7 +1,6 @@
 import os
-from realbrowserlocusts import ChromeLocust
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
+from realbrowserlocusts import ChromeLocust, EmbedUrlPool, EmbedSigner
+from realbrowserlocusts.embed import sdk_url_generator
 from selenium.common.exceptions import TimeoutException
 from locust import TaskSet, task, between
 import looker_sdk
@@ -53,30 +52,39 @@ EMBED_USER_ID = str(users)
 ##not currently using - how to insert random value in user_attribute brand?
 brand = ["Calvin Klein", "Carhartt", "Allegra K","Dockers","Levi's"]
 
-sdk=looker_sdk.init31()
+#create sso embed user url params for a new random embed user
+def embed_params():
+    return dict(
+        target_url=SITE+"/dashboards"+f"{random.choice(dash_id)}", 
+        session_length=10000, 
+        force_logout_login=True, 
+        external_user_id= f"{str(random.randint(0,100000))}", 
+        first_name= "Embed", 
+        last_name= "User", 
+        permissions=["access_data", "see_looks", "see_user_dashboards", "see_drill_overlay","explore"], 
+        models=["thelook"], 
+        group_ids=[12058, 11],
+        user_attributes= {"brand":f"{random.choice(brand)}"}
+    )
+
+
+# sso urls are signed ahead of time by a background greenlet, so spawning
+# users doesn't wait on signing. each url can only be used once.
+# with the embed secret urls are signed locally, otherwise via the API
+if os.getenv("EMBED_SECRET"):
+    generate_url = EmbedSigner(SITE).generator(embed_params)
+else:
+    sdk = looker_sdk.init31()
+    generate_url = sdk_url_generator(sdk, lambda: looker_sdk.models.EmbedSsoParams(**embed_params()))
+EMBED_URLS = EmbedUrlPool(generate_url, size=50, batch_size=5)
+
 
 class LocustUserBehavior(TaskSet):
 
     #automatically called by locust
     def on_start(self):
-        #create sso embed user url via API
-        embed_params =looker_sdk.models.EmbedSsoParams(
-            target_url=SITE+"/dashboards"+f"{random.choice(dash_id)}", 
-            session_length=10000, 
-            force_logout_login=True, 
-            external_user_id= f"{str(random.randint(0,100000))}", 
-            first_name= "Embed", 
-            last_name= "User", 
-            permissions=["access_data", "see_looks", "see_user_dashboards", "see_drill_overlay","explore"], 
-            models=["thelook"], 
-            group_ids=[12058, 11],
-            user_attributes= {"brand":f"{random.choice(brand)}"}
-        )
-        
-        #create embed user+ get embed user credentials
-        self.embed_url=sdk.create_sso_embed_url(embed_params)
         #run sso url -establish valid embed session
-        self.client.get(self.embed_url.url)
+        self.client.get(next(EMBED_URLS))
         # self.login()
         
     #automatically called by locust
@@ -102,64 +110,24 @@ class LocustUserBehavior(TaskSet):
         print("stopping session")
 
     def open_dashboard(self):
-        script = """
-        window.awaitPerformanceObservation("rendered").then(function() {
-            var dash_render = document.createElement("div");
-            dash_render.id = "dash_listener";
-            document.body.appendChild(dash_render);
-        });"""
-
         try:
             self.client.get(f"{SITE}/embed/dashboards{str(random.choice(dash_id))}")
-
-            self.client.execute_script(script)
-
-            self.client.wait.until(
-                EC.presence_of_element_located(
-                    (By.ID, "dash_listener")
-                )
-            )
+            self.client.wait_for_render()
         except TimeoutException:
             print("hit timeout")
 
     def open_sso_dashboard(self):
-        script = """
-        window.awaitPerformanceObservation("rendered").then(function() {
-            var dash_render = document.createElement("div");
-            dash_render.id = "dash_listener";
-            document.body.appendChild(dash_render);
-        });"""
-
         try:
-            self.client.get(self.embed_url.url)
-            self.client.execute_script(script)
-            self.client.wait.until(
-                EC.presence_of_element_located(
-                    (By.ID, "dash_listener")
-                )
-            )
+            self.client.get(next(EMBED_URLS))
+            self.client.wait_for_render()
 
         except TimeoutException:
             print("hit timeout")
 
     def open_explore(self):
-        script = """
-        window.awaitPerformanceObservation("rendered").then(function() {
-            var dash_render = document.createElement("div");
-            dash_render.id = "finished";
-            document.body.appendChild(render);
-        });"""
-
         try:
             self.client.get(f"{SITE}/embed/explore/{str(random.choice(explore_id))}")
-
-            self.client.execute_script(script)
-
-            self.client.wait.until(
-                EC.presence_of_element_located(
-                    (By.ID, "finished")
-                )
-            )
+            self.client.wait_for_render()
         except TimeoutException:
             print("hit timeout")
 
@@ -181,8 +149,7 @@ class LocustUserBehavior(TaskSet):
     def sso_dashboard_loading(self):
         self.client.timed_event_for_locust(
             "Load", "sso dashboard",
-            self.open_sso_dashboard,
-            self.open_dashboard
+            self.open_sso_dashboard
         )
     ##open explore
     @task(4)
@@ -192,6 +159,7 @@ class LocustUserBehavior(TaskSet):
             self.open_explore
         )
 
+
 class LocustUser(ChromeLocust):
 
     host = "dashboard load test"
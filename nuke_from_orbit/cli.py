@@ -1,6 +1,8 @@
 import click
 from nuke_from_orbit.commands import setup_commands, teardown_commands
-from nuke_from_orbit.commands import update_config_commands, update_test_commands
+from nuke_from_orbit.commands import update_config_commands, update_test_commands, update_script_commands
+from nuke_from_orbit.commands import capture_commands, pool_commands, calibrate_commands, plan_commands
+from nuke_from_orbit.commands import results_commands
 
 
 @click.group()
@@ -13,6 +15,7 @@ def nfo():
 @click.option("--config-file", help="Which config file to use for the setup", required=True)
 @click.option("--external", is_flag=True, help="Should external ingress be set up")
 @click.option("--persistence/--no-persistence", default=True, help="Should persistent disk setup be skipped?")
+@click.option("--reuse", is_flag=True, help="Should a parked cluster be resized instead of creating a new one")
 def setup(**kwargs):
     setup_commands.main(**kwargs)
 
@@ -24,6 +27,54 @@ def teardown(**kwargs):
     teardown_commands.main(**kwargs)
 
 
+@nfo.group()
+def pool():
+    pass
+
+
+@pool.command()
+@click.option("--config-file", help="Which config file to use for the setup", required=True)
+def park(**kwargs):
+    pool_commands.main(**kwargs)
+
+
+@nfo.command()
+@click.option("--config-file", help="Which config file to use for the capture", required=True)
+@click.option("--dashboard-id", help="Which dashboard to capture", required=True)
+@click.option("--filter", multiple=True, help="Override a dashboard filter value, e.g. --filter 'Date=7 days'")
+@click.option("--output", help="Replay plan file name (default: dashboard_<id>.json)")
+@click.option("--max-concurrency", default=6, type=int, help="How many tiles may run at once during replay")
+@click.option("--row-counts/--no-row-counts", default=True, help="Should tiles be run to record expected row counts")
+def capture(**kwargs):
+    capture_commands.main(**kwargs)
+
+
+@nfo.command()
+@click.option("--config-file", help="Which config file to use for the calibration", required=True)
+@click.option("--target-p95", required=True, type=int, help="Highest acceptable p95 response time in milliseconds")
+@click.option("--max-users", default=20, type=click.IntRange(min=1), help="Most users to try on the single worker")
+@click.option("--step-users", default=1, type=click.IntRange(min=1), help="How many users to add at each step")
+@click.option("--step-duration", default=60, type=click.IntRange(min=1), help="How many seconds to measure each step for")
+def calibrate(**kwargs):
+    calibrate_commands.main(**kwargs)
+
+
+@nfo.command()
+@click.option("--config-file", help="Which config file to use for the plan", required=True)
+@click.option("--users", required=True, type=int, help="How many users the load test should run")
+@click.option("--machine-family", help="Machine family to plan for (default: the one calibrated on)")
+def plan(**kwargs):
+    plan_commands.main(**kwargs)
+
+
+@nfo.command()
+@click.option("--config-file", help="Which config file to use for the results", required=True)
+@click.option("--by", default="name", type=click.Choice(["name", "group", "worker"]),
+              help="Summarise samples by request name, request group or worker")
+def results(**kwargs):
+    results_commands.main(**kwargs)
+
+
 @nfo.group()
 def update():
     pass
@@ -40,3 +91,9 @@ def config(**kwargs):
 @click.option("--config-file", help="Which config file to use for the setup", required=True)
 def test(**kwargs):
     update_test_commands.main(**kwargs)
+
+
+@update.command()
+@click.option("--config-file", help="Which config file to use for the setup", required=True)
+def script(**kwargs):
+    update_script_commands.main(**kwargs)
@@ -0,0 +1,32 @@
+import os
+from nuke_from_orbit.utils import nuke_utils
+from pathlib import Path
+
+
+def main(**kwargs):
+    root_dir = Path(__file__).parent.parent.parent
+    config_dir = root_dir.joinpath("configs")
+    sa_dir = root_dir.joinpath("credentials")
+
+    config_file = config_dir.joinpath(kwargs["config_file"])
+
+    # get the user config
+    user_config = nuke_utils.set_variables(config_file)
+
+    # set gcp service account environment variable
+    service_account_file = sa_dir.joinpath(user_config["gcp_service_account_file"]).resolve()
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(service_account_file)
+
+    # set kubernetes context
+    nuke_utils.set_kubernetes_context(user_config)
+
+    # step up the users on a single worker until it can't keep up
+    profile_file = nuke_utils.calibrate_worker(
+        user_config,
+        max_users=kwargs["max_users"],
+        target_p95_ms=kwargs["target_p95"],
+        step_users=kwargs["step_users"],
+        step_duration=kwargs["step_duration"]
+    )
+
+    print(f"{nuke_utils.BColors.OKGREEN}Calibration complete! Profile written to {profile_file}{nuke_utils.BColors.ENDC}")
@@ -0,0 +1,39 @@
+import os
+from nuke_from_orbit.utils import nuke_utils
+from pathlib import Path
+
+
+def main(**kwargs):
+    root_dir = Path(__file__).parent.parent.parent
+    config_dir = root_dir.joinpath("configs")
+    sa_dir = root_dir.joinpath("credentials")
+
+    config_file = config_dir.joinpath(kwargs["config_file"])
+    dashboard_id = kwargs["dashboard_id"]
+
+    # parse the name=value filter overrides
+    filter_overrides = {}
+    for dashboard_filter in kwargs["filter"]:
+        if "=" not in dashboard_filter:
+            raise ValueError(f"Filters must be provided as name=value, got: {dashboard_filter}")
+        name, value = dashboard_filter.split("=", 1)
+        filter_overrides[name] = value
+
+    # get the user config
+    user_config = nuke_utils.set_variables(config_file)
+
+    # set gcp service account environment variable
+    service_account_file = sa_dir.joinpath(user_config["gcp_service_account_file"]).resolve()
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(service_account_file)
+
+    # capture the dashboard into a replay plan
+    plan_file = nuke_utils.capture_replay_plan(
+        user_config,
+        dashboard_id,
+        filter_overrides=filter_overrides,
+        plan_name=kwargs["output"],
+        max_concurrency=kwargs["max_concurrency"],
+        count_rows=kwargs["row_counts"]
+    )
+
+    print(f"{nuke_utils.BColors.OKGREEN}Capture complete! Replay plan written to {plan_file}{nuke_utils.BColors.ENDC}")
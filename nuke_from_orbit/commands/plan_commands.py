@@ -0,0 +1,28 @@
+import yaml
+from nuke_from_orbit.utils import nuke_utils
+from pathlib import Path
+
+
+def main(**kwargs):
+    root_dir = Path(__file__).parent.parent.parent
+    config_dir = root_dir.joinpath("configs")
+
+    config_file = config_dir.joinpath(kwargs["config_file"])
+    target_users = kwargs["users"]
+
+    # get the user config
+    user_config = nuke_utils.set_variables(config_file)
+
+    plan, profile = nuke_utils.plan_capacity(user_config, target_users, kwargs["machine_family"])
+
+    config_values = {k: v for k, v in plan.items() if k.startswith(("gcp_", "loadtest_"))}
+
+    plan_message = (
+        f"Based on {profile['users_per_worker']} users per worker at a p95 of {profile['target_p95_ms']}ms "
+        f"(calibrated on {profile['machine_type']} at {profile['calibrated_at']}),\n"
+        f"{target_users} users need {plan['loadtest_worker_count']} workers on {plan['total_vcpus']} vCPUs. "
+        "Recommended config:\n"
+    )
+
+    print(f"{nuke_utils.BColors.OKGREEN}{plan_message}{nuke_utils.BColors.ENDC}")
+    print(yaml.safe_dump(config_values, sort_keys=False))
@@ -0,0 +1,28 @@
+import os
+from nuke_from_orbit.utils import nuke_utils
+from pathlib import Path
+
+
+def main(**kwargs):
+    root_dir = Path(__file__).parent.parent.parent
+    config_dir = root_dir.joinpath("configs")
+    sa_dir = root_dir.joinpath("credentials")
+
+    config_file = config_dir.joinpath(kwargs["config_file"])
+
+    # get the user config
+    user_config = nuke_utils.set_variables(config_file)
+
+    # set gcp service account environment variable
+    service_account_file = sa_dir.joinpath(user_config["gcp_service_account_file"]).resolve()
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(service_account_file)
+
+    # scale the cluster down but keep it (and everything deployed to it) around
+    nuke_utils.park_gke(user_config)
+
+    park_message = (
+        "Cluster parked! Run `nfo setup --reuse` with the same config to scale it back up, "
+        "or `nfo teardown` to delete it."
+    )
+
+    print(f"{nuke_utils.BColors.OKGREEN}{park_message}{nuke_utils.BColors.ENDC}")
@@ -0,0 +1,44 @@
+import os
+from nuke_from_orbit.utils import nuke_utils, results
+from pathlib import Path
+
+
+def main(**kwargs):
+    root_dir = Path(__file__).parent.parent.parent
+    config_dir = root_dir.joinpath("configs")
+    sa_dir = root_dir.joinpath("credentials")
+
+    config_file = config_dir.joinpath(kwargs["config_file"])
+    group_by = kwargs["by"]
+
+    # get the user config
+    user_config = nuke_utils.set_variables(config_file)
+
+    # set gcp service account environment variable
+    service_account_file = sa_dir.joinpath(user_config["gcp_service_account_file"]).resolve()
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(service_account_file)
+
+    # set kubernetes context
+    nuke_utils.set_kubernetes_context(user_config)
+
+    # download the latency logs and work out exact percentiles from every sample
+    result_files = nuke_utils.fetch_results(user_config)
+    summary = results.summarize(result_files, by=group_by)
+
+    if not summary:
+        print(f"{nuke_utils.BColors.WARNING}No samples recorded. Is loadtest_record_samples set?{nuke_utils.BColors.ENDC}")
+        return
+
+    summary_file = nuke_utils.RESULTS_PATH.joinpath(user_config["loadtest_name"], f"summary_by_{group_by}.csv")
+    results.write_summary_csv(summary, summary_file)
+
+    width = max(len(group_by), *(len(row[group_by]) for row in summary))
+    columns = [c for c in summary[0] if c != group_by]
+    print(f"{group_by:<{width}}  " + "  ".join(f"{c:>9}" for c in columns))
+    for row in summary:
+        print(f"{row[group_by]:<{width}}  " + "  ".join(f"{row[c]:>9}" for c in columns))
+
+    print(
+        f"{nuke_utils.BColors.OKGREEN}Summary of {len(result_files)} files written to "
+        f"{summary_file}{nuke_utils.BColors.ENDC}"
+    )
@@ -1,8 +1,17 @@
 import os
-import concurrent.futures
-from nuke_from_orbit.utils import nuke_utils
+from nuke_from_orbit.utils import nuke_utils, scheduler
 from pathlib import Path
 
+# how many setup steps may run at once
+SETUP_WORKERS = 6
+
+
+def render_templates(user_config, external):
+    """Collects and renders the kubernetes templates for the deployment."""
+
+    file_list = nuke_utils.collect_kube_yaml_templates(external)
+    nuke_utils.render_kubernetes_templates(user_config, file_list)
+
 
 def main(**kwargs):
     root_dir = Path(__file__).parent.parent.parent
@@ -16,6 +25,9 @@ def main(**kwargs):
     persistence = kwargs["persistence"]
     print(persistence)
 
+    # set the reuse boolean
+    reuse = kwargs.get("reuse", False)
+
     # setting tag to v1 for initial setup
     tag = "v1"
 
@@ -28,18 +40,51 @@ def main(**kwargs):
     service_account_file = sa_dir.joinpath(user_config["gcp_service_account_file"]).resolve()
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(service_account_file)
 
-    # multithread the gke deployment and cloud build for maximum fast
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        tasks = []
-        tasks.append(executor.submit(nuke_utils.deploy_gke, user_config))
-        tasks.append(executor.submit(nuke_utils.deploy_test_container_image, user_config))
-        if external:
-            tasks.append(executor.submit(nuke_utils.deploy_ip_address, user_config))
-        if persistence:
-            tasks.append(executor.submit(nuke_utils.deploy_persistent_disk, user_config))
+    # setup runs as a graph of steps so each one starts as soon as what it needs is in place.
+    # kubernetes deploys only wait on the cluster (and the image for locust) rather than on
+    # every cloud resource, so the total time is that of the slowest chain of steps
+    steps = [
+        scheduler.Step("gke", nuke_utils.reuse_gke if reuse else nuke_utils.deploy_gke, user_config),
+        scheduler.Step("image", nuke_utils.deploy_test_container_image, user_config),
+        scheduler.Step("templates", render_templates, user_config, external),
+        scheduler.Step("context", nuke_utils.set_kubernetes_context, user_config, depends_on=["gke"]),
+        scheduler.Step("looker secrets", nuke_utils.deploy_looker_secret, user_config, depends_on=["context"])
+    ]
+
+    locust_dependencies = ["context", "templates", "image", "looker secrets"]
+    secondary_dependencies = ["context", "templates"]
+
+    if reuse:
+        # a parked cluster keeps the test scripts config map of its last run, which would
+        # shadow the scripts in the new image
+        steps.append(scheduler.Step("test scripts", nuke_utils.deploy_test_scripts, user_config, depends_on=["context"]))
+        locust_dependencies.append("test scripts")
 
-        for future in concurrent.futures.as_completed(tasks):
-            future.result()
+    if external:
+        steps.extend([
+            scheduler.Step("ip address", nuke_utils.deploy_ip_address, user_config),
+            scheduler.Step("oauth secret", nuke_utils.deploy_oauth_secret, user_config, depends_on=["context"]),
+            scheduler.Step(
+                "external",
+                nuke_utils.deploy_external,
+                depends_on=["context", "templates", "ip address", "oauth secret"]
+            )
+        ])
+
+    # the results disk of recorded samples is mounted by the locust master, so it has to be
+    # in place even when persistent disk setup is skipped
+    if persistence or user_config.get("loadtest_record_samples"):
+        steps.append(scheduler.Step("persistent disk", nuke_utils.deploy_persistent_disk, user_config))
+        locust_dependencies.append("persistent disk")
+        # the prometheus volume is backed by the persistent disk
+        secondary_dependencies.append("persistent disk")
+
+    steps.extend([
+        scheduler.Step("secondary", nuke_utils.deploy_secondary, depends_on=secondary_dependencies),
+        scheduler.Step("locust", nuke_utils.deploy_locust, depends_on=locust_dependencies)
+    ])
+
+    scheduler.run_steps(steps, max_workers=SETUP_WORKERS)
 
     # fetch the ip address for final output
     if external:
@@ -50,28 +95,6 @@ def main(**kwargs):
             f"Please create an A Record in your DNS provider for *.{dns} that points to {ip}.\n\n"
         )
 
-    # parse and render kubernetes template files
-    file_list = nuke_utils.collect_kube_yaml_templates(external)
-    nuke_utils.render_kubernetes_templates(user_config, file_list)
-
-    # set kubernetes context
-    nuke_utils.set_kubernetes_context(user_config)
-
-    # deploy secrets
-    nuke_utils.deploy_looker_secret(user_config)
-    if external:
-        nuke_utils.deploy_oauth_secret(user_config)
-
-    # deploy external components if required
-    if external:
-        nuke_utils.deploy_external()
-
-    # deploy locust
-    nuke_utils.deploy_locust()
-
-    # deploy secondary services
-    nuke_utils.deploy_secondary()
-
     kubectl_message = (
         "To configure kubectl access please run the following command:\n"
         f"export GOOGLE_APPLICATION_CREDENTIALS={str(service_account_file)}\n\n"
@@ -27,6 +27,9 @@ def main(**kwargs):
     # deploy secrets
     nuke_utils.deploy_looker_secret(user_config)
 
+    # refresh the test scripts so the config map doesn't shadow the ones in the image
+    nuke_utils.deploy_test_scripts(user_config)
+
     # deploy locust
     nuke_utils.deploy_locust(cycle=True)
 
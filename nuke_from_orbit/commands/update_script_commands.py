@@ -0,0 +1,31 @@
+import os
+from nuke_from_orbit.utils import nuke_utils
+from pathlib import Path
+
+
+def main(**kwargs):
+    root_dir = Path(__file__).parent.parent.parent
+    config_dir = root_dir.joinpath("configs")
+    sa_dir = root_dir.joinpath("credentials")
+
+    config_file = config_dir.joinpath(kwargs["config_file"])
+
+    # get the user config
+    user_config = nuke_utils.set_variables(config_file)
+
+    # set gcp service account environment variable
+    service_account_file = sa_dir.joinpath(user_config["gcp_service_account_file"]).resolve()
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(service_account_file)
+
+    # set kubernetes context
+    nuke_utils.set_kubernetes_context(user_config)
+
+    # ship the test scripts - the pods pick them up without being cycled
+    nuke_utils.deploy_test_scripts(user_config)
+
+    reload_message = (
+        "Test scripts updated! Locust workers reload as soon as kubernetes syncs the change to the pods, "
+        "which usually takes up to a minute."
+    )
+
+    print(f"{nuke_utils.BColors.OKGREEN}{reload_message}{nuke_utils.BColors.ENDC}")
@@ -4,6 +4,10 @@ LOCUST="/usr/local/bin/locust"
 LOCUS_OPTS="-f /locust-tasks/tasks.py --host=$TARGET_HOST"
 LOCUST_MODE=${LOCUST_MODE:-standalone}
 
+# Test scripts shipped with `nfo update script` are mounted here from a config map
+SCRIPT_DIR=${LOCUST_SCRIPT_DIR:-/locust-scripts}
+RELOAD_INTERVAL=${LOCUST_RELOAD_INTERVAL:-5}
+
 if [[ "$LOCUST_MODE" = "master" ]]; then
     LOCUS_OPTS="$LOCUS_OPTS --master"
     if [[ "$LOCUST_STEP" = true ]]; then
@@ -13,6 +17,51 @@ elif [[ "$LOCUST_MODE" = "worker" ]]; then
     LOCUS_OPTS="$LOCUS_OPTS --slave --master-host=$LOCUST_MASTER_HOST"
 fi
 
+# Copy the mounted scripts over the ones in the image. Config map keys can't
+# hold directories so data files are keyed as <directory>--<file name>
+sync_scripts() {
+    for script in "$SCRIPT_DIR"/*; do
+        [[ -f "$script" ]] || continue
+        name=$(basename "$script")
+        target="/locust-tasks/${name//--//}"
+        mkdir -p "$(dirname "$target")"
+        cp "$script" "$target"
+    done
+}
+
+# Kubernetes swaps the ..data link atomically whenever the config map changes
+script_version() {
+    readlink "$SCRIPT_DIR/..data" 2>/dev/null
+}
+
+sync_scripts
+version=$(script_version)
+
 echo "$LOCUST $LOCUS_OPTS"
 
-$LOCUST $LOCUS_OPTS
+# The master only needs the script to start, so it is left alone
+if [[ "$LOCUST_MODE" = "master" ]]; then
+    exec $LOCUST $LOCUS_OPTS
+fi
+
+$LOCUST $LOCUS_OPTS &
+pid=$!
+trap 'kill -TERM $pid; wait $pid; exit' TERM INT
+
+# Restart locust when the scripts change. A stopped worker tells the master it
+# quit and the restarted one rejoins the running test, without a pod rollout
+while kill -0 $pid 2>/dev/null; do
+    sleep "$RELOAD_INTERVAL"
+    current=$(script_version)
+    if [[ "$current" != "$version" ]]; then
+        echo "Test scripts changed, reloading locust"
+        version=$current
+        sync_scripts
+        kill -TERM $pid
+        wait $pid
+        $LOCUST $LOCUS_OPTS &
+        pid=$!
+    fi
+done
+
+wait $pid
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# test the package in this directory rather than the realbrowserlocusts release installed from PyPI
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
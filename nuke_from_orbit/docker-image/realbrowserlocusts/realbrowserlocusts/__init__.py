@@ -2,12 +2,28 @@
 """ Expose RealBrowserLocust subclasses at package level """
 from realbrowserlocusts.locusts import FirefoxLocust, PhantomJSLocust, \
     ChromeLocust, HeadlessChromeLocust
+from realbrowserlocusts.api import LookerApiUser
+from realbrowserlocusts.replay import ReplayPlan
+from realbrowserlocusts.content_mix import ContentMix, ContentMixTaskSet
+from realbrowserlocusts.embed import EmbedUrlPool, EmbedSigner
+from realbrowserlocusts.saturation import SaturationMonitor
+from realbrowserlocusts.autoscale import Rebalancer
+from realbrowserlocusts.recorder import LatencyLog
 
 __all__ = [
     'FirefoxLocust',
     'PhantomJSLocust',
     'ChromeLocust',
-    'HeadlessChromeLocust'
+    'HeadlessChromeLocust',
+    'LookerApiUser',
+    'ReplayPlan',
+    'ContentMix',
+    'ContentMixTaskSet',
+    'EmbedUrlPool',
+    'EmbedSigner',
+    'SaturationMonitor',
+    'Rebalancer',
+    'LatencyLog'
 ]
 
 __version__ = "0.2"
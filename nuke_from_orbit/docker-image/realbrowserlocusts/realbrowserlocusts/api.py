@@ -0,0 +1,256 @@
+# pylint:disable=too-few-public-methods
+""" Browserless Locust that drives Looker through its API """
+import json
+import time
+from os import getenv as os_getenv
+from gevent.pool import Group
+from requests.adapters import HTTPAdapter
+from locust import Locust
+from locust.clients import HttpSession
+from locust.exception import LocustError
+from realbrowserlocusts.core import fire_timed_event, start_timer, elapsed_ms
+from realbrowserlocusts.replay import replay
+
+TILE_FIELDS = "id,title,query_id,look(query_id),result_maker(query_id)"
+
+# log in again this many seconds before the access token expires
+TOKEN_REFRESH_MARGIN = 60
+
+
+class LookerApiClient(HttpSession):
+    """
+    Locust HTTP session that knows how to talk to the Looker API. Every
+    call is reported to locust; query runs are named after the tile or
+    query they belong to so they can be told apart in the statistics.
+    Once logged in the session logs in again whenever its access token is
+    about to expire.
+    """
+
+    def __init__(self, base_url, api_version="3.1", adapter=None):
+        super(LookerApiClient, self).__init__(base_url)
+        self.api_version = api_version
+        self.tile_cache = {}
+        self.token_expires_at = None
+        self._credentials = None
+        if adapter is not None:
+            self.mount("https://", adapter)
+            self.mount("http://", adapter)
+
+    def api_path(self, path):
+        """ Prefix an API endpoint with the versioned API root """
+        return "/api/{}/{}".format(self.api_version, path.lstrip("/"))
+
+    def login(self, client_id, client_secret):
+        """
+        Log in with API3 credentials and use the access token for every
+        subsequent call made by this session, until it expires.
+        """
+        # don't refresh the token while logging in
+        self.token_expires_at = None
+        response = self.post(
+            self.api_path("login"),
+            data={"client_id": client_id, "client_secret": client_secret},
+            name="login"
+        )
+        if not response.ok:
+            raise LocustError("Looker API login failed: {}".format(response.status_code))
+        token = response.json()
+        self.headers["Authorization"] = "token {}".format(token["access_token"])
+        self._credentials = (client_id, client_secret)
+        if token.get("expires_in"):
+            expires_in = token["expires_in"]
+            self.token_expires_at = time.monotonic() + max(expires_in - TOKEN_REFRESH_MARGIN, expires_in / 2)
+
+    def logout(self):
+        """ Revoke the session's access token """
+        self._credentials = None
+        self.token_expires_at = None
+        if "Authorization" in self.headers:
+            self.delete(self.api_path("logout"), name="logout")
+            del self.headers["Authorization"]
+
+    def request(self, method, url, **kwargs):
+        """ Send a request, logging in again first if the access token expired """
+        if self.token_expires_at is not None and time.monotonic() >= self.token_expires_at:
+            self.login(*self._credentials)
+        return super(LookerApiClient, self).request(method, url, **kwargs)
+
+    def run_query(self, query_id, result_format="json", name=None, cache=True,
+                  catch_response=False, **params):
+        """ Run a saved query by its id """
+        params["cache"] = str(cache).lower()
+        return self.get(
+            self.api_path("queries/{}/run/{}".format(query_id, result_format)),
+            params=params,
+            name=name or "query {}".format(query_id),
+            catch_response=catch_response
+        )
+
+    def run_inline_query(self, query, result_format="json", name=None, cache=True,
+                         catch_response=False, **params):
+        """ Run a query described by a dict (model, view, fields, filters...) """
+        params["cache"] = str(cache).lower()
+        return self.post(
+            self.api_path("queries/run/{}".format(result_format)),
+            params=params,
+            data=json.dumps(query),
+            headers={"Content-Type": "application/json"},
+            name=name or "inline query {}.{}".format(query.get("model"), query.get("view")),
+            catch_response=catch_response
+        )
+
+    def query_for_slug(self, slug):
+        """ Resolve a query slug (the qid in explore URLs) to its query """
+        response = self.get(self.api_path("queries/slug/{}".format(slug)), name="query slug")
+        response.raise_for_status()
+        return response.json()
+
+    def dashboard_tiles(self, dashboard_id):
+        """
+        Return the tiles of a dashboard that run a query, as a list of
+        (title, query_id) tuples. Results are cached per session since a
+        dashboard's tiles don't change during a test.
+        """
+        if dashboard_id not in self.tile_cache:
+            response = self.get(
+                self.api_path("dashboards/{}/dashboard_elements".format(dashboard_id)),
+                params={"fields": TILE_FIELDS},
+                name="dashboard elements"
+            )
+            response.raise_for_status()
+            tiles = []
+            for element in response.json():
+                query_id = (
+                    element.get("query_id")
+                    or (element.get("look") or {}).get("query_id")
+                    or (element.get("result_maker") or {}).get("query_id")
+                )
+                if query_id:
+                    tiles.append((element.get("title") or "tile {}".format(element["id"]), query_id))
+            self.tile_cache[dashboard_id] = tiles
+        return self.tile_cache[dashboard_id]
+
+    def run_dashboard(self, dashboard_id, result_format="json", cache=True):
+        """
+        Run the queries behind every tile of a dashboard concurrently, the
+        way the dashboard itself would. Each tile is reported separately and
+        the dashboard as a whole is reported once all tiles are done.
+        """
+        tiles = self.dashboard_tiles(dashboard_id)
+        name = "dashboard {}".format(dashboard_id)
+
+        start_time = start_timer()
+        group = Group()
+        runs = [
+            group.spawn(
+                self.run_query, query_id, result_format,
+                name="{} - {}".format(name, title), cache=cache
+            )
+            for title, query_id in tiles
+        ]
+        group.join()
+
+        failed = [run for run in runs if run.exception is not None or not run.value.ok]
+        exception = None
+        if failed:
+            exception = LocustError("{} of {} tiles failed".format(len(failed), len(runs)))
+        fire_timed_event("Dashboard", name, start_time, exception)
+        return [run.value for run in runs]
+
+    def run_plan(self, plan, inline=False, validate_rows=False, cache=True):
+        """
+        Replay a dashboard captured with `nfo capture`, see
+        realbrowserlocusts.replay.replay
+        """
+        return replay(self, plan, inline=inline, validate_rows=validate_rows, cache=cache)
+
+    def render_dashboard(self, dashboard_id, result_format="pdf", width=1200, height=600,
+                         poll_interval=1, timeout=300):
+        """
+        Create a dashboard render task, wait for it to finish and download
+        the result. The full round trip is reported as one request.
+        """
+        name = "render dashboard {}".format(dashboard_id)
+        start_time = start_timer()
+        try:
+            response = self.post(
+                self.api_path("render_tasks/dashboards/{}/{}".format(dashboard_id, result_format)),
+                params={"width": width, "height": height},
+                data=json.dumps({"dashboard_style": "tiled"}),
+                headers={"Content-Type": "application/json"},
+                name="create render task"
+            )
+            response.raise_for_status()
+            task_id = response.json()["id"]
+
+            while True:
+                if elapsed_ms(start_time) > timeout * 1000:
+                    raise LocustError("Render task {} timed out".format(task_id))
+                response = self.get(self.api_path("render_tasks/{}".format(task_id)), name="render task status")
+                response.raise_for_status()
+                status = response.json()["status"]
+                if status == "success":
+                    break
+                if status == "failure":
+                    raise LocustError("Render task {} failed".format(task_id))
+                time.sleep(poll_interval)
+
+            result = self.get(self.api_path("render_tasks/{}/results".format(task_id)), name="render task results")
+            result.raise_for_status()
+        except Exception as render_exception:
+            fire_timed_event("Render", name, start_time, render_exception)
+            raise
+        fire_timed_event("Render", name, start_time)
+        return result
+
+
+class LookerApiUser(Locust):
+    """
+    A Locust that exercises Looker through the API instead of a browser.
+    Users log in with the API3 credentials from the CLIENT_ID and
+    CLIENT_SECRET environment variables (populated from the api-creds
+    secret) and share a keep-alive connection pool with every other user in
+    the worker.
+
+    The API is reached at api_url or the LOOKER_API_URL environment
+    variable. Instances that serve the API on the same host and port as the
+    web UI can set api_url_from_host instead to use the Looker host from
+    the HOST environment variable.
+    """
+    client = None
+    api_url = None
+    api_url_from_host = False
+    api_version = "3.1"
+    pool_maxsize = 100
+
+    _adapter = None
+
+    def __init__(self):
+        super(LookerApiUser, self).__init__()
+        # the API is often served on its own port (e.g. 19999), so the web
+        # host is only used when asked for. --host is set to a placeholder by
+        # the container, hence HOST from the website-host secret
+        base_url = self.api_url or os_getenv("LOOKER_API_URL")
+        if not base_url and self.api_url_from_host:
+            base_url = os_getenv("HOST")
+        if not base_url:
+            raise LocustError("You must specify the Looker API url, either through the api_url "
+                              "attribute or the LOOKER_API_URL environment variable")
+        self.client = LookerApiClient(base_url.rstrip("/"), self.api_version, self._shared_adapter())
+
+    @classmethod
+    def _shared_adapter(cls):
+        if LookerApiUser._adapter is None:
+            LookerApiUser._adapter = HTTPAdapter(pool_connections=10, pool_maxsize=cls.pool_maxsize)
+        return LookerApiUser._adapter
+
+    def run(self, runner=None):
+        client_id = os_getenv("CLIENT_ID")
+        client_secret = os_getenv("CLIENT_SECRET")
+        if not client_id or not client_secret:
+            raise LocustError("CLIENT_ID and CLIENT_SECRET must be set to use the Looker API")
+        self.client.login(client_id, client_secret)
+        try:
+            super(LookerApiUser, self).run(runner)
+        finally:
+            self.client.logout()
@@ -0,0 +1,141 @@
+# pylint:disable=too-few-public-methods
+""" Size and balance an autoscaled set of workers from the master """
+import logging
+import math
+import os
+import gevent
+from flask import Response
+from locust import events, runners, web
+from realbrowserlocusts.saturation import WORKER_REPORTS, prune_reports
+
+_LOGGER = logging.getLogger(__name__)
+
+# runner states in which users are (being) spread over the workers
+ACTIVE_STATES = ('hatching', 'running')
+
+
+def autoscaling_enabled():
+    """ True if the master runs with an autoscaled set of workers (LOCUST_AUTOSCALE) """
+    return os.getenv('LOCUST_AUTOSCALE', 'false').lower() == 'true'
+
+
+def upcoming_users(runner):
+    """
+    The number of users the master will be running once the next step of a
+    step load test starts, or the number of users it was asked to run
+    otherwise.
+
+    :param runner: the master locust runner
+    :return users: the number of users to size the workers for
+    """
+    users = getattr(runner, 'target_user_count', None) or getattr(runner, 'user_count', 0) or 0
+    step_users = getattr(runner, 'step_clients_growth', None)
+    total_users = getattr(runner, 'total_clients', None)
+    stepping = getattr(runner, 'stepload_greenlet', None)
+    if step_users and total_users and stepping is not None and not stepping.dead:
+        users = min(users + int(step_users), int(total_users))
+    return users
+
+
+def target_workers(runner, users_per_worker, reports):
+    """
+    How many workers the test needs: enough for the users of the next step
+    at users_per_worker each, plus one for every worker that is currently
+    saturated (see realbrowserlocusts.saturation).
+
+    :param runner: the master locust runner
+    :param users_per_worker: how many users a worker can run without saturating
+    :param reports: the latest saturation report of every worker
+    :return workers: the target number of workers, None if it can't be worked out
+    """
+    if not users_per_worker:
+        return None
+    workers = math.ceil(upcoming_users(runner) / users_per_worker)
+    saturated = sum(1 for report in reports.values() if report.get('saturated'))
+    return max(workers + saturated, 1)
+
+
+class Rebalancer(object):
+    """
+    Keeps users spread over the connected workers when workers leave. Locust
+    hands the master's users out again when a worker joins a running test,
+    but the users of a worker that quits or stops sending heartbeats are
+    simply lost. Whenever a worker leaves during a test the master's target
+    user count is handed out again over the workers that are left.
+    """
+
+    def __init__(self):
+        self.workers = set()
+
+    def check(self, runner):
+        """
+        Compare the connected workers with the ones seen last and rebalance
+        the running test if any of them left
+
+        :param runner: the master locust runner
+        :return rebalanced: True if users were handed out again
+        """
+        workers = set(client_id for client_id, client in getattr(runner, 'clients', {}).items()
+                      if client.state != runners.STATE_MISSING)
+        left = self.workers - workers
+        self.workers = workers
+        if not left or getattr(runner, 'state', None) not in ACTIVE_STATES:
+            return False
+        if not workers or not getattr(runner, 'target_user_count', None):
+            return False
+
+        _LOGGER.info('%s workers left, rebalancing %s users over %s workers',
+                     len(left), runner.target_user_count, len(workers))
+        gevent.spawn(runner.start_hatching, runner.target_user_count, runner.hatch_rate)
+        return True
+
+
+_REBALANCER = Rebalancer()
+
+
+def _on_slave_report(client_id, data):  # pylint:disable=unused-argument
+    if autoscaling_enabled() and runners.locust_runner is not None:
+        _REBALANCER.check(runners.locust_runner)
+
+
+def render_metrics(runner, users_per_worker, reports):
+    """
+    Render the worker targets in the Prometheus text exposition format
+
+    :param runner: the master locust runner, None before a test was started
+    :param users_per_worker: how many users a worker can run without saturating
+    :param reports: the latest saturation report of every worker
+    :return text: the metrics page
+    """
+    lines = []
+    if runner is not None:
+        lines.extend([
+            '# HELP locust_connected_workers Workers connected to the master',
+            '# TYPE locust_connected_workers gauge',
+            'locust_connected_workers {}'.format(float(len(getattr(runner, 'clients', {})))),
+            '# HELP locust_upcoming_users Users the master will run once the next step starts',
+            '# TYPE locust_upcoming_users gauge',
+            'locust_upcoming_users {}'.format(float(upcoming_users(runner)))
+        ])
+        workers = target_workers(runner, users_per_worker, reports)
+        if workers is not None:
+            lines.extend([
+                '# HELP locust_target_workers Workers needed for the next step without saturating',
+                '# TYPE locust_target_workers gauge',
+                'locust_target_workers {}'.format(float(workers))
+            ])
+    return '\n'.join(lines) + '\n'
+
+
+@web.app.route('/autoscale/metrics')
+def autoscale_metrics():
+    """ Worker targets for the worker autoscaler, served by the master """
+    users_per_worker = float(os.getenv('LOCUST_USERS_PER_WORKER') or 0)
+    runner = runners.locust_runner
+    return Response(
+        render_metrics(runner, users_per_worker, prune_reports(runner, WORKER_REPORTS)),
+        mimetype='text/plain; version=0.0.4'
+    )
+
+
+events.slave_report += _on_slave_report
@@ -0,0 +1,208 @@
+# pylint:disable=too-few-public-methods
+""" Weighted content mixes loaded from CSV or YAML files """
+import csv
+import logging
+import random
+from urllib.parse import quote, urlencode
+import yaml
+from selenium.common.exceptions import TimeoutException
+from locust import TaskSet, task
+from locust.exception import LocustError
+
+_LOGGER = logging.getLogger(__name__)
+
+# Separates the filter variants of a content item in CSV files
+FILTER_VARIANT_SEPARATOR = '|'
+
+
+class AliasSampler(object):
+    """
+    Picks an index with probability proportional to its weight in constant
+    time, using Vose's alias method. Building the tables is linear in the
+    number of weights and only happens once.
+    """
+
+    def __init__(self, weights, seed=None):
+        count = len(weights)
+        total = float(sum(weights))
+        if not count or total <= 0:
+            raise LocustError('Cannot sample from an empty set of weights')
+
+        scaled = [weight * count / total for weight in weights]
+        self._probability = [1.0] * count
+        self._alias = list(range(count))
+        self._random = random.Random(seed)
+
+        small = [index for index, weight in enumerate(scaled) if weight < 1.0]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # whatever is left has a probability of 1 up to rounding errors
+
+    def __len__(self):
+        return len(self._probability)
+
+    def sample(self):
+        """ Return a random index, weighted """
+        index = int(self._random.random() * len(self._probability))
+        if self._random.random() < self._probability[index]:
+            return index
+        return self._alias[index]
+
+
+class ContentItem(object):
+    """
+    A piece of Looker content in a mix: a dashboard, look or explore along
+    with the filter variants it should be opened with.
+    """
+
+    def __init__(self, content_id, stem='dashboards', weight=1.0, group='Content',
+                 name=None, filters=None):
+        self.content_id = str(content_id)
+        self.stem = stem
+        self.weight = float(weight)
+        self.group = group
+        self.name = name or '{} {}'.format(stem.split('-')[0].rstrip('s'), content_id)
+        self.filters = filters or [{}]
+
+    def path(self, variant=0):
+        """ URL path of the item opened with one of its filter variants """
+        path = '/{}/{}'.format(self.stem, self.content_id)
+        query = urlencode(self.filters[variant], quote_via=quote)
+        if query:
+            path = '{}?{}'.format(path, query)
+        return path
+
+
+def parse_filter_variant(variant):
+    """
+    Turn a filter variant into a dict. Variants are either dicts already or
+    query strings like Date=90 days&State=Texas.
+    """
+    if isinstance(variant, dict):
+        return {str(key): str(value) for key, value in variant.items()}
+    filters = {}
+    for pair in str(variant).split('&'):
+        if not pair.strip():
+            continue
+        if '=' not in pair:
+            raise LocustError('Filters must be given as name=value, got {}'.format(pair))
+        key, value = pair.split('=', 1)
+        filters[key.strip()] = value.strip()
+    return filters
+
+
+def content_item(entry):
+    """ Build a ContentItem from a CSV row or YAML entry """
+    if not entry.get('id'):
+        raise LocustError('Content mix entries need an id: {}'.format(entry))
+    variants = entry.get('filters') or []
+    if isinstance(variants, str):
+        variants = variants.split(FILTER_VARIANT_SEPARATOR)
+    elif isinstance(variants, dict):
+        variants = [variants]
+    filters = [parse_filter_variant(variant) for variant in variants] or None
+    try:
+        weight = float(entry.get('weight') or 1)
+    except ValueError:
+        raise LocustError('Invalid weight for content {}: {}'.format(entry['id'], entry['weight']))
+    if weight < 0:
+        raise LocustError('Negative weight for content {}'.format(entry['id']))
+    return ContentItem(
+        entry['id'],
+        stem=entry.get('stem') or 'dashboards',
+        weight=weight,
+        group=entry.get('group') or 'Content',
+        name=entry.get('name'),
+        filters=filters
+    )
+
+
+class ContentMix(object):
+    """
+    A weighted mix of content to load. Every filter variant of an item is
+    equally likely and shares the item's weight. The sampler is built once,
+    so picking content costs the same whatever the size of the mix.
+    """
+
+    def __init__(self, items, seed=None):
+        self.items = [item for item in items if item.weight > 0]
+        self._choices = []
+        weights = []
+        for item in self.items:
+            for variant in range(len(item.filters)):
+                self._choices.append((item, variant))
+                weights.append(item.weight / len(item.filters))
+        if not self._choices:
+            raise LocustError('The content mix is empty')
+        self._sampler = AliasSampler(weights, seed)
+
+    @classmethod
+    def load(cls, path, seed=None):
+        """
+        Load a content mix from a CSV file (with a header row) or a YAML
+        file holding a list of entries. Entries have an id and optionally a
+        stem, weight, group, name and filters. In CSV files filter variants
+        are query strings separated by |. Load mixes at module level in the
+        test script rather than in a task.
+        """
+        path = str(path)
+        with open(path) as mix_file:
+            if path.endswith(('.yaml', '.yml')):
+                entries = yaml.safe_load(mix_file) or []
+                if isinstance(entries, dict):
+                    entries = entries.get('content') or []
+            elif path.endswith('.csv'):
+                entries = list(csv.DictReader(mix_file))
+            else:
+                raise LocustError('Content mixes must be .csv or .yaml files, got {}'.format(path))
+        return cls([content_item(entry) for entry in entries], seed)
+
+    def __len__(self):
+        return len(self.items)
+
+    def choice(self):
+        """ Return a random (item, filter variant) pair, weighted """
+        return self._choices[self._sampler.sample()]
+
+
+class ContentMixTaskSet(TaskSet):
+    """
+    A TaskSet that opens random content from content_mix on every task
+    run, reporting each item under its group and name. Set site to the
+    Looker instance and content_mix to a loaded ContentMix. Content is
+    opened through /embed unless path_prefix is changed.
+    """
+    content_mix = None
+    site = None
+    path_prefix = '/embed'
+
+    def __init__(self, parent):
+        super(ContentMixTaskSet, self).__init__(parent)
+        if self.content_mix is None or self.site is None:
+            raise LocustError('You must set content_mix and site on {}'.format(type(self).__name__))
+
+    def open(self, url):
+        """
+        Open a piece of content and wait for Looker to report it rendered.
+        Override this to interact with the content differently.
+        """
+        try:
+            self.client.get(url)
+            self.client.wait_for_render()
+        except TimeoutException:
+            _LOGGER.warning('Timed out waiting for %s to render', url)
+
+    @task
+    def open_content(self):
+        """ Open a random piece of content from the mix """
+        item, variant = self.content_mix.choice()
+        url = '{}{}{}'.format(self.site.rstrip('/'), self.path_prefix, item.path(variant))
+        self.client.timed_event_for_locust(item.group, item.name, self.open, url)
@@ -0,0 +1,249 @@
+# pylint:disable=too-few-public-methods
+""" Many isolated Locust users sharing a single Chrome process """
+import logging
+import gevent
+from gevent.lock import BoundedSemaphore, RLock, Semaphore
+from selenium.webdriver.remote.command import Command
+from locust.exception import LocustError
+
+_LOGGER = logging.getLogger(__name__)
+
+_GROUPS = {}
+_GROUPS_LOCK = Semaphore()
+
+
+class SharedBrowser(object):
+    """
+    A single Chrome web driver hosting up to max_contexts browser contexts.
+
+    Every browser context is an incognito-like profile with its own cookies,
+    storage and cache, opened in its own tab. A WebDriver session can only
+    talk to one tab at a time, so every command sent to the driver is
+    serialized and the driver is switched to the tab owned by the calling
+    greenlet before the command runs. This also covers commands sent by
+    WebElements, which always go through the driver's execute method.
+    """
+
+    def __init__(self, driver, max_contexts, on_close_context=None):
+        self.driver = driver
+        self.max_contexts = max_contexts
+        self.on_close_context = on_close_context
+        self.contexts = {}
+        self._lock = RLock()
+        self._owners = {}
+        self._current_handle = None
+        self._raw_execute = driver.execute
+        driver.execute = self._execute
+
+    def _execute(self, driver_command, params=None):
+        with self._lock:
+            owner = gevent.getcurrent()
+            handle = self._owners.get(owner)
+            if driver_command == Command.SWITCH_TO_WINDOW:
+                # explicit switches (e.g. to a popup) move the owner along
+                response = self._raw_execute(driver_command, params)
+                self._current_handle = params.get('handle') or params.get('name')
+                if handle is not None:
+                    self._owners[owner] = self._current_handle
+                return response
+            if handle is not None and handle != self._current_handle:
+                self._raw_execute(Command.SWITCH_TO_WINDOW, {'handle': handle, 'name': handle})
+                self._current_handle = handle
+            return self._raw_execute(driver_command, params)
+
+    @property
+    def free_slots(self):
+        """ Number of contexts that can still be opened in this browser """
+        return self.max_contexts - len(self.contexts)
+
+    def open_context(self):
+        """
+        Create a new browser context with a blank tab.
+
+        Returns:
+            BrowserContextLease: the lease for the new context
+
+        Raises:
+            LocustError: if the browser already hosts max_contexts contexts
+        """
+        with self._lock:
+            if not self.free_slots:
+                raise LocustError("Shared browser is full ({} contexts)".format(self.max_contexts))
+            handles_before = set(self.driver.window_handles)
+            context_id = self.driver.execute_cdp_cmd(
+                'Target.createBrowserContext', {}
+            )['browserContextId']
+            target_id = self.driver.execute_cdp_cmd(
+                'Target.createTarget',
+                {'url': 'about:blank', 'browserContextId': context_id}
+            )['targetId']
+
+            # chromedriver uses target ids as window handles, but fall back
+            # to looking for the new handle in case that ever changes
+            handle = target_id
+            handles_after = set(self.driver.window_handles)
+            if handle not in handles_after:
+                handle = (handles_after - handles_before).pop()
+
+            lease = BrowserContextLease(self, context_id, handle)
+            self.contexts[context_id] = lease
+            return lease
+
+    def bind(self, lease, greenlet=None):
+        """ Route the driver commands of greenlet to the lease's tab """
+        with self._lock:
+            self._owners[greenlet or gevent.getcurrent()] = lease.handle
+
+    def close_context(self, lease):
+        """ Dispose of a browser context along with all of its tabs """
+        with self._lock:
+            for owner, handle in list(self._owners.items()):
+                if handle == lease.handle:
+                    del self._owners[owner]
+            opened = self.contexts.pop(lease.context_id, None) is not None
+            try:
+                self.driver.execute_cdp_cmd(
+                    'Target.disposeBrowserContext',
+                    {'browserContextId': lease.context_id}
+                )
+            except Exception as exc:  # pylint:disable=broad-except
+                _LOGGER.warning('Could not dispose browser context: %s', exc)
+            if self._current_handle == lease.handle:
+                self._current_handle = None
+        if opened and self.on_close_context is not None:
+            self.on_close_context()
+
+    def quit(self):
+        """ Quit the underlying browser """
+        self.driver.quit()
+
+
+class BrowserContextLease(object):
+    """
+    A browser context inside a SharedBrowser, on loan to a single Locust
+    user. The user's greenlet has to be bound to the lease before it drives
+    the browser; releasing the lease disposes of the context.
+    """
+
+    def __init__(self, browser, context_id, handle):
+        self.browser = browser
+        self.context_id = context_id
+        self.handle = handle
+        self.released = False
+
+    @property
+    def driver(self):
+        """ The shared web driver """
+        return self.browser.driver
+
+    def bind(self):
+        """ Route the current greenlet's driver commands to this context """
+        self.browser.bind(self)
+
+    def record_page_load(self):
+        """ Contexts are disposed of after use, so page loads aren't tracked """
+
+    def release(self):
+        """ Dispose of the browser context """
+        if not self.released:
+            self.released = True
+            self.browser.close_context(self)
+
+
+class SharedBrowserGroup(object):
+    """
+    The shared browsers of a worker process. New users get a context in the
+    first browser with a free slot and another browser is started once all
+    of them are full, up to max_browsers browsers. Once every browser is
+    full new users wait for a context to be released.
+    """
+
+    def __init__(self, driver_factory, contexts_per_browser, max_browsers=None,
+                 acquire_timeout=None):
+        if contexts_per_browser < 1:
+            raise LocustError("A shared browser needs at least 1 context")
+        if max_browsers is not None and max_browsers < 1:
+            raise LocustError("A shared browser group needs at least 1 browser")
+        self.driver_factory = driver_factory
+        self.contexts_per_browser = contexts_per_browser
+        self.max_browsers = max_browsers
+        self.acquire_timeout = acquire_timeout
+        self.browsers = []
+        self._lock = Semaphore()
+        self._slots = BoundedSemaphore(max_browsers * contexts_per_browser) if max_browsers else None
+
+    def acquire(self, timeout=None):
+        """
+        Lease a browser context, starting a new browser if needed.
+
+        Args:
+            timeout (float): seconds to wait for a context once max_browsers
+                browsers are full, defaults to the group's acquire_timeout
+                (wait forever if None)
+
+        Returns:
+            BrowserContextLease: the lease for the new context
+
+        Raises:
+            LocustError: if no context became available in time
+        """
+        if self._slots is not None:
+            if timeout is None:
+                timeout = self.acquire_timeout
+            if not self._slots.acquire(timeout=timeout):
+                raise LocustError(
+                    "No browser context available after {} seconds, all {} shared browsers "
+                    "are full".format(timeout, self.max_browsers)
+                )
+        try:
+            with self._lock:
+                for browser in self.browsers:
+                    if browser.free_slots:
+                        return browser.open_context()
+                browser = SharedBrowser(
+                    self.driver_factory(), self.contexts_per_browser, on_close_context=self._release_slot
+                )
+                self.browsers.append(browser)
+                return browser.open_context()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def close(self):
+        """ Quit every shared browser """
+        with self._lock:
+            for browser in self.browsers:
+                try:
+                    browser.quit()
+                except Exception as exc:  # pylint:disable=broad-except
+                    _LOGGER.warning('Error quitting shared browser: %s', exc)
+            self.browsers = []
+
+
+def get_group(key, driver_factory, contexts_per_browser, max_browsers=None,
+              acquire_timeout=None):
+    """
+    Return the SharedBrowserGroup registered under key, creating it on first
+    use. There is one group per Locust class in each worker process.
+    """
+    with _GROUPS_LOCK:
+        if key not in _GROUPS:
+            _GROUPS[key] = SharedBrowserGroup(
+                driver_factory,
+                contexts_per_browser,
+                max_browsers=max_browsers,
+                acquire_timeout=acquire_timeout
+            )
+        return _GROUPS[key]
+
+
+def close_groups():
+    """ Quit the browsers of every group, used when the worker shuts down """
+    with _GROUPS_LOCK:
+        for group in _GROUPS.values():
+            group.close()
+        _GROUPS.clear()
@@ -1,9 +1,215 @@
 # pylint:disable=too-few-public-methods
 """ Core Selenium wrapping functionality """
+import logging
+import os
+import re
 import time
+import gevent
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.support.ui import WebDriverWait
 from locust import events
 from locust.exception import StopLocust
+from realbrowserlocusts.saturation import get_monitor
+
+_LOGGER = logging.getLogger(__name__)
+
+# Name of the performance mark placed when Looker reports the page rendered
+RENDERED_MARK = 'rendered'
+
+# Requests that return the results of a tile (dashboard element) or query
+# and carry its id, captured by the group. Query manager requests (task
+# creation and polling) are left out as their task ids change every load
+QUERY_RESOURCE_PATTERN = r'/api/[^/]+/(?:dashboard_elements|queries)/([^/?]+)/run\b'
+
+# Resolves once Looker has rendered the page, marks the moment and returns it
+AWAIT_RENDER_SCRIPT = """
+var observation = arguments[0];
+var done = arguments[arguments.length - 1];
+if (typeof window.awaitPerformanceObservation !== 'function') {
+    done({error: 'window.awaitPerformanceObservation is not available on this page'});
+    return;
+}
+window.awaitPerformanceObservation(observation).then(function() {
+    performance.mark(observation);
+    done({time: performance.now()});
+}, function(error) {
+    done({error: String(error)});
+});
+"""
+
+# Non blocking variant for shared browser sessions, polled with RENDERED_POLL_SCRIPT
+WATCH_RENDER_SCRIPT = """
+var observation = arguments[0];
+window.__nfoRendered = null;
+window.awaitPerformanceObservation(observation).then(function() {
+    performance.mark(observation);
+    window.__nfoRendered = performance.now();
+});
+"""
+
+RENDERED_POLL_SCRIPT = "return window.__nfoRendered;"
+
+PAGE_TIMINGS_SCRIPT = """
+var pattern = new RegExp(arguments[0]);
+var navigation = performance.getEntriesByType('navigation')[0];
+var marks = performance.getEntriesByType('mark').map(function(mark) {
+    return {name: mark.name, time: mark.startTime};
+});
+var queries = performance.getEntriesByType('resource').filter(function(resource) {
+    return pattern.test(resource.name);
+}).sort(function(a, b) {
+    return a.startTime - b.startTime;
+}).map(function(resource) {
+    return {url: resource.name, end: resource.responseEnd, duration: resource.duration};
+});
+return {
+    navigation: navigation ? navigation.domContentLoadedEventEnd : null,
+    marks: marks,
+    queries: queries
+};
+"""
+
+
+def query_id(url, pattern=QUERY_RESOURCE_PATTERN):
+    """
+    Name the tile a query result request was made for after the dashboard
+    element or query id captured from its url by pattern, so a tile keeps
+    its name whatever order the dashboard's tiles are requested in.
+    """
+    return re.search(pattern, url).group(1)
+
+
+class EventBuffer(object):
+    """
+    Collects request events on the user greenlets and hands them to locust's
+    listeners in batches from a background greenlet, so that reporting a
+    request costs a list append on the hot path. Buffering is local to the
+    worker: flushed events reach the master with the worker's regular stats
+    reports, like any other event. Each event keeps the wall clock time its
+    request started at, taken when it was queued, so listeners that
+    timestamp samples aren't thrown off by the flush delay.
+    """
+
+    def __init__(self, capacity, interval=1.0):
+        self.capacity = capacity
+        self.interval = interval
+        self._events = []
+        self._flusher = gevent.spawn(self._flush_periodically)
+
+    def add(self, request_type, name, response_time, response_length, exception=None, started_at=None):
+        """ Queue an event, flushing right away once the buffer is full """
+        if started_at is None:
+            started_at = time.time() - response_time / 1000
+        self._events.append((request_type, name, response_time, response_length, exception, started_at))
+        if len(self._events) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        """ Fire every queued event """
+        pending, self._events = self._events, []
+        for request_type, name, response_time, response_length, exception, started_at in pending:
+            _fire_now(request_type, name, response_time, response_length, exception, started_at)
+
+    def _flush_periodically(self):
+        while True:
+            gevent.sleep(self.interval)
+            self.flush()
+
+    def close(self):
+        """ Stop the background flush and fire whatever is left """
+        self._flusher.kill()
+        self.flush()
+
+
+_EVENT_BUFFER = None
+
+
+def _fire_now(request_type, name, response_time, response_length, exception, started_at=None):
+    # started_at (unix seconds) is passed along for listeners that timestamp
+    # samples, locust's own listeners ignore it
+    if started_at is None:
+        started_at = time.time() - response_time / 1000
+    if exception is None:
+        events.request_success.fire(
+            request_type=request_type,
+            name=name,
+            response_time=response_time,
+            response_length=response_length,
+            started_at=started_at
+        )
+    else:
+        events.request_failure.fire(
+            request_type=request_type,
+            name=name,
+            response_time=response_time,
+            response_length=response_length,
+            exception=exception,
+            started_at=started_at
+        )
+
+
+def _close_event_buffer():
+    global _EVENT_BUFFER  # pylint:disable=global-statement
+    if _EVENT_BUFFER is not None:
+        _EVENT_BUFFER.close()
+        _EVENT_BUFFER = None
+
+
+def enable_event_buffer(capacity, interval=1.0):
+    """
+    Buffer the request events reported by this package instead of firing
+    them on the user greenlet. Events are flushed every interval seconds,
+    whenever capacity events are waiting, and when locust quits. Enabled
+    automatically when the LOCUST_EVENT_BUFFER_SIZE environment variable is
+    set (with LOCUST_EVENT_BUFFER_INTERVAL in seconds).
+    """
+    global _EVENT_BUFFER  # pylint:disable=global-statement
+    _close_event_buffer()
+    _EVENT_BUFFER = EventBuffer(capacity, interval)
+
+
+events.quitting += _close_event_buffer
+
+
+def fire_request_event(request_type, name, response_time, response_length=0, exception=None):
+    """
+    Report a request to locust, through the event buffer when it's enabled.
+    While the worker is saturated the request is flagged or dropped according
+    to the saturation mode, see realbrowserlocusts.saturation.
+
+    :param request_type: the type of request
+    :param name: name to be reported to events.request_*.fire
+    :param response_time: response time in (fractional) milliseconds
+    :param response_length: response size in bytes
+    :param exception: the failure, if the request failed
+    """
+    monitor = get_monitor()
+    if monitor is not None:
+        name = monitor.tag(name)
+        if name is None:
+            return
+    if _EVENT_BUFFER is None and int(os.getenv('LOCUST_EVENT_BUFFER_SIZE') or 0):
+        enable_event_buffer(
+            int(os.getenv('LOCUST_EVENT_BUFFER_SIZE')),
+            float(os.getenv('LOCUST_EVENT_BUFFER_INTERVAL') or 1.0)
+        )
+    if _EVENT_BUFFER is not None:
+        _EVENT_BUFFER.add(request_type, name, response_time, response_length, exception)
+    else:
+        _fire_now(request_type, name, response_time, response_length, exception)
+
+
+def start_timer():
+    """ Return a monotonic, nanosecond resolution start time for elapsed_ms """
+    return time.perf_counter_ns()
+
+
+def elapsed_ms(start_time):
+    """
+    Milliseconds (with sub-millisecond precision) since start_time. Uses the
+    monotonic performance counter so timings are immune to wall clock jumps.
+    """
+    return (time.perf_counter_ns() - start_time) / 1e6
 
 
 def wrap_for_locust(request_type, name, func, *args, **kwargs):
@@ -17,48 +223,183 @@ def wrap_for_locust(request_type, name, func, *args, **kwargs):
     :return result: Result of the provided function if doesn't raise exception
     """
     try:
-        start_time = time.time()
+        start_time = start_timer()
         result = func(*args, **kwargs)
     except Exception as event_exception:
-        total_time = int((time.time() - start_time) * 1000)
-        events.request_failure.fire(
-            request_type=request_type,
-            name=name,
-            response_time=total_time,
-            response_length=0,
-            exception=event_exception
-        )
+        fire_request_event(request_type, name, elapsed_ms(start_time),
+                           exception=event_exception)
         raise StopLocust()
     else:
-        total_time = int((time.time() - start_time) * 1000)
-        events.request_success.fire(
-            request_type=request_type,
-            name=name,
-            response_time=total_time,
-            response_length=0
-        )
+        fire_request_event(request_type, name, elapsed_ms(start_time))
         return result
 
 
+def fire_timed_event(request_type, name, start_time, exception=None):
+    """
+    Report a timed group of API calls to locust as a single request
+
+    :param request_type: the type of request
+    :param name: name to be reported to events.request_*.fire
+    :param start_time: start_timer() when the group of calls started
+    :param exception: the failure, if the group of calls failed
+    """
+    fire_request_event(request_type, name, elapsed_ms(start_time), exception=exception)
+
+
 class RealBrowserClient(object):
     """
     Web Driver client with Locust functionality
     """
 
     def __init__(self, driver, wait_time_to_finish, screen_width,
-                 screen_height, set_window=True):
+                 screen_height, set_window=True, lease=None,
+                 page_timings=False):
         self.driver = driver
+        self.lease = lease
+        self.page_timings = page_timings
+        self.query_resource_pattern = QUERY_RESOURCE_PATTERN
+        self.wait_time_to_finish = wait_time_to_finish
         if set_window:
             self.driver.set_window_size(screen_width, screen_height)
+        self.driver.set_script_timeout(wait_time_to_finish)
         self.wait = WebDriverWait(self.driver, wait_time_to_finish)
 
-    @staticmethod
-    def timed_event_for_locust(request_type, message, func, *args, **kwargs):
+    @property
+    def shared_session(self):
+        """ True if the driver is shared with other users (multi-context mode) """
+        return self.lease is not None and hasattr(self.lease, 'bind')
+
+    def get(self, url):
+        """
+        Navigate to url, counting the page load against the lease of a
+        pooled driver so it can be recycled once it has served enough pages
+        """
+        if self.lease is not None:
+            self.lease.record_page_load()
+        return self.driver.get(url)
+
+    def close(self):
+        """
+        Close the current window. A pooled driver is handed back to its pool
+        instead, so it can be reset and reused by another user, and a shared
+        browser context is disposed of.
+        """
+        if self.lease is not None:
+            self.lease.release()
+        else:
+            self.driver.close()
+
+    def bind(self):
+        """
+        Attach the calling greenlet to a context in a shared browser so its
+        commands go to the right tab. Does nothing for other drivers.
+        """
+        if self.lease is not None and hasattr(self.lease, 'bind'):
+            self.lease.bind()
+
+    def release(self):
+        """
+        Give a pooled driver or shared browser context back to its pool. Does nothing for a driver
+        that is owned by this client.
+        """
+        if self.lease is not None:
+            self.lease.release()
+
+    def wait_for_render(self, observation=RENDERED_MARK):
+        """
+        Block until Looker reports the current page as rendered, by waiting
+        on the promise returned by window.awaitPerformanceObservation rather
+        than polling the DOM for a marker element. A performance mark named
+        after the observation is placed when it resolves so page timings can
+        pick it up.
+
+        In multi-context mode an async script would hold the shared WebDriver
+        session (and every other user of the browser) until the page renders,
+        so the promise is watched from the page and polled instead.
+
+        Args:
+            observation (str): the Looker performance observation to wait for
+
+        Returns:
+            float: milliseconds from the start of the navigation until the
+            page rendered
+
+        Raises:
+            TimeoutException: if the page doesn't render in time
+            WebDriverException: if the page can't report its rendering
+        """
+        if self.shared_session:
+            self.driver.execute_script(WATCH_RENDER_SCRIPT, observation)
+            return self.wait.until(
+                lambda driver: driver.execute_script(RENDERED_POLL_SCRIPT),
+                "page did not render"
+            )
+
+        result = self.driver.execute_async_script(AWAIT_RENDER_SCRIPT, observation)
+        if result is None:
+            raise TimeoutException("page did not render")
+        if 'error' in result:
+            raise WebDriverException(result['error'])
+        return result['time']
+
+    def collect_page_timings(self):
+        """
+        Read the browser's Performance API for the page that was loaded
+        last. Times are in milliseconds since the navigation started.
+
+        Returns:
+            dict: navigation (DOM content loaded), first_query (first query
+            results received), rendered (the rendered mark placed by
+            wait_for_render) and queries (the tile or query id and duration of
+            every query result request, in the order they were sent) - each of
+            them None or empty when the page didn't record it
+        """
+        timings = self.driver.execute_script(PAGE_TIMINGS_SCRIPT, self.query_resource_pattern)
+        query_ends = [query['end'] for query in timings['queries']]
+        rendered = [mark['time'] for mark in timings['marks'] if mark['name'] == RENDERED_MARK]
+        return {
+            'navigation': timings['navigation'],
+            'first_query': min(query_ends) if query_ends else None,
+            'rendered': rendered[-1] if rendered else None,
+            'queries': [
+                (query_id(query['url'], self.query_resource_pattern), query['duration'])
+                for query in timings['queries']
+            ]
+        }
+
+    def report_page_timings(self, request_type, message):
+        """
+        Report the phases of the last page load to locust as separate
+        requests named after message: [navigation], [first query],
+        [rendered] and a [query] <id> entry for the result request of every
+        tile.
+        """
+        try:
+            timings = self.collect_page_timings()
+        except Exception as timing_exception:  # pylint:disable=broad-except
+            _LOGGER.warning('Could not collect page timings: %s', timing_exception)
+            return
+
+        phases = [
+            ('navigation', timings['navigation']),
+            ('first query', timings['first_query']),
+            ('rendered', timings['rendered'])
+        ]
+        for phase, phase_time in phases:
+            if phase_time is None:
+                continue
+            fire_request_event(request_type, '{} [{}]'.format(message, phase), phase_time)
+        for tile, duration in timings['queries']:
+            fire_request_event(request_type, '{} [query] {}'.format(message, tile), duration)
+
+    def timed_event_for_locust(self, request_type, message, func, *args, **kwargs):
         """
         Use this method whenever you have a logical sequence of browser steps
         that you would like to time. Group these in a seperate, not @task
         method and call them using this method. These will show up in the
-        locust web interface with timings
+        locust web interface with timings. When page timings are enabled the
+        phases of the page load are reported as well, see
+        report_page_timings.
 
         Args:
             request_type (str): the type of request
@@ -76,7 +417,10 @@ class RealBrowserClient(object):
             catched, logged to locust as a failure and a StopLocust exception
             is raised.
         """
-        return wrap_for_locust(request_type, message, func, *args, **kwargs)
+        result = wrap_for_locust(request_type, message, func, *args, **kwargs)
+        if self.page_timings:
+            self.report_page_timings(request_type, message)
+        return result
 
     def __getattr__(self, attr):
         """
@@ -0,0 +1,248 @@
+# pylint:disable=too-few-public-methods
+""" Pre-generated SSO embed URLs for embed load tests """
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import deque
+from urllib.parse import quote_plus, urlencode, urlparse
+import gevent
+from gevent.event import Event
+from gevent.pool import Pool
+from locust import events
+from locust.exception import LocustError
+
+_LOGGER = logging.getLogger(__name__)
+
+# Looker only accepts an SSO embed URL for a few minutes after it is signed
+SSO_URL_LIFETIME = 300
+
+
+class EmbedUrl(object):
+    """ A signed SSO embed URL and the time (time.time()) it expires at """
+
+    def __init__(self, url, expires_at):
+        self.url = url
+        self.expires_at = expires_at
+
+    def expired(self, margin=0):
+        """ Whether the URL expires within margin seconds """
+        return time.time() + margin >= self.expires_at
+
+
+def sdk_url_generator(sdk, params_factory, lifetime=SSO_URL_LIFETIME):
+    """
+    Build a generator function for EmbedUrlPool that signs URLs through the
+    Looker API with create_sso_embed_url.
+
+    :param sdk: an initialized looker_sdk client
+    :param params_factory: callable returning the EmbedSsoParams of a new session
+    :param lifetime: seconds a signed URL stays valid for
+    :return generate: callable returning a new EmbedUrl
+    """
+    def generate():
+        response = sdk.create_sso_embed_url(params_factory())
+        return EmbedUrl(response.url, time.time() + lifetime)
+    return generate
+
+
+class EmbedSigner(object):
+    """
+    Signs Looker SSO embed URLs locally with the embed secret, the same way
+    the Looker API does, so no API round trip is needed. Everything in the
+    signature but the nonce, time and user id is serialized once per
+    combination of permissions, models, groups, user attributes and access
+    filters and cached, so signing a URL costs a few microseconds.
+    """
+
+    def __init__(self, host, secret=None, session_length=3600, lifetime=SSO_URL_LIFETIME):
+        secret = secret or os.getenv('EMBED_SECRET')
+        if not secret:
+            raise LocustError('You must provide the embed secret, either as an argument or '
+                              'through the EMBED_SECRET environment variable')
+        parsed = urlparse(host if '://' in host else 'https://{}'.format(host))
+        self.host = parsed.netloc
+        self.base_url = '{}://{}'.format(parsed.scheme, parsed.netloc)
+        self.session_length = session_length
+        self.lifetime = lifetime
+        self._hmac = hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha1)
+        self._paths = {}
+        self._user_fields = {}
+
+    def _embed_path(self, target_url):
+        path = self._paths.get(target_url)
+        if path is None:
+            parsed = urlparse(target_url)
+            target = parsed.path
+            if not target.startswith('/embed/'):
+                target = '/embed{}'.format(target)
+            if parsed.query:
+                target = '{}?{}'.format(target, parsed.query)
+            path = '/login/embed/{}'.format(quote_plus(target))
+            self._paths[target_url] = path
+        return path
+
+    def _serialize_user_fields(self, permissions, models, group_ids, external_group_id,
+                               user_attributes, access_filters, first_name, last_name,
+                               force_logout_login):
+        key = json.dumps([permissions, models, group_ids, external_group_id, user_attributes,
+                          access_filters, first_name, last_name, force_logout_login])
+        fields = self._user_fields.get(key)
+        if fields is None:
+            signed = [json.dumps(permissions), json.dumps(models)]
+            params = [('permissions', signed[0]), ('models', signed[1])]
+            for name, value in [('group_ids', group_ids), ('external_group_id', external_group_id),
+                                ('user_attributes', user_attributes)]:
+                if value is not None:
+                    signed.append(json.dumps(value))
+                    params.append((name, signed[-1]))
+            signed.append(json.dumps(access_filters or {}))
+            params.append(('access_filters', signed[-1]))
+            for name, value in [('first_name', first_name), ('last_name', last_name)]:
+                if value is not None:
+                    params.append((name, json.dumps(value)))
+            params.append(('force_logout_login', json.dumps(force_logout_login)))
+            fields = ('\n'.join(signed), urlencode(params))
+            self._user_fields[key] = fields
+        return fields
+
+    def sign(self, target_url, external_user_id, permissions, models, group_ids=None,
+             external_group_id=None, user_attributes=None, access_filters=None,
+             first_name=None, last_name=None, force_logout_login=True, session_length=None):
+        """
+        Sign an SSO embed URL logging a user into target_url. The arguments
+        match the fields of the API's EmbedSsoParams.
+
+        :return url: the signed EmbedUrl
+        """
+        signed_fields, user_params = self._serialize_user_fields(
+            permissions, models, group_ids, external_group_id, user_attributes,
+            access_filters, first_name, last_name, force_logout_login
+        )
+        path = self._embed_path(target_url)
+        now = int(time.time())
+        nonce = json.dumps(base64.urlsafe_b64encode(os.urandom(16)).decode('ascii'))
+        signed_time = json.dumps(now)
+        session = json.dumps(session_length or self.session_length)
+        user_id = json.dumps(str(external_user_id))
+
+        to_sign = '\n'.join([self.host, path, nonce, signed_time, session, user_id, signed_fields])
+        signature = self._hmac.copy()
+        signature.update(to_sign.encode('utf-8'))
+        signature = base64.b64encode(signature.digest()).decode('ascii').strip()
+
+        params = urlencode([('nonce', nonce), ('time', signed_time), ('session_length', session),
+                            ('external_user_id', user_id), ('signature', signature)])
+        url = '{}{}?{}&{}'.format(self.base_url, path, user_params, params)
+        return EmbedUrl(url, now + self.lifetime)
+
+    def generator(self, params_factory):
+        """
+        Build a generator function for EmbedUrlPool that signs URLs locally.
+
+        :param params_factory: callable returning the keyword arguments of sign for a new session
+        :return generate: callable returning a new EmbedUrl
+        """
+        return lambda: self.sign(**params_factory())
+
+
+class EmbedUrlPool(object):
+    """
+    A pool of signed SSO embed URLs, generated ahead of time by a background
+    greenlet so that spawning an embed user doesn't wait on signing (or the
+    Looker API). Every URL can only be used once. URLs that are about to
+    expire are thrown away and the pool is topped up in batches whenever it
+    drops below refill_below.
+
+    Generation starts when the worker starts hatching users, or on the
+    first get. The pool is also an iterator of URLs.
+    """
+
+    def __init__(self, generate, size=100, refill_below=None, batch_size=10,
+                 expiry_margin=30, acquire_timeout=60):
+        if size < 1:
+            raise LocustError('The embed URL pool size must be at least 1')
+        self.generate = generate
+        self.size = size
+        self.refill_below = size if refill_below is None else refill_below
+        self.batch_size = batch_size
+        self.expiry_margin = expiry_margin
+        self.acquire_timeout = acquire_timeout
+        self.generated = 0
+        self.expired = 0
+        self._urls = deque()
+        self._available = Event()
+        self._needed = Event()
+        self._filler = None
+        events.locust_start_hatching += self.start
+        events.quitting += self.close
+
+    def start(self):
+        """ Start generating URLs in the background """
+        if self._filler is None:
+            self._filler = gevent.spawn(self._fill)
+
+    def _prune(self):
+        # urls are generated in order, so the oldest ones expire first
+        while self._urls and self._urls[0].expired(self.expiry_margin):
+            self._urls.popleft()
+            self.expired += 1
+
+    def _fill(self):
+        pool = Pool(self.batch_size)
+        while True:
+            self._prune()
+            missing = self.size - len(self._urls)
+            if missing > 0 and len(self._urls) <= self.refill_below:
+                try:
+                    urls = pool.map(lambda _: self.generate(), range(min(missing, self.batch_size)))
+                except Exception:  # pylint:disable=broad-except
+                    _LOGGER.exception('Failed to generate embed URLs')
+                    gevent.sleep(1)
+                    continue
+                self._urls.extend(urls)
+                self.generated += len(urls)
+                self._available.set()
+                continue
+            self._needed.clear()
+            # wake up when a URL is taken or before the oldest one expires
+            timeout = None
+            if self._urls:
+                timeout = max(self._urls[0].expires_at - self.expiry_margin - time.time(), 0.1)
+            self._needed.wait(timeout)
+
+    def get(self):
+        """
+        Take a URL out of the pool, waiting for one to be generated if the
+        pool is empty.
+
+        :return url: a signed SSO embed URL
+        """
+        self.start()
+        deadline = time.time() + self.acquire_timeout
+        while True:
+            self._prune()
+            if self._urls:
+                url = self._urls.popleft()
+                self._needed.set()
+                return url.url
+            self._available.clear()
+            self._needed.set()
+            remaining = deadline - time.time()
+            if remaining <= 0 or not self._available.wait(remaining):
+                raise LocustError('Timed out waiting for an embed URL')
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.get()
+
+    def close(self):
+        """ Stop generating URLs """
+        if self._filler is not None:
+            self._filler.kill()
+            self._filler = None
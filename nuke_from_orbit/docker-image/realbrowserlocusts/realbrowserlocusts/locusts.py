@@ -2,13 +2,25 @@
 """ Combine Locust with Selenium Web Driver """
 import logging
 from os import getenv as os_getenv
-from locust import Locust
+from locust import Locust, events
 from locust.exception import LocustError
 from selenium import webdriver
 from realbrowserlocusts.core import RealBrowserClient
+from realbrowserlocusts.pool import get_pool, close_pools
+from realbrowserlocusts.contexts import get_group, close_groups
 
 _LOGGER = logging.getLogger(__name__)
 
+events.quitting += close_pools
+events.quitting += close_groups
+
+
+def _getenv_int(name, default):
+    value = os_getenv(name)
+    if value in (None, ''):
+        return default
+    return int(value)
+
 
 class RealBrowserLocust(Locust):
     """
@@ -19,6 +31,29 @@ class RealBrowserLocust(Locust):
     screen_width = None
     screen_height = None
 
+    # Set driver_pool_size to share pre-warmed browsers between the users of
+    # a worker instead of starting a new browser for every user. Pooled
+    # browsers are recycled after driver_max_page_loads navigations or once
+    # they use more than driver_max_rss_mb megabytes of memory.
+    driver_pool_size = None
+    driver_max_page_loads = None
+    driver_max_rss_mb = None
+    driver_pool_timeout = 120
+
+    # Set browser_contexts to run that many users inside each Chrome process,
+    # every user getting its own isolated browser context (cookies, storage
+    # and cache). Takes precedence over driver pooling. max_browsers caps the
+    # Chrome processes of a worker, further users wait for a free context.
+    browser_contexts = None
+    max_browsers = None
+
+    # Set page_timings to report the phases of every timed page load
+    # (navigation, first query, rendered, each query) read from the
+    # browser's Performance API next to the overall timing.
+    page_timings = False
+
+    _client_factory = None
+
     def __init__(self):
         super(RealBrowserLocust, self).__init__()
         if self.screen_width is None:
@@ -28,6 +63,107 @@ class RealBrowserLocust(Locust):
             raise LocustError("You must specify a screen_height "
                               "for the browser")
         self.proxy_server = os_getenv("LOCUST_BROWSER_PROXY", None)
+        self.driver_pool_size = _getenv_int(
+            "LOCUST_DRIVER_POOL_SIZE", self.driver_pool_size)
+        self.driver_max_page_loads = _getenv_int(
+            "LOCUST_DRIVER_MAX_PAGE_LOADS", self.driver_max_page_loads)
+        self.driver_max_rss_mb = _getenv_int(
+            "LOCUST_DRIVER_MAX_RSS_MB", self.driver_max_rss_mb)
+        self.browser_contexts = _getenv_int(
+            "LOCUST_BROWSER_CONTEXTS", self.browser_contexts)
+        self.max_browsers = _getenv_int(
+            "LOCUST_MAX_BROWSERS", self.max_browsers)
+        self.page_timings = os_getenv(
+            "LOCUST_PAGE_TIMINGS", str(self.page_timings)).lower() == "true"
+
+    def create_client(self, driver_factory, set_window=True):
+        """
+        Build the RealBrowserClient for this user. With driver pooling or in
+        multi-context mode the web driver is leased from the worker's pool or
+        shared browsers once the user starts running (see run), so client is
+        None until then. Otherwise a new driver is created by driver_factory.
+        """
+        if self.browser_contexts or self.driver_pool_size:
+            self._client_factory = (driver_factory, set_window)
+            return None
+        return RealBrowserClient(
+            driver_factory(),
+            self.timeout,
+            self.screen_width,
+            self.screen_height,
+            set_window=set_window,
+            page_timings=self.page_timings
+        )
+
+    def lease_client(self, driver_factory, set_window=True):
+        """
+        Build a RealBrowserClient around a driver leased from the worker's
+        driver pool, or around a context in a shared browser in multi-context
+        mode. Waits for a free driver or context for up to
+        driver_pool_timeout seconds.
+        """
+        if self.browser_contexts:
+            group = get_group(
+                type(self),
+                driver_factory,
+                self.browser_contexts,
+                max_browsers=self.max_browsers,
+                acquire_timeout=self.driver_pool_timeout
+            )
+            lease = group.acquire()
+            # resizing would hit whichever tab the shared driver is focused on
+            set_window = False
+        else:
+            pool = get_pool(
+                type(self),
+                driver_factory,
+                self.driver_pool_size,
+                max_page_loads=self.driver_max_page_loads,
+                max_rss_mb=self.driver_max_rss_mb,
+                acquire_timeout=self.driver_pool_timeout
+            )
+            lease = pool.acquire()
+        try:
+            return RealBrowserClient(
+                lease.driver,
+                self.timeout,
+                self.screen_width,
+                self.screen_height,
+                set_window=set_window,
+                lease=lease,
+                page_timings=self.page_timings
+            )
+        except Exception:
+            lease.release()
+            raise
+
+    def run(self, runner=None):
+        # users are created in the hatching greenlet but run in their own, so
+        # pooled drivers and browser contexts are leased here: a user waiting
+        # for one doesn't hold up the users hatched after it
+        if self.client is None and self._client_factory is not None:
+            self.client = self.lease_client(*self._client_factory)
+        if self.client is not None:
+            self.client.bind()
+        try:
+            super(RealBrowserLocust, self).run(runner)
+        finally:
+            # hand pooled drivers and browser contexts back when the user is stopped
+            if self.client is not None:
+                self.client.release()
+
+
+def add_shared_browser_options(options):
+    """
+    Tune Chrome options for hosting many users in one process: tabs that
+    are not focused must not be throttled, and navigation only waits for
+    the DOM so that one user's page load doesn't hold up every other user
+    of the shared WebDriver session.
+    """
+    options.add_argument('--disable-background-timer-throttling')
+    options.add_argument('--disable-backgrounding-occluded-windows')
+    options.add_argument('--disable-renderer-backgrounding')
+    options.set_capability('pageLoadStrategy', 'eager')
 
 
 class ChromeLocust(RealBrowserLocust):
@@ -40,11 +176,10 @@ class ChromeLocust(RealBrowserLocust):
         if self.proxy_server:
             _LOGGER.info('Using proxy: ' + self.proxy_server)
             options.add_argument('proxy-server={}'.format(self.proxy_server))
-        self.client = RealBrowserClient(
-            webdriver.Chrome(chrome_options=options),
-            self.timeout,
-            self.screen_width,
-            self.screen_height
+        if self.browser_contexts:
+            add_shared_browser_options(options)
+        self.client = self.create_client(
+            lambda: webdriver.Chrome(chrome_options=options)
         )
 
 
@@ -65,13 +200,11 @@ class HeadlessChromeLocust(RealBrowserLocust):
         if self.proxy_server:
             _LOGGER.info('Using proxy: ' + self.proxy_server)
             options.add_argument('proxy-server={}'.format(self.proxy_server))
-        driver = webdriver.Chrome(chrome_options=options)
+        if self.browser_contexts:
+            add_shared_browser_options(options)
         _LOGGER.info('Actually trying to run headless Chrome')
-        self.client = RealBrowserClient(
-            driver,
-            self.timeout,
-            self.screen_width,
-            self.screen_height,
+        self.client = self.create_client(
+            lambda: webdriver.Chrome(chrome_options=options),
             set_window=False
         )
 
@@ -0,0 +1,266 @@
+# pylint:disable=too-few-public-methods
+""" Pool of pre-warmed Selenium web drivers shared by the Locusts of a worker """
+import logging
+import os
+import gevent
+from gevent.lock import Semaphore
+from gevent.queue import Queue, Empty
+from locust.exception import LocustError
+
+_LOGGER = logging.getLogger(__name__)
+
+_POOLS = {}
+_POOLS_LOCK = Semaphore()
+
+
+def process_tree_rss(pid):
+    """
+    Sum the resident set size of a process and all of its descendants
+
+    Chrome runs as a tree of processes below chromedriver so the RSS of the
+    driver process alone says nothing about the memory used by the browser.
+    This reads /proc directly, so it only works on Linux (i.e. in the
+    load test containers). Returns None when the information is unavailable.
+
+    :param pid: the root process id, usually the chromedriver service pid
+    :return rss: the combined resident set size in bytes
+    """
+    try:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open('/proc/{}/stat'.format(entry)) as stat_file:
+                    stat = stat_file.read()
+            except (IOError, OSError):
+                continue
+            # the command name may contain spaces, so split after its closing paren
+            ppid = int(stat.rsplit(')', 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+
+        rss = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            pending.extend(children.get(current, []))
+            try:
+                with open('/proc/{}/statm'.format(current)) as statm_file:
+                    resident_pages = int(statm_file.read().split()[1])
+            except (IOError, OSError):
+                continue
+            rss += resident_pages * os.sysconf('SC_PAGE_SIZE')
+        return rss
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def reset_driver(driver):
+    """
+    Return a web driver to a clean state so it can be handed to a new user:
+    every tab but the first is closed, storage and cookies for all domains
+    are cleared and the remaining tab is parked on about:blank.
+
+    :param driver: the web driver to reset
+    """
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+
+    try:
+        driver.execute_script(
+            'window.localStorage.clear(); window.sessionStorage.clear();'
+        )
+    except Exception:  # pylint:disable=broad-except
+        # about:blank and friends have no storage to clear
+        pass
+
+    if hasattr(driver, 'execute_cdp_cmd'):
+        driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+    else:
+        driver.delete_all_cookies()
+
+    driver.get('about:blank')
+
+
+class PooledDriver(object):
+    """
+    A web driver owned by a DriverPool along with its usage counters
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.page_loads = 0
+        self.leases = 0
+
+    @property
+    def rss(self):
+        """ Resident memory of the browser process tree in bytes """
+        service = getattr(self.driver, 'service', None)
+        process = getattr(service, 'process', None)
+        if process is None:
+            return None
+        return process_tree_rss(process.pid)
+
+
+class DriverLease(object):
+    """
+    A pooled web driver on loan to a single Locust user. Releasing the lease
+    hands the driver back to the pool, releasing twice is a no-op.
+    """
+
+    def __init__(self, pool, pooled_driver):
+        self.pool = pool
+        self.pooled_driver = pooled_driver
+        self.released = False
+
+    @property
+    def driver(self):
+        """ The leased web driver """
+        return self.pooled_driver.driver
+
+    def record_page_load(self):
+        """ Count a navigation against the driver's recycling budget """
+        self.pooled_driver.page_loads += 1
+
+    def release(self):
+        """ Hand the driver back to the pool """
+        if not self.released:
+            self.released = True
+            self.pool.release(self)
+
+
+class DriverPool(object):
+    """
+    Keeps a fixed number of web drivers per worker process. Drivers are
+    started in the background as soon as the pool is created so that users
+    spawned later do not have to wait for a browser to boot, and they are
+    reused when users stop and new ones are hatched.
+
+    Drivers are reset between leases and replaced once they have served
+    max_page_loads navigations or their process tree grows beyond
+    max_rss_mb megabytes.
+    """
+
+    def __init__(self, driver_factory, size, max_page_loads=None,
+                 max_rss_mb=None, acquire_timeout=None):
+        if size < 1:
+            raise LocustError("A driver pool needs a size of at least 1")
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_page_loads = max_page_loads
+        self.max_rss_mb = max_rss_mb
+        self.acquire_timeout = acquire_timeout
+        self._idle = Queue()
+        self._closed = False
+        # start the browsers one at a time so the worker isn't hit by a spawn storm
+        self._warmer = gevent.spawn(self._start_drivers, size)
+
+    def _start_drivers(self, count):
+        for _ in range(count):
+            if self._closed:
+                return
+            try:
+                self._idle.put(PooledDriver(self.driver_factory()))
+            except Exception as exc:  # pylint:disable=broad-except
+                _LOGGER.error('Failed to start pooled web driver: %s', exc)
+
+    def acquire(self, timeout=None):
+        """
+        Lease an idle driver, waiting for one to become available if every
+        driver is currently in use.
+
+        Args:
+            timeout (float): seconds to wait for a driver, defaults to the
+                pool's acquire_timeout (wait forever if None)
+
+        Returns:
+            DriverLease: the lease holding the driver
+
+        Raises:
+            LocustError: if no driver became available in time
+        """
+        if timeout is None:
+            timeout = self.acquire_timeout
+        try:
+            pooled_driver = self._idle.get(timeout=timeout)
+        except Empty:
+            raise LocustError(
+                "No pooled web driver available after {} seconds, "
+                "is the pool smaller than the number of users?".format(timeout)
+            )
+        pooled_driver.leases += 1
+        return DriverLease(self, pooled_driver)
+
+    def release(self, lease):
+        """
+        Take a driver back from a lease. The driver is reset and returned to
+        the idle queue, or replaced by a fresh one if it is worn out or can
+        no longer be reset.
+        """
+        pooled_driver = lease.pooled_driver
+        if self._closed:
+            self._quit(pooled_driver)
+            return
+
+        if self._worn_out(pooled_driver):
+            self._replace(pooled_driver)
+            return
+
+        try:
+            reset_driver(pooled_driver.driver)
+        except Exception as exc:  # pylint:disable=broad-except
+            _LOGGER.warning('Could not reset pooled web driver, replacing it: %s', exc)
+            self._replace(pooled_driver)
+            return
+        self._idle.put(pooled_driver)
+
+    def _worn_out(self, pooled_driver):
+        if self.max_page_loads and pooled_driver.page_loads >= self.max_page_loads:
+            _LOGGER.info('Recycling web driver after %s page loads', pooled_driver.page_loads)
+            return True
+        if self.max_rss_mb:
+            rss = pooled_driver.rss
+            if rss is not None and rss >= self.max_rss_mb * 1024 * 1024:
+                _LOGGER.info('Recycling web driver using %s MB', rss // (1024 * 1024))
+                return True
+        return False
+
+    def _replace(self, pooled_driver):
+        self._quit(pooled_driver)
+        gevent.spawn(self._start_drivers, 1)
+
+    @staticmethod
+    def _quit(pooled_driver):
+        try:
+            pooled_driver.driver.quit()
+        except Exception as exc:  # pylint:disable=broad-except
+            _LOGGER.warning('Error quitting pooled web driver: %s', exc)
+
+    def close(self):
+        """ Quit every idle driver. Drivers still on lease quit when released. """
+        self._closed = True
+        self._warmer.kill()
+        while not self._idle.empty():
+            self._quit(self._idle.get_nowait())
+
+
+def get_pool(key, driver_factory, size, **kwargs):
+    """
+    Return the DriverPool registered under key, creating it on first use.
+    There is one pool per Locust class in each worker process.
+    """
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = DriverPool(driver_factory, size, **kwargs)
+        return _POOLS[key]
+
+
+def close_pools():
+    """ Quit the drivers of every pool, used when the worker shuts down """
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.close()
+        _POOLS.clear()
@@ -0,0 +1,234 @@
+# pylint:disable=too-few-public-methods
+"""
+Record every request sample of a test to a compact binary log
+
+Workers keep the samples they time and hand them to the master with their
+regular stats reports. The master appends them, tagged with the worker they
+came from, to a log in LOCUST_RESULTS_DIR that is rotated into a new file
+every LOCUST_RESULTS_FILE_MB megabytes. The oldest files are deleted once
+the log grows beyond LOCUST_RESULTS_MAX_MB.
+
+Log files start with MAGIC followed by little endian records, each starting
+with a record type byte:
+
+    STRING_RECORD  uint32 id, uint16 length, utf-8 bytes
+    SAMPLE_RECORD  float64 start time (unix seconds), uint32 group id,
+                   uint32 name id, uint32 worker id, float32 response time
+                   (ms), uint8 success
+
+Strings (groups, names and worker ids) are written once per file before the
+first sample that uses them, so every file can be read on its own.
+"""
+import json
+import logging
+import os
+import struct
+import time
+from collections import deque
+from datetime import datetime
+from flask import Response, abort, send_from_directory
+from locust import events, web
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'NFOLAT01'
+STRING_RECORD = 1
+SAMPLE_RECORD = 2
+STRING_HEADER = struct.Struct('<BIH')
+SAMPLE = struct.Struct('<BdIIIfB')
+FILE_SUFFIX = '.nfolat'
+
+# samples a worker keeps while it can't reach the master, the oldest are dropped beyond that
+MAX_BUFFERED_SAMPLES = 100000
+
+
+class SampleRecorder(object):
+    """
+    Collects the request samples of a worker until they are sent to the master
+    """
+
+    def __init__(self, max_samples=MAX_BUFFERED_SAMPLES):
+        self.samples = deque(maxlen=max_samples)
+        self.dropped = 0
+
+    def record(self, request_type, name, response_time, success, started_at=None):
+        """
+        Keep a sample, timestamped with the time the request started. Events
+        reported by this package carry started_at, taken before they were
+        buffered; for others it's worked out from the time they are recorded.
+        """
+        if len(self.samples) == self.samples.maxlen:
+            self.dropped += 1
+        if started_at is None:
+            started_at = time.time() - response_time / 1000
+        self.samples.append([started_at, request_type, name, response_time, success])
+
+    def drain(self):
+        """ Hand over every sample kept so far """
+        samples = list(self.samples)
+        self.samples.clear()
+        if self.dropped:
+            _LOGGER.warning('Dropped %s samples that could not be sent to the master', self.dropped)
+            self.dropped = 0
+        return samples
+
+
+class LatencyLog(object):
+    """
+    Append only, rotated binary log of request samples, written by the master
+    """
+
+    def __init__(self, directory, max_file_mb=64, max_total_mb=None):
+        self.directory = directory
+        self.max_file_bytes = max_file_mb * 1024 * 1024
+        self.max_total_bytes = max_total_mb * 1024 * 1024 if max_total_mb else None
+        self._file = None
+        self._strings = {}
+        self._sequence = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        self._sequence += 1
+        name = 'samples-{}-{:04d}{}'.format(
+            datetime.utcnow().strftime('%Y%m%dT%H%M%S'), self._sequence, FILE_SUFFIX)
+        self._file = open(os.path.join(self.directory, name), 'wb')
+        self._file.write(MAGIC)
+        self._strings = {}
+
+    def _string_id(self, value):
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = self._strings[value] = len(self._strings)
+            encoded = value.encode('utf-8')[:0xffff]
+            self._file.write(STRING_HEADER.pack(STRING_RECORD, string_id, len(encoded)))
+            self._file.write(encoded)
+        return string_id
+
+    def write(self, worker, samples):
+        """
+        Append the samples of a worker and rotate the log if the current file is full
+
+        :param worker: the id of the worker the samples were timed on
+        :param samples: list of [start, group, name, response time, success]
+        """
+        if self._file is None:
+            self._open()
+        worker_id = self._string_id(worker)
+        for start, group, name, response_time, success in samples:
+            self._file.write(SAMPLE.pack(
+                SAMPLE_RECORD, start, self._string_id(group), self._string_id(name),
+                worker_id, response_time, bool(success)
+            ))
+        self._file.flush()
+        if self._file.tell() >= self.max_file_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """ Close the current file, the next samples start a new one """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._prune()
+
+    def _prune(self):
+        if self.max_total_bytes is None:
+            return
+        files = list_log_files(self.directory)
+        total = sum(size for _, size in files)
+        for name, size in files:
+            if total <= self.max_total_bytes:
+                break
+            _LOGGER.info('Removing %s to keep the latency log within its size limit', name)
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def close(self):
+        """ Close the current file """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def list_log_files(directory):
+    """ The log files in a directory as (name, size) tuples, oldest first """
+    names = sorted(name for name in os.listdir(directory) if name.endswith(FILE_SUFFIX))
+    return [(name, os.path.getsize(os.path.join(directory, name))) for name in names]
+
+
+def _getenv_float(name, default):
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return float(value)
+
+
+_RECORDER = SampleRecorder() if os.getenv('LOCUST_RECORD_SAMPLES', 'false').lower() == 'true' else None
+
+_LOG = None
+
+
+def get_log():
+    """
+    Return the master's latency log, opening it on first use when the
+    LOCUST_RESULTS_DIR environment variable is set. None otherwise.
+    """
+    global _LOG  # pylint:disable=global-statement
+    if _LOG is None and os.getenv('LOCUST_RESULTS_DIR'):
+        _LOG = LatencyLog(
+            os.getenv('LOCUST_RESULTS_DIR'),
+            max_file_mb=_getenv_float('LOCUST_RESULTS_FILE_MB', 64),
+            max_total_mb=_getenv_float('LOCUST_RESULTS_MAX_MB', None)
+        )
+    return _LOG
+
+
+def _on_request_success(request_type, name, response_time, started_at=None, **kwargs):  # pylint:disable=unused-argument
+    _RECORDER.record(request_type, name, response_time, True, started_at)
+
+
+def _on_request_failure(request_type, name, response_time, started_at=None, **kwargs):  # pylint:disable=unused-argument
+    _RECORDER.record(request_type, name, response_time, False, started_at)
+
+
+def _on_report_to_master(client_id, data):  # pylint:disable=unused-argument
+    data['samples'] = _RECORDER.drain()
+
+
+def _on_slave_report(client_id, data):
+    samples = data.get('samples')
+    log = get_log()
+    if samples and log is not None:
+        log.write(client_id, samples)
+
+
+def _close_log():
+    if _LOG is not None:
+        _LOG.close()
+
+
+@web.app.route('/results')
+def results_index():
+    """ The latency log files kept by the master, as a JSON list of names and sizes """
+    log = get_log()
+    files = list_log_files(log.directory) if log is not None else []
+    return Response(
+        json.dumps([{'name': name, 'size': size} for name, size in files]),
+        mimetype='application/json'
+    )
+
+
+@web.app.route('/results/<name>')
+def results_file(name):
+    """ Download a latency log file """
+    log = get_log()
+    if log is None or not name.endswith(FILE_SUFFIX):
+        abort(404)
+    return send_from_directory(log.directory, name, mimetype='application/octet-stream')
+
+
+if _RECORDER is not None:
+    events.request_success += _on_request_success
+    events.request_failure += _on_request_failure
+    events.report_to_master += _on_report_to_master
+events.slave_report += _on_slave_report
+events.quitting += _close_log
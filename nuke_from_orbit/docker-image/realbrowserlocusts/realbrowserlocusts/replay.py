@@ -0,0 +1,99 @@
+# pylint:disable=too-few-public-methods
+""" Replay dashboards captured with `nfo capture` through the Looker API """
+import json
+from gevent.pool import Pool
+from locust.exception import LocustError
+from realbrowserlocusts.core import fire_timed_event, start_timer
+
+PLAN_VERSION = 1
+
+
+class ReplayPlan(object):
+    """
+    The queries behind a dashboard's tiles, as captured by `nfo capture`.
+    Tiles are kept in layout order (row by row) and replayed with up to
+    max_concurrency of them running at once, like a browser would.
+    """
+
+    def __init__(self, dashboard_id, tiles, max_concurrency=6, title=None, filters=None):
+        self.dashboard_id = dashboard_id
+        self.tiles = sorted(tiles, key=lambda tile: (tile.get('group', 0), tile.get('column', 0)))
+        self.max_concurrency = max_concurrency
+        self.title = title
+        self.filters = filters or {}
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a replay plan file. Plans are parsed once, so load them at
+        module level in the test script rather than in a task.
+        """
+        with open(str(path)) as plan_file:
+            plan = json.load(plan_file)
+        if plan.get('version') != PLAN_VERSION:
+            raise LocustError("Unsupported replay plan version {} in {}".format(plan.get('version'), path))
+        return cls(
+            plan['dashboard_id'],
+            plan['tiles'],
+            max_concurrency=plan.get('max_concurrency', 6),
+            title=plan.get('title'),
+            filters=plan.get('filters')
+        )
+
+    @property
+    def name(self):
+        """ Name used to report the dashboard as a whole """
+        return 'dashboard {}'.format(self.dashboard_id)
+
+
+def run_tile(client, tile, dashboard_name, inline=False, validate_rows=False, cache=True):
+    """
+    Run the query of a single tile, by query id unless inline is set (the
+    query body works on any instance, the id only where it was captured).
+    With validate_rows a row count differing from the one captured is
+    reported as a failure.
+    Returns True if the tile succeeded.
+    """
+    name = '{} - {}'.format(dashboard_name, tile['title'])
+    if inline or not tile.get('query_id'):
+        response = client.run_inline_query(tile['query'], name=name, cache=cache, catch_response=True)
+    else:
+        response = client.run_query(tile['query_id'], name=name, cache=cache, catch_response=True)
+
+    # leaving the block reports the tile, as a failure if the status isn't ok
+    success = response.ok
+    with response:
+        if success and validate_rows and 'expected_rows' in tile:
+            try:
+                rows = len(response.json())
+            except ValueError:
+                # an error page or a truncated body, which locust wouldn't report
+                response.failure('Expected {} rows, got a response that isn\'t JSON'.format(tile['expected_rows']))
+                return False
+            if rows != tile['expected_rows']:
+                response.failure('Expected {} rows, got {}'.format(tile['expected_rows'], rows))
+                success = False
+    return success
+
+
+def replay(client, plan, inline=False, validate_rows=False, cache=True):
+    """
+    Replay every tile of a plan through a LookerApiClient with tile level
+    parallelism. Each tile is reported separately and the dashboard as a
+    whole is reported once all of its tiles are done. Returns the number of
+    tiles that failed.
+    """
+    start_time = start_timer()
+    pool = Pool(plan.max_concurrency)
+    runs = [
+        pool.spawn(run_tile, client, tile, plan.name, inline, validate_rows, cache)
+        for tile in plan.tiles
+    ]
+    pool.join()
+
+    failed = len([run for run in runs if not run.value])
+    exception = None
+    if failed:
+        exception = LocustError("{} of {} tiles failed".format(failed, len(runs)))
+    fire_timed_event('Dashboard', plan.name, start_time, exception)
+    return failed
@@ -0,0 +1,370 @@
+# pylint:disable=too-few-public-methods
+""" Detect workers that are too busy to measure Looker accurately """
+import logging
+import os
+import time
+import gevent
+from flask import Response
+from locust import events, runners, web
+from realbrowserlocusts.pool import process_tree_rss
+
+_LOGGER = logging.getLogger(__name__)
+
+# Modes selected with LOCUST_SATURATION_MODE:
+#   monitor - sample the worker and publish the samples
+#   flag    - also report requests timed while saturated as '<name> [saturated]'
+#   exclude - also leave requests timed while saturated out of the stats
+MODES = ('monitor', 'flag', 'exclude')
+
+SATURATED_SUFFIX = ' [saturated]'
+
+# cgroup v2 and v1 locations of the container's cpu accounting
+CPU_STAT_FILES = ('/sys/fs/cgroup/cpu.stat', '/sys/fs/cgroup/cpu/cpu.stat')
+
+
+def read_cpu_times(path='/proc/stat'):
+    """
+    Read the total and steal jiffies of the node's cpus from /proc/stat. Guest
+    time is already counted in user time so it is left out of the total.
+
+    :return times: a tuple of (total, steal), None when unavailable
+    """
+    try:
+        with open(path) as stat_file:
+            fields = stat_file.readline().split()
+    except (IOError, OSError):
+        return None
+    if not fields or fields[0] != 'cpu':
+        return None
+    values = [int(value) for value in fields[1:9]]
+    steal = values[7] if len(values) > 7 else 0
+    return sum(values), steal
+
+
+def read_throttling(paths=CPU_STAT_FILES):
+    """
+    Read how many cpu quota periods the container ran and how many of them
+    it was throttled in from its cgroup. This is what an exhausted cpu limit
+    looks like from inside a pod.
+
+    :return periods: a tuple of (periods, throttled), None when unavailable
+    """
+    for path in paths:
+        try:
+            with open(path) as stat_file:
+                stats = dict(line.split() for line in stat_file if line.strip())
+        except (IOError, OSError, ValueError):
+            continue
+        if 'nr_periods' in stats:
+            return int(stats['nr_periods']), int(stats.get('nr_throttled', 0))
+    return None
+
+
+def browser_rss():
+    """
+    Resident memory of every process started by this worker (the browsers
+    and their drivers), in bytes. None when unavailable.
+    """
+    pid = os.getpid()
+    total = process_tree_rss(pid)
+    own = process_rss(pid)
+    if total is None or own is None:
+        return None
+    return max(total - own, 0)
+
+
+def process_rss(pid):
+    """ Resident memory of a single process in bytes, None when unavailable """
+    try:
+        with open('/proc/{}/statm'.format(pid)) as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _ratio(current, previous):
+    """ Share of the second counter in the first between two readings """
+    if current is None or previous is None:
+        return None
+    elapsed = current[0] - previous[0]
+    if elapsed <= 0:
+        return 0.0
+    return (current[1] - previous[1]) / elapsed
+
+
+class SaturationMonitor(object):
+    """
+    Samples the health of a worker from a background greenlet: how late the
+    gevent loop wakes up (event loop lag), the share of cpu time stolen by
+    the hypervisor, how often the container hit its cpu limit and how much
+    memory the browsers use. A worker is saturated while any sample is over
+    its limit, since its timings then include its own queueing as well as
+    Looker's response time.
+
+    The worst sample of every reporting window is sent to the master along
+    with the regular stats reports.
+    """
+
+    def __init__(self, mode='monitor', interval=1.0, probe_interval=0.1,
+                 max_lag_ms=200, max_steal=0.1, max_throttled=0.25,
+                 max_rss_mb=None):
+        if mode not in MODES:
+            raise ValueError('Unknown saturation mode {}, use one of {}'.format(
+                mode, ', '.join(MODES)))
+        self.mode = mode
+        self.interval = interval
+        self.probe_interval = probe_interval
+        self.max_lag_ms = max_lag_ms
+        self.max_steal = max_steal
+        self.max_throttled = max_throttled
+        self.max_rss_mb = max_rss_mb
+        self.saturated = False
+        self.last_sample = None
+        self._cpu_times = read_cpu_times()
+        self._throttling = read_throttling()
+        self._reset_window()
+        self._sampler = gevent.spawn(self._sample_periodically)
+
+    def _reset_window(self):
+        self.window = {
+            'samples': 0,
+            'saturated_samples': 0,
+            'lag_ms': 0.0,
+            'steal': None,
+            'throttled': None,
+            'browser_rss_mb': None,
+            'tagged_requests': 0
+        }
+
+    def _measure_lag(self):
+        """ Worst delay of the gevent loop over one sampling interval, in ms """
+        lag = 0.0
+        probes = max(int(self.interval / self.probe_interval), 1)
+        for _ in range(probes):
+            start = time.perf_counter()
+            gevent.sleep(self.probe_interval)
+            lag = max(lag, time.perf_counter() - start - self.probe_interval)
+        return lag * 1000
+
+    def _sample_periodically(self):
+        while True:
+            self.record(self.sample(self._measure_lag()))
+
+    def sample(self, lag_ms):
+        """
+        Take a sample of the worker's cpu and memory next to the measured loop lag
+
+        :param lag_ms: the event loop lag measured over the last interval
+        :return sample: dict of lag_ms, steal, throttled and browser_rss_mb
+        """
+        cpu_times = read_cpu_times()
+        throttling = read_throttling()
+        steal = _ratio(cpu_times, self._cpu_times)
+        throttled = _ratio(throttling, self._throttling)
+        self._cpu_times, self._throttling = cpu_times, throttling
+        rss = browser_rss()
+        return {
+            'lag_ms': lag_ms,
+            'steal': steal,
+            'throttled': throttled,
+            'browser_rss_mb': rss / (1024 * 1024) if rss is not None else None
+        }
+
+    def is_saturated(self, sample):
+        """ True if any part of a sample is over its limit """
+        return any([
+            sample['lag_ms'] > self.max_lag_ms,
+            sample['steal'] is not None and sample['steal'] > self.max_steal,
+            sample['throttled'] is not None and sample['throttled'] > self.max_throttled,
+            self.max_rss_mb is not None and sample['browser_rss_mb'] is not None
+            and sample['browser_rss_mb'] > self.max_rss_mb
+        ])
+
+    def record(self, sample):
+        """ Update the saturation state and the reporting window with a sample """
+        saturated = self.is_saturated(sample)
+        if saturated and not self.saturated:
+            _LOGGER.warning('Worker is saturated: %s', _describe(sample))
+        elif self.saturated and not saturated:
+            _LOGGER.info('Worker is no longer saturated')
+        self.saturated = saturated
+        self.last_sample = sample
+
+        window = self.window
+        window['samples'] += 1
+        window['saturated_samples'] += int(saturated)
+        window['lag_ms'] = max(window['lag_ms'], sample['lag_ms'])
+        for key in ('steal', 'throttled', 'browser_rss_mb'):
+            if sample[key] is not None:
+                window[key] = max(window[key] or 0, sample[key])
+
+    def tag(self, name):
+        """
+        Apply the mode to a request about to be reported: the name to report
+        it under, or None if it must be left out of the stats
+        """
+        if not self.saturated or self.mode == 'monitor':
+            return name
+        self.window['tagged_requests'] += 1
+        if self.mode == 'exclude':
+            return None
+        return name + SATURATED_SUFFIX
+
+    def report(self):
+        """ Summary of the window since the last report, starting a new window """
+        window = self.window
+        self._reset_window()
+        window['saturated'] = window['saturated_samples'] > 0
+        window['mode'] = self.mode
+        window['interval'] = self.interval
+        return window
+
+    def close(self):
+        """ Stop sampling """
+        self._sampler.kill()
+
+
+def _describe(sample):
+    parts = ['event loop lag {:.0f}ms'.format(sample['lag_ms'])]
+    if sample['steal'] is not None:
+        parts.append('cpu steal {:.0%}'.format(sample['steal']))
+    if sample['throttled'] is not None:
+        parts.append('cpu throttled {:.0%}'.format(sample['throttled']))
+    if sample['browser_rss_mb'] is not None:
+        parts.append('browser memory {:.0f}MB'.format(sample['browser_rss_mb']))
+    return ', '.join(parts)
+
+
+def _getenv_float(name, default):
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return float(value)
+
+
+_MONITOR = None
+
+
+def get_monitor():
+    """
+    Return the worker's saturation monitor, starting it on first use when the
+    LOCUST_SATURATION_MODE environment variable is set. Limits are read from
+    LOCUST_SATURATION_MAX_LAG_MS, LOCUST_SATURATION_MAX_STEAL,
+    LOCUST_SATURATION_MAX_THROTTLED and LOCUST_SATURATION_MAX_RSS_MB.
+    Returns None when saturation monitoring is off.
+    """
+    global _MONITOR  # pylint:disable=global-statement
+    if _MONITOR is None and os.getenv('LOCUST_SATURATION_MODE'):
+        _MONITOR = SaturationMonitor(
+            mode=os.getenv('LOCUST_SATURATION_MODE').lower(),
+            interval=_getenv_float('LOCUST_SATURATION_INTERVAL', 1.0),
+            max_lag_ms=_getenv_float('LOCUST_SATURATION_MAX_LAG_MS', 200),
+            max_steal=_getenv_float('LOCUST_SATURATION_MAX_STEAL', 0.1),
+            max_throttled=_getenv_float('LOCUST_SATURATION_MAX_THROTTLED', 0.25),
+            max_rss_mb=_getenv_float('LOCUST_SATURATION_MAX_RSS_MB', None)
+        )
+    return _MONITOR
+
+
+def _close_monitor():
+    global _MONITOR  # pylint:disable=global-statement
+    if _MONITOR is not None:
+        _MONITOR.close()
+        _MONITOR = None
+
+
+def _on_report_to_master(client_id, data):  # pylint:disable=unused-argument
+    monitor = get_monitor()
+    if monitor is not None:
+        data['saturation'] = monitor.report()
+
+
+# the latest saturation report of every worker, kept by the master
+WORKER_REPORTS = {}
+
+
+def prune_reports(runner, reports):
+    """
+    Drop the reports of workers that quit or stopped sending heartbeats, so
+    a saturated worker that is gone no longer counts towards the target
+    worker count or shows up in the metrics
+
+    :param runner: the master locust runner, None before a test was started
+    :param reports: dict of the latest report of every worker by client id
+    :return reports: the same dict, pruned in place
+    """
+    if runner is None:
+        return reports
+    clients = getattr(runner, 'clients', {})
+    for client_id in list(reports):
+        client = clients.get(client_id)
+        if client is None or client.state == runners.STATE_MISSING:
+            del reports[client_id]
+    return reports
+
+
+def _on_slave_report(client_id, data):
+    prune_reports(runners.locust_runner, WORKER_REPORTS)
+    report = data.get('saturation')
+    if report is None:
+        return
+    previous = WORKER_REPORTS.get(client_id, {})
+    if report['saturated'] and not previous.get('saturated'):
+        _LOGGER.warning('Worker %s is saturated, its timings are %s', client_id, {
+            'monitor': 'not reliable',
+            'flag': 'reported with a "{}" suffix'.format(SATURATED_SUFFIX.strip()),
+            'exclude': 'left out of the stats'
+        }[report['mode']])
+    report['tagged_requests_total'] = previous.get('tagged_requests_total', 0) + report['tagged_requests']
+    report['saturated_seconds_total'] = (
+        previous.get('saturated_seconds_total', 0) + report['saturated_samples'] * report['interval']
+    )
+    WORKER_REPORTS[client_id] = report
+
+
+METRICS = [
+    ('locust_worker_saturated', 'gauge',
+     'Whether the worker was saturated during its last report', 'saturated'),
+    ('locust_worker_event_loop_lag_ms', 'gauge',
+     'Worst event loop lag of the worker during its last report', 'lag_ms'),
+    ('locust_worker_cpu_steal_ratio', 'gauge',
+     'Share of cpu time stolen from the worker\'s node during its last report', 'steal'),
+    ('locust_worker_cpu_throttled_ratio', 'gauge',
+     'Share of cpu periods the worker was throttled in during its last report', 'throttled'),
+    ('locust_worker_browser_rss_mb', 'gauge',
+     'Memory used by the worker\'s browsers during its last report', 'browser_rss_mb'),
+    ('locust_worker_saturated_seconds_total', 'counter',
+     'Time the worker spent saturated', 'saturated_seconds_total'),
+    ('locust_worker_saturated_requests_total', 'counter',
+     'Requests flagged or excluded because the worker was saturated', 'tagged_requests_total')
+]
+
+
+def render_metrics(reports):
+    """
+    Render worker saturation reports in the Prometheus text exposition format
+
+    :param reports: dict of the latest report of every worker by client id
+    :return text: the metrics page
+    """
+    lines = []
+    for metric, metric_type, description, key in METRICS:
+        lines.append('# HELP {} {}'.format(metric, description))
+        lines.append('# TYPE {} {}'.format(metric, metric_type))
+        for client_id, report in sorted(reports.items()):
+            value = report.get(key)
+            if value is None:
+                continue
+            lines.append('{}{{worker="{}"}} {}'.format(metric, client_id, float(value)))
+    return '\n'.join(lines) + '\n'
+
+
+@web.app.route('/saturation/metrics')
+def saturation_metrics():
+    """ Worker saturation metrics for Prometheus, served by the master """
+    return Response(render_metrics(prune_reports(runners.locust_runner, WORKER_REPORTS)), mimetype='text/plain; version=0.0.4')
+
+
+events.report_to_master += _on_report_to_master
+events.slave_report += _on_slave_report
+events.quitting += _close_monitor
@@ -2,7 +2,7 @@ from setuptools import setup
 
 NAME = "realbrowserlocusts"
 VERSION = "0.4.1"
-REQUIRES = ["greenlet==0.4.16", "locustio==0.14.6", "selenium==3.141.0"]
+REQUIRES = ["greenlet==0.4.16", "locustio==0.14.6", "selenium==3.141.0", "PyYAML==5.4.1"]
 
 setup(
     name=NAME,
@@ -0,0 +1,104 @@
+import json
+import pytest
+
+pytest.importorskip("locust")
+
+from requests import Response  # noqa: E402
+from requests.adapters import BaseAdapter  # noqa: E402
+from locust.exception import LocustError  # noqa: E402
+from realbrowserlocusts import api  # noqa: E402
+from realbrowserlocusts.api import LookerApiClient, LookerApiUser  # noqa: E402
+
+
+class MockAdapter(BaseAdapter):
+    def __init__(self, expires_in=3600, login_status=200):
+        super(MockAdapter, self).__init__()
+        self.expires_in = expires_in
+        self.login_status = login_status
+        self.logins = 0
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append((request.method, request.path_url, request.headers.get("Authorization")))
+        response = Response()
+        response.request = request
+        response.url = request.url
+        response.status_code = 200
+        body = {}
+        if request.path_url.endswith("/login"):
+            self.logins += 1
+            response.status_code = self.login_status
+            body = {"access_token": "token{}".format(self.logins), "expires_in": self.expires_in}
+        response._content = json.dumps(body).encode()
+        return response
+
+    def close(self):
+        pass
+
+
+def test_login_sets_the_access_token():
+    adapter = MockAdapter()
+    client = LookerApiClient("https://looker.example.com:19999", adapter=adapter)
+
+    client.login("id", "secret")
+    client.run_query(1)
+
+    assert adapter.requests == [
+        ("POST", "/api/3.1/login", None),
+        ("GET", "/api/3.1/queries/1/run/json?cache=true", "token token1"),
+    ]
+
+
+def test_login_failure_raises():
+    client = LookerApiClient("https://looker.example.com:19999", adapter=MockAdapter(login_status=404))
+
+    with pytest.raises(LocustError):
+        client.login("id", "wrong")
+
+
+def test_expired_token_is_refreshed(mocker):
+    monotonic = mocker.patch("realbrowserlocusts.api.time.monotonic", return_value=1000)
+    adapter = MockAdapter(expires_in=3600)
+    client = LookerApiClient("https://looker.example.com:19999", adapter=adapter)
+    client.login("id", "secret")
+
+    monotonic.return_value = 1000 + 3600 - api.TOKEN_REFRESH_MARGIN - 1
+    client.run_query(1)
+    monotonic.return_value = 1000 + 3600 - api.TOKEN_REFRESH_MARGIN
+    client.run_query(1)
+    client.run_query(1)
+
+    assert adapter.logins == 2
+    assert [authorization for _, path, authorization in adapter.requests if "/queries/" in path] == [
+        "token token1", "token token2", "token token2"
+    ]
+
+
+def test_logout_stops_refreshing(mocker):
+    monotonic = mocker.patch("realbrowserlocusts.api.time.monotonic", return_value=1000)
+    adapter = MockAdapter(expires_in=60)
+    client = LookerApiClient("https://looker.example.com:19999", adapter=adapter)
+    client.login("id", "secret")
+
+    client.logout()
+    monotonic.return_value = 2000
+    client.run_query(1)
+
+    assert adapter.logins == 1
+    assert adapter.requests[-1][2] is None
+
+
+def test_api_url_does_not_fall_back_to_the_web_host(monkeypatch):
+    monkeypatch.delenv("LOOKER_API_URL", raising=False)
+    monkeypatch.setenv("HOST", "https://looker.example.com")
+
+    with pytest.raises(LocustError):
+        LookerApiUser()
+
+    class WebHostUser(LookerApiUser):
+        api_url_from_host = True
+
+    assert WebHostUser().client.base_url == "https://looker.example.com"
+
+    monkeypatch.setenv("LOOKER_API_URL", "https://looker.example.com:19999/")
+    assert WebHostUser().client.base_url == "https://looker.example.com:19999"
@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("locust")
+
+from locust.runners import STATE_HATCHING, STATE_MISSING, STATE_RUNNING, STATE_STOPPED  # noqa: E402
+from realbrowserlocusts.autoscale import Rebalancer, target_workers, upcoming_users  # noqa: E402
+
+
+class FakeRunner(object):
+    """Exposes the parts of a locust 0.14.6 MasterLocustRunner the autoscaler reads."""
+
+    def __init__(self, clients, target_user_count=None, state=STATE_RUNNING, user_count=0):
+        self.clients = {client_id: SimpleNamespace(state=state) for client_id, state in clients.items()}
+        self.target_user_count = target_user_count
+        self.user_count = user_count
+        self.state = state
+        self.hatch_rate = 5
+        self.stepload_greenlet = None
+        self.hatched = []
+
+    def start_hatching(self, locust_count, hatch_rate):
+        self.hatched.append((locust_count, hatch_rate))
+
+
+@pytest.fixture
+def spawn(mocker):
+    return mocker.patch("realbrowserlocusts.autoscale.gevent.spawn", side_effect=lambda fn, *args: fn(*args))
+
+
+def test_upcoming_users_uses_target_user_count():
+    runner = FakeRunner({}, target_user_count=40, user_count=35)
+
+    assert upcoming_users(runner) == 40
+
+
+def test_upcoming_users_falls_back_to_user_count():
+    runner = FakeRunner({}, user_count=12)
+
+    assert upcoming_users(runner) == 12
+
+
+def test_upcoming_users_adds_next_step():
+    runner = FakeRunner({}, target_user_count=40)
+    runner.step_clients_growth = 20
+    runner.total_clients = 50
+    runner.stepload_greenlet = SimpleNamespace(dead=False)
+
+    assert upcoming_users(runner) == 50
+
+
+def test_upcoming_users_ignores_finished_step_load():
+    runner = FakeRunner({}, target_user_count=40)
+    runner.step_clients_growth = 20
+    runner.total_clients = 100
+    runner.stepload_greenlet = SimpleNamespace(dead=True)
+
+    assert upcoming_users(runner) == 40
+
+
+def test_target_workers_adds_saturated_workers():
+    runner = FakeRunner({}, target_user_count=45)
+    reports = {"a": {"saturated": True}, "b": {"saturated": False}}
+
+    assert target_workers(runner, 10, reports) == 6
+
+
+def test_target_workers_without_users_per_worker():
+    assert target_workers(FakeRunner({}, target_user_count=45), 0, {}) is None
+
+
+def test_target_workers_keeps_one_worker():
+    assert target_workers(FakeRunner({}), 10, {}) == 1
+
+
+def test_rebalancer_ignores_joining_workers(spawn):
+    rebalancer = Rebalancer()
+    runner = FakeRunner({"a": STATE_RUNNING}, target_user_count=20)
+    rebalancer.check(runner)
+
+    runner.clients["b"] = SimpleNamespace(state=STATE_HATCHING)
+
+    assert not rebalancer.check(runner)
+    assert runner.hatched == []
+
+
+def test_rebalancer_rehatches_when_a_worker_quits(spawn):
+    rebalancer = Rebalancer()
+    runner = FakeRunner({"a": STATE_RUNNING, "b": STATE_RUNNING}, target_user_count=20)
+    rebalancer.check(runner)
+
+    del runner.clients["b"]
+
+    assert rebalancer.check(runner)
+    assert runner.hatched == [(20, 5)]
+
+
+def test_rebalancer_rehatches_when_a_worker_goes_missing(spawn):
+    rebalancer = Rebalancer()
+    runner = FakeRunner({"a": STATE_RUNNING, "b": STATE_RUNNING}, target_user_count=20)
+    rebalancer.check(runner)
+
+    runner.clients["b"].state = STATE_MISSING
+
+    assert rebalancer.check(runner)
+    assert not rebalancer.check(runner)
+    assert runner.hatched == [(20, 5)]
+
+
+def test_rebalancer_ignores_stopped_tests(spawn):
+    rebalancer = Rebalancer()
+    runner = FakeRunner({"a": STATE_RUNNING, "b": STATE_RUNNING}, target_user_count=20)
+    rebalancer.check(runner)
+
+    runner.state = STATE_STOPPED
+    del runner.clients["b"]
+
+    assert not rebalancer.check(runner)
+    assert runner.hatched == []
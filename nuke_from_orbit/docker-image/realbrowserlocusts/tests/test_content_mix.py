@@ -0,0 +1,97 @@
+from collections import Counter
+import pytest
+
+pytest.importorskip("locust")
+
+from locust.exception import LocustError  # noqa: E402
+from realbrowserlocusts.content_mix import AliasSampler, ContentMix  # noqa: E402
+
+CSV_MIX = """id,stem,weight,group,filters
+17,dashboards,4,Sales,Date=90 days&State=Texas|Date=365 days&State=Texas
+5818,looks,1,Finance,
+"""
+
+YAML_MIX = """
+- id: 17
+  weight: 4
+  group: Sales
+  filters:
+    - Date: 90 days
+      State: Texas
+    - Date: 365 days
+      State: Texas
+- id: 5818
+  stem: looks
+  group: Finance
+"""
+
+
+def test_alias_sampler_follows_the_weights():
+    weights = [1, 2, 3, 0, 4]
+    sampler = AliasSampler(weights, seed=1)
+    draws = 100000
+
+    counts = Counter(sampler.sample() for _ in range(draws))
+
+    assert counts[3] == 0
+    for index, weight in enumerate(weights):
+        assert counts[index] / draws == pytest.approx(weight / sum(weights), abs=0.01)
+
+
+def test_alias_sampler_is_reproducible_with_a_seed():
+    first, second = AliasSampler([5, 1, 1], seed=42), AliasSampler([5, 1, 1], seed=42)
+
+    assert [first.sample() for _ in range(100)] == [second.sample() for _ in range(100)]
+
+
+def test_alias_sampler_rejects_empty_weights():
+    with pytest.raises(LocustError):
+        AliasSampler([])
+    with pytest.raises(LocustError):
+        AliasSampler([0, 0])
+
+
+@pytest.mark.parametrize("file_name, contents", [("mix.csv", CSV_MIX), ("mix.yaml", YAML_MIX)])
+def test_load_parses_filter_variants(tmp_path, file_name, contents):
+    path = tmp_path / file_name
+    path.write_text(contents)
+
+    mix = ContentMix.load(path)
+
+    dashboard, look = mix.items
+    assert (dashboard.content_id, dashboard.stem, dashboard.weight, dashboard.group) == ("17", "dashboards", 4, "Sales")
+    assert dashboard.filters == [{"Date": "90 days", "State": "Texas"}, {"Date": "365 days", "State": "Texas"}]
+    assert dashboard.path(1) == "/dashboards/17?Date=365%20days&State=Texas"
+    assert (look.content_id, look.stem, look.weight, look.group, look.name) == ("5818", "looks", 1, "Finance", "look 5818")
+    assert look.filters == [{}]
+    assert look.path() == "/looks/5818"
+
+
+def test_load_accepts_a_single_variant_and_a_content_key(tmp_path):
+    path = tmp_path / "mix.yml"
+    path.write_text("content:\n  - id: 3\n    filters:\n      Region: West\n")
+
+    mix = ContentMix.load(path)
+
+    assert mix.items[0].filters == [{"Region": "West"}]
+
+
+def test_variants_share_the_weight_of_their_item(tmp_path):
+    path = tmp_path / "mix.csv"
+    path.write_text(CSV_MIX)
+    mix = ContentMix.load(path, seed=7)
+    draws = 50000
+
+    counts = Counter((item.content_id, variant) for item, variant in (mix.choice() for _ in range(draws)))
+
+    assert counts[("17", 0)] / draws == pytest.approx(0.4, abs=0.01)
+    assert counts[("17", 1)] / draws == pytest.approx(0.4, abs=0.01)
+    assert counts[("5818", 0)] / draws == pytest.approx(0.2, abs=0.01)
+
+
+def test_load_rejects_other_formats(tmp_path):
+    path = tmp_path / "mix.json"
+    path.write_text("[]")
+
+    with pytest.raises(LocustError):
+        ContentMix.load(path)
@@ -0,0 +1,136 @@
+import gevent
+import pytest
+
+pytest.importorskip("locust")
+
+from locust import TaskSet, constant, task  # noqa: E402
+from locust.exception import LocustError, StopLocust  # noqa: E402
+from selenium.webdriver.remote.command import Command  # noqa: E402
+from realbrowserlocusts import contexts  # noqa: E402
+from realbrowserlocusts.locusts import RealBrowserLocust  # noqa: E402
+
+
+class MockDriver:
+    def __init__(self):
+        self.window_handles = ["main"]
+        self.commands = []
+        self.disposed = []
+        self.quit_called = False
+
+    def execute(self, driver_command, params=None):
+        self.commands.append((driver_command, params))
+        return {}
+
+    def execute_cdp_cmd(self, command, params):
+        if command == "Target.createBrowserContext":
+            return {"browserContextId": "context-{}".format(len(self.window_handles))}
+        if command == "Target.createTarget":
+            handle = "tab-{}".format(params["browserContextId"])
+            self.window_handles.append(handle)
+            return {"targetId": handle}
+        if command == "Target.disposeBrowserContext":
+            self.disposed.append(params["browserContextId"])
+        return {}
+
+    def set_script_timeout(self, timeout):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+class StopRightAway(TaskSet):
+    @task
+    def stop(self):
+        self.locust.seen_handles.append(self.client.lease.handle)
+        raise StopLocust()
+
+
+class ContextLocust(RealBrowserLocust):
+    screen_width = 800
+    screen_height = 600
+    browser_contexts = 2
+    max_browsers = 1
+    driver_pool_timeout = 0.05
+    wait_time = constant(0)
+    task_set = StopRightAway
+
+    def __init__(self):
+        super(ContextLocust, self).__init__()
+        self.seen_handles = []
+        self.client = self.create_client(MockDriver)
+
+
+@pytest.fixture(autouse=True)
+def close_groups():
+    yield
+    contexts.close_groups()
+
+
+def test_group_fills_browsers_before_starting_another():
+    group = contexts.SharedBrowserGroup(MockDriver, 2)
+
+    leases = [group.acquire() for _ in range(3)]
+
+    assert len(group.browsers) == 2
+    assert [lease.browser for lease in leases] == [group.browsers[0], group.browsers[0], group.browsers[1]]
+    assert len({lease.handle for lease in leases[:2]}) == 2
+
+    drivers = [browser.driver for browser in group.browsers]
+    group.close()
+    assert all(driver.quit_called for driver in drivers)
+    assert group.browsers == []
+
+
+def test_group_waits_for_a_context_once_max_browsers_are_full():
+    group = contexts.SharedBrowserGroup(MockDriver, 1, max_browsers=1, acquire_timeout=0.01)
+    lease = group.acquire()
+
+    with pytest.raises(LocustError):
+        group.acquire()
+
+    lease.release()
+    lease.release()
+    assert group.acquire().browser is lease.browser
+    assert len(group.browsers) == 1
+    assert lease.browser.driver.disposed == [lease.context_id]
+
+
+def test_commands_go_to_the_tab_of_the_calling_user():
+    group = contexts.SharedBrowserGroup(MockDriver, 2)
+    first, second = group.acquire(), group.acquire()
+    driver = first.driver
+
+    def browse(lease):
+        lease.bind()
+        driver.execute(Command.GET_TITLE)
+
+    gevent.joinall([gevent.spawn(browse, first), gevent.spawn(browse, second)])
+
+    switches = [params["handle"] for command, params in driver.commands if command == Command.SWITCH_TO_WINDOW]
+    titles = [index for index, (command, _) in enumerate(driver.commands) if command == Command.GET_TITLE]
+    assert switches == [first.handle, second.handle]
+    assert len(titles) == 2
+    assert driver.commands[titles[0] - 1][1]["handle"] == first.handle
+    assert driver.commands[titles[1] - 1][1]["handle"] == second.handle
+
+
+def test_users_lease_a_context_when_they_run():
+    users = [ContextLocust() for _ in range(3)]
+    assert all(user.client is None for user in users)
+    assert ContextLocust not in contexts._GROUPS
+
+    users[0].run()
+    assert users[0].client.lease.released
+
+    group = contexts._GROUPS[ContextLocust]
+    held = [group.acquire(), group.acquire()]
+    # hatching never waits for a context, running a user of a full group does
+    with pytest.raises(LocustError):
+        users[1].run()
+    assert users[1].client is None
+
+    held[0].release()
+    users[2].run()
+    assert users[2].seen_handles == [users[2].client.lease.handle]
+    assert len(group.browsers) == 1
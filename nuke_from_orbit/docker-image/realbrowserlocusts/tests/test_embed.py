@@ -0,0 +1,30 @@
+from urllib.parse import parse_qs, urlparse
+import pytest
+
+pytest.importorskip("locust")
+
+from realbrowserlocusts import EmbedSigner  # noqa: E402
+
+
+def test_sign_matches_known_signature(mocker):
+    mocker.patch("realbrowserlocusts.embed.time.time", return_value=1600000000)
+    mocker.patch("realbrowserlocusts.embed.os.urandom", return_value=b"\x00" * 16)
+    signer = EmbedSigner("https://looker.example.com", secret="secret")
+
+    url = signer.sign(
+        "https://looker.example.com/dashboards/1",
+        external_user_id=42,
+        permissions=["access_data", "see_user_dashboards"],
+        models=["thelook"]
+    )
+
+    # HMAC-SHA1 of host, embed path, nonce, time, session length, user id, permissions, models
+    # and access filters, one per line, as described in Looker's SSO embedding docs
+    parsed = urlparse(url.url)
+    params = parse_qs(parsed.query)
+    assert parsed.path == "/login/embed/%2Fembed%2Fdashboards%2F1"
+    assert params["nonce"] == ['"AAAAAAAAAAAAAAAAAAAAAA=="']
+    assert params["time"] == ["1600000000"]
+    assert params["external_user_id"] == ['"42"']
+    assert params["signature"] == ["78yzXipNIaR/ZrOf9TtxtbiPbeA="]
+    assert url.expires_at == 1600000000 + 300
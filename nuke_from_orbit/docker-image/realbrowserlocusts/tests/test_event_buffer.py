@@ -0,0 +1,79 @@
+import gevent
+import pytest
+
+pytest.importorskip("locust")
+
+from locust import events  # noqa: E402
+from realbrowserlocusts.core import EventBuffer  # noqa: E402
+from realbrowserlocusts.recorder import SampleRecorder  # noqa: E402
+
+
+@pytest.fixture
+def fired():
+    fired = []
+
+    def on_success(request_type, name, response_time, response_length, started_at, **kwargs):
+        fired.append((name, started_at))
+
+    def on_failure(request_type, name, response_time, response_length, exception, started_at, **kwargs):
+        fired.append((name, started_at))
+
+    events.request_success += on_success
+    events.request_failure += on_failure
+    yield fired
+    events.request_success -= on_success
+    events.request_failure -= on_failure
+
+
+def test_buffer_flushes_once_full(fired):
+    buffer = EventBuffer(2, interval=60)
+
+    buffer.add("API", "first", 10, 0)
+    assert fired == []
+    buffer.add("API", "second", 10, 0, exception=ValueError())
+
+    assert [name for name, _ in fired] == ["first", "second"]
+    buffer.close()
+
+
+def test_buffer_flushes_periodically(fired):
+    buffer = EventBuffer(100, interval=0.01)
+
+    buffer.add("API", "first", 10, 0)
+    gevent.sleep(0.05)
+
+    assert [name for name, _ in fired] == ["first"]
+    buffer.close()
+
+
+def test_buffer_closes_with_a_last_flush(fired):
+    buffer = EventBuffer(100, interval=60)
+
+    buffer.add("API", "first", 10, 0)
+    buffer.close()
+
+    assert [name for name, _ in fired] == ["first"]
+
+
+def test_buffered_events_keep_the_time_they_started(fired, mocker):
+    clock = mocker.patch("realbrowserlocusts.core.time.time", return_value=1000.0)
+    buffer = EventBuffer(100, interval=60)
+
+    buffer.add("API", "first", 250, 0)
+    clock.return_value = 1005.0
+    buffer.close()
+
+    assert fired == [("first", 999.75)]
+
+
+def test_recorder_prefers_the_reported_start_time(mocker):
+    mocker.patch("realbrowserlocusts.recorder.time.time", return_value=1005.0)
+    recorder = SampleRecorder()
+
+    recorder.record("API", "buffered", 250, True, started_at=999.75)
+    recorder.record("API", "direct", 500, False)
+
+    assert recorder.drain() == [
+        [999.75, "API", "buffered", 250, True],
+        [1004.5, "API", "direct", 500, False],
+    ]
@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("locust")
+
+from locust import TaskSet, constant, task  # noqa: E402
+from locust.exception import LocustError, StopLocust  # noqa: E402
+from realbrowserlocusts import pool  # noqa: E402
+from realbrowserlocusts.locusts import RealBrowserLocust  # noqa: E402
+
+
+class MockDriver:
+    def set_window_size(self, width, height):
+        pass
+
+    def set_script_timeout(self, timeout):
+        pass
+
+
+class StopRightAway(TaskSet):
+    @task
+    def stop(self):
+        self.locust.seen_drivers.append(self.client.driver)
+        raise StopLocust()
+
+
+class PooledLocust(RealBrowserLocust):
+    screen_width = 800
+    screen_height = 600
+    driver_pool_size = 1
+    driver_pool_timeout = 0.05
+    wait_time = constant(0)
+    task_set = StopRightAway
+
+    def __init__(self):
+        super(PooledLocust, self).__init__()
+        self.seen_drivers = []
+        self.client = self.create_client(MockDriver)
+
+
+@pytest.fixture(autouse=True)
+def close_pools():
+    yield
+    pool.close_pools()
+
+
+def test_pooled_driver_is_leased_when_the_user_runs():
+    user = PooledLocust()
+    assert user.client is None
+    assert PooledLocust not in pool._POOLS
+
+    user.run()
+
+    assert user.seen_drivers == [user.client.driver]
+    assert user.client.lease.released
+
+
+def test_users_waiting_for_a_driver_fail_when_they_run():
+    user = PooledLocust()
+    user.run()
+    held = pool._POOLS[PooledLocust].acquire(timeout=1)
+
+    # hatching another user doesn't wait for the pool, running it does
+    waiting = PooledLocust()
+    with pytest.raises(LocustError):
+        waiting.run()
+
+    assert waiting.client is None
+    held.release()
@@ -0,0 +1,67 @@
+import re
+import pytest
+
+pytest.importorskip("locust")
+
+from locust import events  # noqa: E402
+from realbrowserlocusts.core import RealBrowserClient  # noqa: E402
+
+RESOURCES = [
+    # query manager task creation and polls, with task ids that change every load
+    {"url": "https://looker.example.com/api/internal/querymanager/queries", "end": 110, "duration": 10},
+    {"url": "https://looker.example.com/api/internal/querymanager/queries?query_task_ids=a1,b2", "end": 150, "duration": 20},
+    {"url": "https://looker.example.com/api/internal/querymanager/queries/a1/run/json", "end": 160, "duration": 5},
+    # requests returning a tile's results
+    {"url": "https://looker.example.com/api/internal/dashboard_elements/42/run?cache=true", "end": 300, "duration": 200},
+    {"url": "https://looker.example.com/api/3.1/queries/1234/run/json_detail", "end": 250, "duration": 140},
+    {"url": "https://looker.example.com/api/internal/dashboard_elements/42", "end": 90, "duration": 30},
+]
+
+
+class MockDriver:
+    def set_script_timeout(self, timeout):
+        pass
+
+    def execute_script(self, script, pattern):
+        # PAGE_TIMINGS_SCRIPT filters the resources with the same pattern in the browser
+        queries = [resource for resource in RESOURCES if re.search(pattern, resource["url"])]
+        return {
+            "navigation": 80,
+            "marks": [{"name": "rendered", "time": 400}],
+            "queries": sorted(queries, key=lambda query: query["end"] - query["duration"]),
+        }
+
+
+def test_only_result_requests_are_timed_by_tile():
+    client = RealBrowserClient(MockDriver(), 30, 800, 600, set_window=False, page_timings=True)
+
+    timings = client.collect_page_timings()
+
+    assert timings == {
+        "navigation": 80,
+        "first_query": 250,
+        "rendered": 400,
+        "queries": [("42", 200), ("1234", 140)],
+    }
+
+
+def test_page_timings_are_reported_by_tile():
+    client = RealBrowserClient(MockDriver(), 30, 800, 600, set_window=False, page_timings=True)
+    reported = []
+
+    def on_success(request_type, name, response_time, response_length, **kwargs):
+        reported.append((name, response_time))
+
+    events.request_success += on_success
+    try:
+        client.report_page_timings("Dashboard", "dashboard")
+    finally:
+        events.request_success -= on_success
+
+    assert reported == [
+        ("dashboard [navigation]", 80),
+        ("dashboard [first query]", 250),
+        ("dashboard [rendered]", 400),
+        ("dashboard [query] 42", 200),
+        ("dashboard [query] 1234", 140),
+    ]
@@ -0,0 +1,151 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("locust")
+
+from locust.exception import LocustError  # noqa: E402
+from realbrowserlocusts import pool  # noqa: E402
+
+
+class MockSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current_handle = handle
+
+
+class MockDriver:
+    def __init__(self, pid=None):
+        self.window_handles = ["main"]
+        self.current_handle = "main"
+        self.switch_to = MockSwitchTo(self)
+        self.service = SimpleNamespace(process=SimpleNamespace(pid=pid)) if pid else None
+        self.cdp_commands = []
+        self.url = None
+        self.quit_called = False
+
+    def close(self):
+        self.window_handles.remove(self.current_handle)
+
+    def execute_script(self, script):
+        pass
+
+    def execute_cdp_cmd(self, command, params):
+        self.cdp_commands.append(command)
+
+    def get(self, url):
+        self.url = url
+
+    def quit(self):
+        self.quit_called = True
+
+
+class MockDriverFactory:
+    def __init__(self, pid=None):
+        self.pid = pid
+        self.drivers = []
+
+    def __call__(self):
+        driver = MockDriver(self.pid)
+        self.drivers.append(driver)
+        return driver
+
+
+@pytest.fixture
+def factory():
+    return MockDriverFactory()
+
+
+def test_acquire_leases_prewarmed_driver(factory):
+    driver_pool = pool.DriverPool(factory, 2)
+
+    lease = driver_pool.acquire(timeout=1)
+
+    assert lease.driver is factory.drivers[0]
+    assert lease.pooled_driver.leases == 1
+    assert driver_pool.acquire(timeout=1).driver is factory.drivers[1]
+    driver_pool.close()
+
+
+def test_acquire_times_out_when_every_driver_is_leased(factory):
+    driver_pool = pool.DriverPool(factory, 1)
+    driver_pool.acquire(timeout=1)
+
+    with pytest.raises(LocustError):
+        driver_pool.acquire(timeout=0.01)
+    driver_pool.close()
+
+
+def test_release_resets_and_reuses_driver(factory):
+    driver_pool = pool.DriverPool(factory, 1)
+    lease = driver_pool.acquire(timeout=1)
+    lease.driver.window_handles.append("popup")
+    lease.driver.current_handle = "popup"
+
+    lease.release()
+    lease.release()
+
+    driver = factory.drivers[0]
+    assert driver.window_handles == ["main"]
+    assert driver.cdp_commands == ["Network.clearBrowserCookies"]
+    assert driver.url == "about:blank"
+    assert driver_pool.acquire(timeout=1).driver is driver
+    driver_pool.close()
+
+
+def test_recycles_driver_after_max_page_loads(factory):
+    driver_pool = pool.DriverPool(factory, 1, max_page_loads=2)
+    lease = driver_pool.acquire(timeout=1)
+    lease.record_page_load()
+    lease.release()
+
+    lease = driver_pool.acquire(timeout=1)
+    assert lease.driver is factory.drivers[0]
+    lease.record_page_load()
+    lease.release()
+
+    assert factory.drivers[0].quit_called
+    assert driver_pool.acquire(timeout=1).driver is factory.drivers[1]
+    driver_pool.close()
+
+
+def test_recycles_driver_over_max_rss(mocker):
+    factory = MockDriverFactory(pid=1234)
+    tree_rss = mocker.patch("realbrowserlocusts.pool.process_tree_rss", return_value=50 * 1024 * 1024)
+    driver_pool = pool.DriverPool(factory, 1, max_rss_mb=100)
+
+    driver_pool.acquire(timeout=1).release()
+    assert not factory.drivers[0].quit_called
+
+    tree_rss.return_value = 150 * 1024 * 1024
+    driver_pool.acquire(timeout=1).release()
+
+    tree_rss.assert_called_with(1234)
+    assert factory.drivers[0].quit_called
+    assert driver_pool.acquire(timeout=1).driver is factory.drivers[1]
+    driver_pool.close()
+
+
+def test_replaces_driver_that_cannot_be_reset(factory, mocker):
+    driver_pool = pool.DriverPool(factory, 1)
+    lease = driver_pool.acquire(timeout=1)
+    mocker.patch.object(lease.driver, "get", side_effect=Exception("session deleted"))
+
+    lease.release()
+
+    assert factory.drivers[0].quit_called
+    assert driver_pool.acquire(timeout=1).driver is factory.drivers[1]
+    driver_pool.close()
+
+
+def test_close_quits_idle_drivers(factory):
+    driver_pool = pool.DriverPool(factory, 2)
+    lease = driver_pool.acquire(timeout=1)
+    driver_pool.acquire(timeout=1).release()
+
+    driver_pool.close()
+    assert [driver.quit_called for driver in factory.drivers] == [False, True]
+
+    lease.release()
+    assert factory.drivers[0].quit_called
@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip("locust")
+
+from requests import Response  # noqa: E402
+from requests.adapters import BaseAdapter  # noqa: E402
+from locust import events  # noqa: E402
+from realbrowserlocusts.api import LookerApiClient  # noqa: E402
+from realbrowserlocusts.replay import run_tile  # noqa: E402
+
+TILE = {"title": "Sales", "query_id": 7, "query": {}, "expected_rows": 2}
+
+
+class MockAdapter(BaseAdapter):
+    def __init__(self, body):
+        super(MockAdapter, self).__init__()
+        self.body = body
+
+    def send(self, request, **kwargs):
+        response = Response()
+        response.request = request
+        response.url = request.url
+        response.status_code = 200
+        response._content = self.body
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def reported():
+    reported = []
+
+    def on_success(request_type, name, response_time, response_length, **kwargs):
+        reported.append((name, None))
+
+    def on_failure(request_type, name, response_time, exception, **kwargs):
+        reported.append((name, str(exception)))
+
+    events.request_success += on_success
+    events.request_failure += on_failure
+    yield reported
+    events.request_success -= on_success
+    events.request_failure -= on_failure
+
+
+def test_run_tile_validates_rows(reported):
+    client = LookerApiClient("https://looker.example.com:19999", adapter=MockAdapter(b'[{"a": 1}, {"a": 2}]'))
+
+    assert run_tile(client, TILE, "dashboard 1", validate_rows=True)
+    assert reported == [("dashboard 1 - Sales", None)]
+
+
+def test_run_tile_reports_a_row_count_mismatch(reported):
+    client = LookerApiClient("https://looker.example.com:19999", adapter=MockAdapter(b'[{"a": 1}]'))
+
+    assert not run_tile(client, TILE, "dashboard 1", validate_rows=True)
+    assert reported == [("dashboard 1 - Sales", "Expected 2 rows, got 1")]
+
+
+def test_run_tile_reports_a_body_that_isnt_json(reported):
+    client = LookerApiClient("https://looker.example.com:19999", adapter=MockAdapter(b"<html>Oops</html>"))
+
+    assert not run_tile(client, TILE, "dashboard 1", validate_rows=True)
+    assert reported == [("dashboard 1 - Sales", "Expected 2 rows, got a response that isn't JSON")]
@@ -0,0 +1,28 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("locust")
+
+from locust.runners import STATE_MISSING, STATE_RUNNING  # noqa: E402
+from realbrowserlocusts.saturation import prune_reports  # noqa: E402
+
+
+def test_prune_reports_drops_departed_and_missing_workers():
+    runner = SimpleNamespace(clients={
+        "running": SimpleNamespace(state=STATE_RUNNING),
+        "missing": SimpleNamespace(state=STATE_MISSING)
+    })
+    reports = {
+        "running": {"saturated": True},
+        "missing": {"saturated": True},
+        "quit": {"saturated": True}
+    }
+
+    assert prune_reports(runner, reports) is reports
+    assert reports == {"running": {"saturated": True}}
+
+
+def test_prune_reports_without_runner():
+    reports = {"worker": {"saturated": True}}
+
+    assert prune_reports(None, reports) == {"worker": {"saturated": True}}
@@ -0,0 +1,319 @@
+import math
+import statistics
+import yaml
+from datetime import datetime, timezone
+
+# resources requested by each lw-pod by default (see locust-worker-controller.yaml)
+WORKER_CPU = 1
+WORKER_MEMORY_MB = 2048
+
+# requests of the system daemonsets GKE runs on every node (kube-proxy, logging, metrics...)
+DAEMONSET_CPU = 0.25
+DAEMONSET_MEMORY_MB = 400
+
+# requests of the pods that run once per cluster: kube-dns, metrics-server, the locust master,
+# prometheus, grafana and the exporter
+CLUSTER_OVERHEAD_CPU = 0.6
+CLUSTER_OVERHEAD_MEMORY_MB = 1536
+
+# measured worker usage is padded by this much before packing workers onto nodes
+USAGE_HEADROOM = 1.2
+
+# memory per vCPU (in GB) and available sizes (in vCPUs) of the predefined machine types
+MACHINE_FAMILIES = {
+    "c2-standard": (4, [4, 8, 16, 30, 60]),
+    "c2d-standard": (4, [2, 4, 8, 16, 32, 56, 112]),
+    "c2d-highcpu": (2, [2, 4, 8, 16, 32, 56, 112]),
+    "n2-standard": (4, [2, 4, 8, 16, 32, 48, 64, 80, 96, 128]),
+    "n2-highcpu": (1, [2, 4, 8, 16, 32, 48, 64, 80, 96]),
+    "n2-highmem": (8, [2, 4, 8, 16, 32, 48, 64, 80, 96, 128]),
+    "n2d-standard": (4, [2, 4, 8, 16, 32, 48, 64, 80, 96, 128, 224]),
+    "n2d-highcpu": (1, [2, 4, 8, 16, 32, 48, 64, 80, 96, 128, 224]),
+    "n1-standard": (3.75, [1, 2, 4, 8, 16, 32, 64, 96]),
+    "n1-highcpu": (0.9, [2, 4, 8, 16, 32, 64, 96]),
+    "e2-standard": (4, [2, 4, 8, 16, 32]),
+    "e2-highcpu": (1, [2, 4, 8, 16, 32])
+}
+
+# vCPUs and memory (in MB) of the shared-core machine types. They burst above their share of a
+# core, but GKE leaves pods the cpu of a single core on them
+SHARED_CORE_MACHINES = {
+    "e2-micro": (1, 1024),
+    "e2-small": (1, 2048),
+    "e2-medium": (1, 4096),
+    "f1-micro": (1, 614),
+    "g1-small": (1, 1740)
+}
+
+
+class CalibrationError(Exception):
+    """Exception raised if a calibration run can't produce a usable profile."""
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class UnknownMachineTypeError(Exception):
+    """Exception raised if the vCPUs of a machine type can't be worked out from its name."""
+
+    def __init__(self, machine_type):
+        self.machine_type = machine_type
+        self.message = f"Unknown machine type {machine_type}"
+        super().__init__(self.message)
+
+
+def machine_family(machine_type):
+    """Returns the family of a machine type, e.g. c2-standard for c2-standard-8"""
+
+    return machine_type.rsplit("-", 1)[0]
+
+
+def machine_resources(machine_type):
+    """Returns a tuple of the vCPUs and memory (in MB) of a machine type. The memory of
+    machine types outside the known families is unknown and returned as None. Raises an
+    UnknownMachineTypeError if the vCPUs can't be worked out either.
+    """
+
+    if machine_type in SHARED_CORE_MACHINES:
+        return SHARED_CORE_MACHINES[machine_type]
+
+    # custom machine types are named [family-]custom-<vCPUs>-<memory MB>[-ext]
+    parts = machine_type.split("-")
+    if parts[-1] == "ext":
+        parts = parts[:-1]
+    if len(parts) >= 3 and parts[-3] == "custom" and parts[-2].isdigit() and parts[-1].isdigit():
+        return (int(parts[-2]), int(parts[-1]))
+
+    if not parts[-1].isdigit():
+        raise UnknownMachineTypeError(machine_type)
+
+    vcpus = int(parts[-1])
+    family = MACHINE_FAMILIES.get(machine_family(machine_type))
+    memory_mb = int(vcpus * family[0] * 1024) if family else None
+
+    return (vcpus, memory_mb)
+
+
+def known_machine_type(machine_type):
+    """Returns whether the vCPUs of a machine type can be worked out from its name."""
+
+    try:
+        machine_resources(machine_type)
+    except UnknownMachineTypeError:
+        return False
+
+    return True
+
+
+def allocatable_cpu(vcpus):
+    """Returns how many of a node's cores GKE leaves for pods, after its own reservation:
+    6% of the first core, 1% of the second, 0.5% of the next two and 0.25% of the rest.
+    """
+
+    # https://cloud.google.com/kubernetes-engine/docs/concepts/plan-node-sizes
+    tiers = [(1, 0.06), (1, 0.01), (2, 0.005), (math.inf, 0.0025)]
+
+    return vcpus - _tiered_reservation(vcpus, tiers)
+
+
+def allocatable_memory_mb(memory_mb):
+    """Returns how much of a node's memory (in MB) GKE leaves for pods, after its own
+    reservation and the 100MB eviction threshold.
+    """
+
+    if memory_mb < 1024:
+        return memory_mb - 255 - 100
+
+    tiers = [(4096, 0.25), (4096, 0.2), (8192, 0.1), (114688, 0.06), (math.inf, 0.02)]
+
+    return memory_mb - _tiered_reservation(memory_mb, tiers) - 100
+
+
+def _tiered_reservation(amount, tiers):
+    """Sums a reservation that takes a different share of each tier of a resource."""
+
+    reserved = 0
+    for size, share in tiers:
+        portion = min(amount, size)
+        reserved += portion * share
+        amount -= portion
+        if amount <= 0:
+            break
+
+    return reserved
+
+
+def node_capacity(machine_type):
+    """Returns a tuple of the cpu (cores) and memory (MB, None if unknown) a node of the given
+    machine type has left for load test pods, once GKE and its daemonsets have had theirs.
+    """
+
+    vcpus, memory_mb = machine_resources(machine_type)
+
+    node_cpu = allocatable_cpu(vcpus) - DAEMONSET_CPU
+    node_memory_mb = None
+    if memory_mb is not None:
+        node_memory_mb = allocatable_memory_mb(memory_mb) - DAEMONSET_MEMORY_MB
+
+    return (node_cpu, node_memory_mb)
+
+
+def workers_per_node(machine_type, worker_cpu=WORKER_CPU, worker_memory_mb=WORKER_MEMORY_MB):
+    """Returns how many workers of the given size fit on a single node."""
+
+    node_cpu, node_memory_mb = node_capacity(machine_type)
+
+    per_node = math.floor(node_cpu / worker_cpu)
+    if node_memory_mb is not None:
+        per_node = min(per_node, math.floor(node_memory_mb / worker_memory_mb))
+
+    return max(per_node, 0)
+
+
+def max_workers(machine_type, node_count, worker_cpu=WORKER_CPU, worker_memory_mb=WORKER_MEMORY_MB,
+                cluster_overhead=True):
+    """Returns how many workers of the given size a cluster can schedule. Workers are packed
+    onto each node's allocatable resources, and the cluster wide pods take the capacity left
+    over between workers first and whole worker slots after that. Without cluster overhead
+    (the cluster wide pods run in a separate control pool) every worker slot is usable.
+    """
+
+    node_cpu, node_memory_mb = node_capacity(machine_type)
+    per_node = workers_per_node(machine_type, worker_cpu, worker_memory_mb)
+
+    if not cluster_overhead:
+        return node_count * per_node
+
+    # find room for the cluster wide pods, giving up worker slots if the gaps are too small
+    spare_cpu = node_count * (node_cpu - per_node * worker_cpu)
+    slots = math.ceil(max(CLUSTER_OVERHEAD_CPU - spare_cpu, 0) / worker_cpu)
+    if node_memory_mb is not None:
+        spare_memory_mb = node_count * (node_memory_mb - per_node * worker_memory_mb)
+        slots = max(slots, math.ceil(max(CLUSTER_OVERHEAD_MEMORY_MB - spare_memory_mb, 0) / worker_memory_mb))
+
+    return max(node_count * per_node - slots, 0)
+
+
+def fits_cluster_overhead(machine_type, node_count):
+    """Returns whether a pool of nodes has room for the cluster wide pods on its own."""
+
+    node_cpu, node_memory_mb = node_capacity(machine_type)
+
+    if node_count * node_cpu < CLUSTER_OVERHEAD_CPU:
+        return False
+
+    return node_memory_mb is None or node_count * node_memory_mb >= CLUSTER_OVERHEAD_MEMORY_MB
+
+
+def worker_size(profile):
+    """Returns a tuple of the cpu (cores) and memory (MB) a worker needs to run the number
+    of users in a calibration profile: the measured usage plus headroom, or the pod's
+    requests if those are larger.
+    """
+
+    cpu = max(WORKER_CPU, profile["worker_cpu"] * USAGE_HEADROOM)
+    memory_mb = max(WORKER_MEMORY_MB, profile["worker_memory_mb"] * USAGE_HEADROOM)
+
+    return (round(cpu, 2), math.ceil(memory_mb))
+
+
+def plan_capacity(profile, target_users, machine_family_name=None):
+    """Accepts a calibration profile and a target number of users and works out how many
+    workers are needed and the machine type and node count that fits them on the fewest
+    vCPUs. Machine types are picked from the family the profile was calibrated on (the
+    users a worker can handle depend on the CPU), unless another family is given.
+    Returns a dict of the recommended settings.
+    """
+
+    users_per_worker = profile["users_per_worker"]
+    worker_count = math.ceil(target_users / users_per_worker)
+    cpu, memory_mb = worker_size(profile)
+
+    family = machine_family_name or machine_family(profile["machine_type"])
+    if family not in MACHINE_FAMILIES:
+        raise ValueError(f"Unknown machine family {family}. Known families: {', '.join(MACHINE_FAMILIES)}")
+
+    candidates = []
+    for vcpus in MACHINE_FAMILIES[family][1]:
+        machine_type = f"{family}-{vcpus}"
+        if workers_per_node(machine_type, cpu, memory_mb) == 0:
+            continue
+        node_count = 1
+        while max_workers(machine_type, node_count, cpu, memory_mb) < worker_count:
+            node_count += 1
+        candidates.append((vcpus * node_count, node_count, machine_type))
+
+    if not candidates:
+        raise ValueError(f"No {family} machine type can fit a worker needing {cpu} cores and {memory_mb}MB")
+
+    total_vcpus, node_count, machine_type = min(candidates)
+
+    return {
+        "gcp_cluster_machine_type": machine_type,
+        "gcp_cluster_node_count": node_count,
+        "loadtest_worker_count": worker_count,
+        "loadtest_worker_cpu": cpu,
+        "loadtest_worker_memory_mb": memory_mb,
+        "users_per_worker": users_per_worker,
+        "total_vcpus": total_vcpus
+    }
+
+
+def build_profile(script, machine_type, target_p95_ms, baseline, steps):
+    """Turns the steps of a calibration run into a profile. Each step is a dict of the
+    users run on a single worker, the p95 response time, and the worker's cpu (cores) and
+    memory (MB) use. The users per worker is the largest step that stayed within the p95
+    target, and memory per user is how much memory grew over the idle baseline by then.
+    """
+
+    within_target = [s for s in steps if s["p95_ms"] is not None and s["p95_ms"] <= target_p95_ms]
+    if not within_target:
+        raise CalibrationError(
+            f"p95 response time exceeded {target_p95_ms}ms even with {steps[0]['users']} users per worker"
+            if steps else "Calibration produced no measurements"
+        )
+
+    capacity = max(within_target, key=lambda s: s["users"])
+    memory_per_user_mb = (capacity["memory_mb"] - baseline["memory_mb"]) / capacity["users"]
+
+    return {
+        "script": script,
+        "machine_type": machine_type,
+        "calibrated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target_p95_ms": target_p95_ms,
+        "users_per_worker": capacity["users"],
+        "worker_cpu": round(capacity["cpu"], 3),
+        "worker_memory_mb": round(capacity["memory_mb"]),
+        "baseline_memory_mb": round(baseline["memory_mb"]),
+        "memory_per_user_mb": round(max(memory_per_user_mb, 0), 1),
+        "steps": steps
+    }
+
+
+def median_p95(samples):
+    """Returns the median of the p95 samples taken during a calibration step, or None if
+    there are no samples (no requests completed).
+    """
+
+    samples = [s for s in samples if s]
+
+    return statistics.median(samples) if samples else None
+
+
+def save_profile(profile, profile_file):
+    """Writes a calibration profile to a yaml file."""
+
+    profile_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(profile_file, "w") as f:
+        yaml.safe_dump(profile, f, sort_keys=False)
+
+
+def load_profile(profile_file):
+    """Reads a calibration profile from a yaml file. Returns None if there is no profile."""
+
+    if not profile_file.is_file():
+        return None
+
+    with open(profile_file) as f:
+        return yaml.safe_load(f)
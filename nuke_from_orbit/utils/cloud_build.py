@@ -1,11 +1,37 @@
+import base64
+import fnmatch
+import gzip
+import hashlib
+import io
+import os
 import tarfile
-import tempfile
 import time
 from pathlib import Path
+from google.auth import default as default_credentials
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud.devtools import cloudbuild
 from google.cloud import storage
 from google.api_core.exceptions import NotFound
 
+# files that end up in the build context but don't affect the image. More patterns
+# can be listed in a .nfoignore file at the root of the build context
+IGNORE_FILE = ".nfoignore"
+DEFAULT_IGNORE_PATTERNS = ["__pycache__/", "*.py[cod]", ".pytest_cache/", "*.egg-info/", ".DS_Store"]
+
+# source tarballs are uploaded in resumable chunks of this size (a multiple of 256KB)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# the parts of the build context that make up the base image
+BASE_IMAGE_PATHS = ["Dockerfile.base", "realbrowserlocusts"]
+
+# manifest types the registry may return for an image tag
+MANIFEST_TYPES = [
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.oci.image.index.v1+json"
+]
+
 
 def get_build_client(credentials=None):
     """Creates and returns a cloud build client. Credentials only needed
@@ -38,71 +64,321 @@ def get_or_create_bucket(bucket_name, storage_client):
     return bucket
 
 
-def upload_source(project, storage_client):
+def get_registry_session(credentials=None):
+    """Creates and returns an authorized http session for the container registry API.
+    Credentials only needed if the Auth environment variable is not set
+    """
+
+    if credentials is None:
+        credentials, _ = default_credentials(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+
+    session = AuthorizedSession(credentials)
+
+    return session
+
+
+def load_ignore_patterns(source_dir):
+    """Returns the ignore patterns of a build context: the defaults along with any listed
+    in its .nfoignore file. Blank lines and lines starting with # are skipped.
+    """
+
+    patterns = list(DEFAULT_IGNORE_PATTERNS)
+    ignore_file = Path(source_dir).joinpath(IGNORE_FILE)
+
+    if ignore_file.is_file():
+        for line in ignore_file.read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                patterns.append(line)
+
+    return patterns
+
+
+def is_ignored(relative_path, is_dir, patterns):
+    """Checks a path of the build context against ignore patterns. Like .gitignore, a
+    pattern containing a slash matches the whole relative path, others match the file
+    name at any depth, and a trailing slash only matches directories.
+    """
+
+    name = relative_path.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip("/")
+        if "/" in pattern:
+            if fnmatch.fnmatchcase(relative_path, pattern.lstrip("/")):
+                return True
+        elif fnmatch.fnmatchcase(name, pattern):
+            return True
+
+    return False
+
+
+def list_build_context(source_dir, include=None):
+    """Returns a sorted list of (relative path, path) tuples for every file and directory
+    in the build context that isn't ignored. The list can be limited to a list of files
+    and directories (relative to the source dir) with include.
+    """
+
+    source_dir = Path(source_dir)
+    patterns = load_ignore_patterns(source_dir)
+    entries = []
+
+    def included(relative_path):
+        if not include:
+            return True
+        # directories above an included path are listed too
+        return any(
+            relative_path == p or relative_path.startswith(f"{p}/") or p.startswith(f"{relative_path}/")
+            for p in include
+        )
+
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        relative_dir = Path(dirpath).relative_to(source_dir).as_posix()
+        prefix = "" if relative_dir == "." else f"{relative_dir}/"
+
+        # walk directories in a stable order and skip the ignored ones
+        dirnames[:] = sorted(
+            d for d in dirnames
+            if not is_ignored(f"{prefix}{d}", True, patterns) and included(f"{prefix}{d}")
+        )
+        for d in dirnames:
+            entries.append((f"{prefix}{d}", Path(dirpath).joinpath(d)))
+
+        for filename in filenames:
+            relative_path = f"{prefix}{filename}"
+            if not is_ignored(relative_path, False, patterns) and included(relative_path):
+                entries.append((relative_path, Path(dirpath).joinpath(filename)))
+
+    return sorted(entries)
+
+
+def hash_build_context(source_dir, include=None):
+    """Returns a sha256 hex digest of every file in the docker build context. Files are
+    hashed in a fixed order along with their relative paths and executable bit, so the
+    digest only changes when the content of the image would. The digest can be limited
+    to a list of files and directories (relative to the source dir) with include.
+    """
+
+    digest = hashlib.sha256()
+
+    for relative_path, path in list_build_context(source_dir, include):
+        if path.is_dir():
+            continue
+        executable = os.access(path, os.X_OK)
+        digest.update(f"{relative_path}\0{int(executable)}\0".encode())
+        digest.update(path.read_bytes())
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def write_source_tar(source_dir, fileobj):
+    """Streams a gzipped tarball of the build context into a writable file object. Entries
+    are written in a fixed order with fixed timestamps and owners, and permissions reduced
+    to the executable bit, so identical contents always produce identical bytes.
+    """
+
+    with gzip.GzipFile(filename="", mode="wb", fileobj=fileobj, mtime=0) as gz:
+        with tarfile.open(fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            for relative_path, path in list_build_context(source_dir):
+                info = tar.gettarinfo(str(path), arcname=relative_path)
+                info.mtime = 0
+                info.uid = info.gid = 0
+                info.uname = info.gname = ""
+                info.pax_headers = {}
+                if info.isdir() or os.access(path, os.X_OK):
+                    info.mode = 0o755
+                else:
+                    info.mode = 0o644
+                if info.isfile():
+                    with open(path, "rb") as f:
+                        tar.addfile(info, f)
+                else:
+                    tar.addfile(info)
+
+
+class _HashingWriter(io.RawIOBase):
+    """A write-only file object that only keeps the md5 of what is written to it."""
+
+    def __init__(self):
+        super().__init__()
+        self.md5 = hashlib.md5()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.md5.update(b)
+        return len(b)
+
+
+def source_md5(source_dir):
+    """Returns the base64 encoded md5 of the build context tarball, in the format cloud
+    storage reports object hashes in. The tarball is hashed as it is streamed, nothing is
+    written to disk.
+    """
+
+    writer = _HashingWriter()
+    write_source_tar(source_dir, writer)
+
+    return base64.b64encode(writer.md5.digest()).decode()
+
+
+def context_tag(digest):
+    """Returns the image tag used for a build context digest."""
+
+    return f"ctx-{digest[:24]}"
+
+
+def get_image_manifest(project, name, tag, registry_session):
+    """Fetches the manifest of an image tag from the project's container registry.
+    Returns a tuple of the raw manifest and its media type, or None if the tag
+    doesn't exist.
+    """
+
+    url = f"https://gcr.io/v2/{project}/{name}/manifests/{tag}"
+    resp = registry_session.get(url, headers={"Accept": ", ".join(MANIFEST_TYPES)})
+
+    # a missing repository is reported as not found (or denied in fresh projects)
+    if resp.status_code in (403, 404):
+        return None
+    resp.raise_for_status()
+
+    return (resp.content, resp.headers["Content-Type"])
+
+
+def tag_image(project, name, manifest, tag, registry_session):
+    """Adds a tag to an existing image by uploading its manifest (as returned by
+    get_image_manifest) under the new tag. No image data is copied.
+    """
+
+    content, media_type = manifest
+    url = f"https://gcr.io/v2/{project}/{name}/manifests/{tag}"
+    resp = registry_session.put(url, data=content, headers={"Content-Type": media_type})
+    resp.raise_for_status()
+
+    return resp
+
+
+def upload_source(project, storage_client, digest=None):
     """Uploads data for the docker container to cloud storage.
 
     This makes the data available for cloud build to use. The bucket used
-    is the same default that the gcloud builds submit command uses. Returns
-    a tuple of the bucket name and object (blob) name.
+    is the same default that the gcloud builds submit command uses. Blobs are
+    named after the build context digest if provided, or a timestamp otherwise.
+    The tarball is streamed straight into a resumable upload, and skipped if an
+    identical tarball (by md5) was already uploaded under the same name.
+    Returns a tuple of the bucket name and object (blob) name.
     """
 
     # A timestamp ensures a unique blob name
-    timestamp = int(time.time())
+    source_id = digest or int(time.time())
     bucket_name = f"{project}_cloudbuild"
-    blob_name = f"source/loadtest-source-{timestamp}.tgz"
+    blob_name = f"source/loadtest-source-{source_id}.tgz"
     bucket = get_or_create_bucket(bucket_name, storage_client)
-    blob = bucket.blob(blob_name)
+    blob = bucket.blob(blob_name, chunk_size=UPLOAD_CHUNK_SIZE)
 
     root_dir = Path(__file__).parent.parent.resolve()
     source_dir = root_dir.joinpath("docker-image")
 
-    # Creates the tgz file in a temp directory so it auto-deletes
-    with tempfile.TemporaryDirectory() as d:
-        source_tar = Path(d).joinpath("source.tgz")
-        with tarfile.open(source_tar, "w:gz") as tar:
-            tar.add(source_dir, arcname=".")
+    if blob.exists():
+        blob.reload()
+        if blob.md5_hash == source_md5(source_dir):
+            return (bucket_name, blob_name)
 
-        blob.upload_from_filename(source_tar)
+    with blob.open("wb", ignore_flush=True, content_type="application/gzip") as f:
+        write_source_tar(source_dir, f)
 
     return (bucket_name, blob_name)
 
 
-def build_test_image(name, project, image_tag, bucket, blob, build_client):
+def build_test_image(name, project, image_tag, bucket, blob, build_client, build_context_tag=None,
+                     base_tag="latest", build_base=True):
     """Creates the docker image used for the load test using cloud build. Once built,
-    the image is then uploaded to the GCP project's container registry. Returns the
-    job ID of the submitted operation which can be used to poll for job status.
+    the image is then uploaded to the GCP project's container registry. If a build
+    context tag is provided the image is tagged with it as well.
+
+    The image is built on top of a base image (Python, Chrome, locust and realbrowserlocusts)
+    named {name}-base:{base_tag}. If build_base is set the base image is built first, using
+    the latest base image as a layer cache, otherwise the existing base image is used as is.
+    Returns the long running operation of the build, whose metadata holds the build ID and
+    whose result is the finished build.
     """
 
-    # https://googleapis.dev/python/cloudbuild/latest/cloudbuild_v1/types.html
-    # https://cloud.google.com/cloud-build/docs/api/reference/rest/v1/projects.builds
-    build = {
-        "source": {
-            "storage_source": {
-                "bucket": bucket,
-                "object_": blob
-            }
-        },
-        "images": [f"gcr.io/{project}/{name}:{image_tag}"],
-        "steps": [
+    base_image = f"gcr.io/{project}/{name}-base:{base_tag}"
+    latest_base_image = f"gcr.io/{project}/{name}-base:latest"
+
+    images = [f"gcr.io/{project}/{name}:{image_tag}"]
+    if build_context_tag:
+        images.append(f"gcr.io/{project}/{name}:{build_context_tag}")
+
+    tag_args = []
+    for image in images:
+        tag_args.extend(["-t", image])
+
+    steps = []
+    if build_base:
+        base_images = list(dict.fromkeys([base_image, latest_base_image]))
+        base_tag_args = []
+        for image in base_images:
+            base_tag_args.extend(["-t", image])
+        images.extend(base_images)
+
+        steps.extend([
+            # the previous base image may not exist yet, which is fine
+            {
+                "name": "gcr.io/cloud-builders/docker",
+                "entrypoint": "bash",
+                "args": ["-c", f"docker pull {latest_base_image} || exit 0"]
+            },
             {
                 "name": "gcr.io/cloud-builders/docker",
                 "args": [
                     "build",
                     "--network",
                     "cloudbuild",
-                    "--no-cache",
-                    "-t",
-                    f"gcr.io/{project}/{name}:{image_tag}",
+                    "-f",
+                    "Dockerfile.base",
+                    "--cache-from",
+                    latest_base_image,
+                    *base_tag_args,
                     "."
                 ]
             }
-        ]
+        ])
+
+    steps.append(
+        {
+            "name": "gcr.io/cloud-builders/docker",
+            "args": [
+                "build",
+                "--network",
+                "cloudbuild",
+                "--build-arg",
+                f"BASE_IMAGE={base_image}",
+                *tag_args,
+                "."
+            ]
+        }
+    )
+
+    # https://googleapis.dev/python/cloudbuild/latest/cloudbuild_v1/types.html
+    # https://cloud.google.com/cloud-build/docs/api/reference/rest/v1/projects.builds
+    build = {
+        "source": {
+            "storage_source": {
+                "bucket": bucket,
+                "object_": blob
+            }
+        },
+        "images": images,
+        "steps": steps
     }
 
     request = cloudbuild.CreateBuildRequest(project_id=project, build=build)
-    task = build_client.create_build(request=request)
-
-    return task.metadata.build.id
+    return build_client.create_build(request=request)
 
 
 def build_status(build_id, project, build_client):
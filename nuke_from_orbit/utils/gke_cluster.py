@@ -1,7 +1,17 @@
 import googleapiclient.discovery
 import subprocess
+from google.api_core.exceptions import NotFound
 from google.cloud import container_v1
 
+# the node pool that runs the load test pods
+NODE_POOL_NAME = "load-test-pool"
+
+# the optional node pool that runs the master and monitoring, away from the workers
+CONTROL_POOL_NAME = "control-pool"
+
+# node label (and worker taint) the rendered templates select pools by
+POOL_LABEL = "nfo-pool"
+
 
 def get_gke_client(credentials=None):
     """Creates and returns a gke client. Credentials only needed
@@ -23,15 +33,15 @@ def get_compute_client(credentials=None):
     return client
 
 
-def create_zonal_disk(name, project, zone, client):
+def create_zonal_disk(name, project, zone, client, size_gb=50):
     """Creates a persistant disk in the specified zone. This is suitable for use as
-    a persistant volume for Prometheus data. Returns an operation id that can be
-    used to track the job progress.
+    a persistant volume for Prometheus data or recorded latency samples. Returns an
+    operation id that can be used to track the job progress.
     """
 
     # https://cloud.google.com/compute/docs/reference/rest/v1/disks/get
 
-    body = {"name": name, "sizeGb": 50}
+    body = {"name": name, "sizeGb": size_gb}
     zonal_disk = client.disks()
     request = zonal_disk.insert(project=project, zone=zone, body=body)
     response = request.execute()
@@ -79,6 +89,20 @@ def compute_zonal_task_status(task_name, project, zone, client):
     return response["status"]
 
 
+def wait_compute_zonal_task(task_name, project, zone, client):
+    """Waits on a compute zonal operation with the operation wait endpoint, which returns as
+    soon as the operation is done (or after about two minutes). Returns a dict of the operation
+    which includes the 'status' and, should the operation have failed, an 'error'.
+    """
+
+    # https://cloud.google.com/compute/docs/reference/rest/v1/zoneOperations/wait
+    zonal_operations = client.zoneOperations()
+    request = zonal_operations.wait(project=project, zone=zone, operation=task_name)
+    response = request.execute()
+
+    return response
+
+
 def create_global_ip(name, project, client):
     """Creates a global ip address suitable for use with GKE ingress controller.
     Returns a job ID that can be used to track the status of the address creation.
@@ -120,6 +144,20 @@ def compute_task_status(task_name, project, client):
     return response["status"]
 
 
+def wait_compute_task(task_name, project, client):
+    """Waits on a compute global operation with the operation wait endpoint, which returns as
+    soon as the operation is done (or after about two minutes). Returns a dict of the operation
+    which includes the 'status' and, should the operation have failed, an 'error'.
+    """
+
+    # https://cloud.google.com/compute/docs/reference/rest/v1/globalOperations/wait
+    global_operations = client.globalOperations()
+    request = global_operations.wait(project=project, operation=task_name)
+    response = request.execute()
+
+    return response
+
+
 def fetch_ip_address(name, project, client):
     """Fetches the actual IP address once the global address creation has successfully
     completed. Accepts the name provided in the initial request and returns a string of
@@ -133,13 +171,62 @@ def fetch_ip_address(name, project, client):
     return response["address"]
 
 
-def setup_gke_cluster(name, project, zone, node_count, machine_type, client):
-    """Creates a GKE compute cluster. Returns a job ID that can be used to track
-    the status of the cluster creation.
+def node_pool_autoscaling(node_count, max_node_count=None):
+    """Returns the autoscaling settings of the load test node pool. With a max node count
+    the pool is autoscaled between the configured node count and the max, otherwise it
+    keeps a fixed size.
+    """
+
+    if not max_node_count:
+        return {"enabled": False}
+
+    return {
+        "enabled": True,
+        "min_node_count": node_count,
+        "max_node_count": max_node_count
+    }
+
+
+def setup_gke_cluster(name, project, zone, node_count, machine_type, client, max_node_count=None,
+                      control_machine_type=None, control_node_count=1, preemptible=False):
+    """Creates a GKE compute cluster. If a max node count is given the node pool is
+    autoscaled up to that many nodes, and with preemptible set it runs on preemptible VMs.
+    If a control machine type is given a separate control pool is created for the master
+    and monitoring, and the load test pool is tainted so that only workers are scheduled on
+    it. Returns a job ID that can be used to track the status of the cluster creation.
     """
 
     parent = f"projects/{project}/locations/{zone}"
 
+    oauth_scopes = ["https://www.googleapis.com/auth/cloud-platform"]
+
+    worker_pool = {
+        "name": NODE_POOL_NAME,
+        "initial_node_count": node_count,
+        "autoscaling": node_pool_autoscaling(node_count, max_node_count),
+        "config": {
+            "machine_type": machine_type,
+            "oauth_scopes": oauth_scopes
+        }
+    }
+    node_pools = [worker_pool]
+
+    if preemptible:
+        worker_pool["config"]["preemptible"] = True
+
+    if control_machine_type:
+        worker_pool["config"]["labels"] = {POOL_LABEL: "workers"}
+        worker_pool["config"]["taints"] = [{"key": POOL_LABEL, "value": "workers", "effect": "NO_SCHEDULE"}]
+        node_pools.append({
+            "name": CONTROL_POOL_NAME,
+            "initial_node_count": control_node_count,
+            "config": {
+                "machine_type": control_machine_type,
+                "labels": {POOL_LABEL: "control"},
+                "oauth_scopes": oauth_scopes
+            }
+        })
+
     # https://googleapis.dev/python/container/latest/container_v1/types.html
     # https://cloud.google.com/kubernetes-engine/docs/reference/rest/v1/projects.locations.clusters#Cluster
     cluster = {
@@ -147,18 +234,7 @@ def setup_gke_cluster(name, project, zone, node_count, machine_type, client):
         "release_channel": {
             "channel": "REGULAR"
         },
-        "node_pools": [
-            {
-                "name": "load-test-pool",
-                "initial_node_count": node_count,
-                "config": {
-                    "machine_type": machine_type,
-                    "oauth_scopes": [
-                        "https://www.googleapis.com/auth/cloud-platform"
-                    ]
-                }
-            }
-        ]
+        "node_pools": node_pools
     }
 
     request = container_v1.types.CreateClusterRequest(parent=parent, cluster=cluster)
@@ -167,6 +243,45 @@ def setup_gke_cluster(name, project, zone, node_count, machine_type, client):
     return task.name
 
 
+def get_gke_cluster(name, project, zone, client):
+    """Fetches a GKE cluster. Returns the cluster object, or None if the cluster doesn't exist."""
+
+    cluster_name = f"projects/{project}/locations/{zone}/clusters/{name}"
+    request = container_v1.types.GetClusterRequest(name=cluster_name)
+
+    try:
+        cluster = client.get_cluster(request=request)
+    except NotFound:
+        return None
+
+    return cluster
+
+
+def resize_node_pool(name, project, zone, node_count, client, pool_name=NODE_POOL_NAME):
+    """Sets the number of nodes in one of the cluster's node pools. Nodes are added or
+    removed without touching the rest of the cluster. Returns a job ID that can be used
+    to track the status of the resize.
+    """
+
+    pool = f"projects/{project}/locations/{zone}/clusters/{name}/nodePools/{pool_name}"
+    request = container_v1.types.SetNodePoolSizeRequest(name=pool, node_count=node_count)
+    task = client.set_node_pool_size(request=request)
+
+    return task.name
+
+
+def set_node_pool_autoscaling(name, project, zone, autoscaling, client, pool_name=NODE_POOL_NAME):
+    """Changes the autoscaling settings (see node_pool_autoscaling) of one of the cluster's
+    node pools. Returns a job ID that can be used to track the status of the update.
+    """
+
+    pool = f"projects/{project}/locations/{zone}/clusters/{name}/nodePools/{pool_name}"
+    request = container_v1.types.SetNodePoolAutoscalingRequest(name=pool, autoscaling=autoscaling)
+    task = client.set_node_pool_autoscaling(request=request)
+
+    return task.name
+
+
 def delete_gke_cluster(name, project, zone, client):
     """Deletes a GKE cluster. Returns a job ID that can be used to track the
     status of the cluster deletion.
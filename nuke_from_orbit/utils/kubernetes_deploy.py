@@ -1,14 +1,185 @@
-from kubernetes import client, config, utils
+import base64
+import concurrent.futures
+import json
+import threading
+import requests
+import yaml
+from kubernetes import client, config, dynamic, utils, watch
 from kubernetes.client.rest import ApiException
-from time import sleep, time
+from kubernetes.utils import parse_quantity
+from time import monotonic
+
+# server-side apply records which fields each manager owns
+FIELD_MANAGER = "nuke-from-orbit"
+
+# connections kept open to the API server, enough for every parallel apply
+CONNECTION_POOL_SIZE = 16
+
+# the clients shared by every helper, created on first use
+_clients = {}
+_clients_lock = threading.Lock()
+_discovery_lock = threading.Lock()
+
+
+class ManifestApplyError(Exception):
+    """Exception raised if one or more manifests could not be applied."""
+
+    def __init__(self, failures, message="Failed to apply manifests!"):
+        self.failures = failures
+        details = "\n".join(f"  {name}: {error}" for name, error in failures)
+        self.message = f"{message}\n{details}"
+        super().__init__(self.message)
+
+
+class DeploymentTimeoutError(Exception):
+    """Exception raised if deployments have not rolled out by the timeout."""
+
+    def __init__(self, deployments, timeout, message="Timed out waiting for deployments!"):
+        self.deployments = deployments
+        self.timeout = timeout
+        self.message = f"{message} {', '.join(deployments)} not ready after {timeout} seconds"
+        super().__init__(self.message)
+
+
+def get_api_client():
+    """Returns the kubernetes ApiClient shared by every helper in this module. The kubeconfig
+    is only loaded the first time, and the client keeps its connections (and auth token,
+    which it refreshes when it expires) for the rest of the session.
+    """
+
+    with _clients_lock:
+        if "api" not in _clients:
+            configuration = client.Configuration()
+            config.load_kube_config(client_configuration=configuration)
+            configuration.connection_pool_maxsize = CONNECTION_POOL_SIZE
+            _clients["api"] = client.ApiClient(configuration)
+
+        return _clients["api"]
+
+
+def get_dynamic_client():
+    """Returns a dynamic client on top of the shared ApiClient. API discovery is done once
+    and cached with it.
+    """
+
+    api_client = get_api_client()
+
+    with _clients_lock:
+        if "dynamic" not in _clients:
+            _clients["dynamic"] = dynamic.DynamicClient(api_client)
+
+        return _clients["dynamic"]
+
+
+def reset_clients():
+    """Drops the shared clients so the next call loads the kubeconfig again, e.g. after
+    switching the kubernetes context.
+    """
+
+    with _clients_lock:
+        api_client = _clients.pop("api", None)
+        session = _clients.pop("http", None)
+        _clients.clear()
+
+    if api_client is not None:
+        api_client.close()
+    if session is not None:
+        session.close()
 
 
 def deploy_from_yaml(yaml_file, namespace="default"):
     """Deploys a multi-part yaml manifest to kubernetes"""
 
-    config.load_kube_config()
-    k8_client = client.ApiClient()
-    utils.create_from_yaml(k8_client, yaml_file, namespace=namespace)
+    utils.create_from_yaml(get_api_client(), yaml_file, namespace=namespace)
+
+
+def load_manifests(yaml_files):
+    """Reads every document from a list of (multi-part) yaml files and returns them as a
+    list of dicts, in file order. Empty documents are skipped.
+    """
+
+    manifests = []
+    for yaml_file in yaml_files:
+        with open(yaml_file) as f:
+            manifests.extend(doc for doc in yaml.safe_load_all(f) if doc)
+
+    return manifests
+
+
+def manifest_name(manifest):
+    """Returns a kubectl style name for a manifest, e.g. deployment/lm-pod"""
+
+    return f"{manifest['kind'].lower()}/{manifest['metadata']['name']}"
+
+
+def apply_manifest(manifest, resource, dynamic_client, namespace="default"):
+    """Server-side applies a single manifest dict, creating the object or updating the
+    fields this tool manages. Namespaced objects go to the namespace set in the manifest,
+    or the given namespace if it has none. Returns the applied object.
+    """
+
+    # https://kubernetes.io/docs/reference/using-api/server-side-apply/
+    # an apply patch is a plain PATCH with its own content type. The body is sent as json (which
+    # is valid yaml) and the field manager and force flags as query params, which every client
+    # version passes through
+    resp = dynamic_client.patch(
+        resource,
+        body=json.dumps(manifest),
+        name=manifest["metadata"]["name"],
+        namespace=manifest["metadata"].get("namespace", namespace) if resource.namespaced else None,
+        content_type="application/apply-patch+yaml",
+        query_params=[("fieldManager", FIELD_MANAGER), ("force", "true")]
+    )
+
+    return resp
+
+
+def apply_objects(manifests, namespace="default", max_workers=8):
+    """Server-side applies a list of manifest dicts with the shared client. Manifests are
+    independent of each other so they are applied in parallel. Every manifest is attempted
+    and a ManifestApplyError listing the ones that failed is raised at the end.
+    Returns a list of the applied objects.
+    """
+
+    dynamic_client = get_dynamic_client()
+
+    # resolve the api resources up front, discovery results are cached by the client
+    with _discovery_lock:
+        resources = [
+            dynamic_client.resources.get(api_version=m["apiVersion"], kind=m["kind"])
+            for m in manifests
+        ]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(apply_manifest, m, r, dynamic_client, namespace): manifest_name(m)
+            for m, r in zip(manifests, resources)
+        }
+
+        applied = []
+        failures = []
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                applied.append(future.result())
+                print(f"{name} applied")
+            except Exception as e:
+                failures.append((name, e))
+
+    if failures:
+        raise ManifestApplyError(failures)
+
+    return applied
+
+
+def apply_manifests(yaml_files, namespace="default", max_workers=8):
+    """Server-side applies every manifest in a list of yaml files, the equivalent of
+    `kubectl apply --server-side -f` for each file. See apply_objects.
+    """
+
+    manifests = load_manifests(yaml_files)
+
+    return apply_objects(manifests, namespace, max_workers)
 
 
 def get_deployment(deployment_name, namespace="default"):
@@ -16,55 +187,128 @@ def get_deployment(deployment_name, namespace="default"):
     Can be used to extract relevant metadata such as the version tag.
     """
 
-    config.load_kube_config()
-
-    with client.ApiClient() as api_client:
-        api_instance = client.AppsV1Api(api_client)
-        resp = api_instance.read_namespaced_deployment(deployment_name, namespace)
+    api_instance = client.AppsV1Api(get_api_client())
+    resp = api_instance.read_namespaced_deployment(deployment_name, namespace)
 
     return resp
 
 
+def deployment_ready(deployment):
+    """Checks whether a deployment object has finished rolling out: the controller has
+    seen the latest spec and every replica is updated and available.
+    """
+
+    dstatus = deployment.status
+
+    # parsing a bunch of info for easy comparison
+    spec_replicas = deployment.spec.replicas
+    spec_generation = deployment.metadata.generation
+
+    ds_replicas = dstatus.replicas or 0
+    ds_updated = dstatus.updated_replicas or 0
+    ds_available = dstatus.available_replicas or 0
+    ds_generation = dstatus.observed_generation or 0
+
+    # creating booleans for relevant comparisons
+    updated_replica_match = ds_updated == spec_replicas
+    replica_match = ds_replicas == spec_replicas
+    available_replica_match = ds_available == spec_replicas
+    generation_match = ds_generation >= spec_generation
+
+    return updated_replica_match and replica_match and available_replica_match and generation_match
+
+
 def wait_for_deployment(deployment_name, namespace="default", timeout=60):
-    """Polls for the status of a given deployment. When successful, a success message is
+    """Waits for a given deployment to roll out. When successful, a success message is
     printed and boolean True is returned. If deployment is not ready by the specified
-    timeout argument (default 60 seconds) a timeout exception is thrown.
+    timeout argument (default 60 seconds) a DeploymentTimeoutError is raised.
+    """
+
+    return wait_for_deployments([deployment_name], namespace, timeout)
+
+
+def check_deployment(deployment, pending):
+    """Accepts a deployment object and the set of deployment names still being waited on.
+    Prints the rollout progress of a pending deployment and drops it from the set once it
+    is ready.
     """
 
-    config.load_kube_config()
+    name = deployment.metadata.name
+    if name not in pending:
+        return
+    if deployment_ready(deployment):
+        pending.discard(name)
+        print(f"Deployment {name} ready!")
+    else:
+        dstatus = deployment.status
+        print(
+            f"{name} replicas: {dstatus.replicas}. Updated: {dstatus.updated_replicas}. "
+            f"Available: {dstatus.available_replicas}"
+        )
 
-    with client.ApiClient() as api_client:
-        api_instance = client.AppsV1Api(api_client)
-        start = time()
-        while time() - start < timeout:
-            sleep(2)
-            resp = api_instance.read_namespaced_deployment(deployment_name, namespace)
-            dstatus = resp.status
 
-            # parsing a bunch of info for easy comparison
-            spec_replicas = resp.spec.replicas
-            spec_generation = resp.metadata.generation
+def follow_deployments(api_instance, namespace, pending, resource_version, timeout):
+    """Brings the pending deployments up to date once. Without a resourceVersion the
+    deployments are listed, otherwise a watch is resumed from that version until it ends,
+    the timeout (in seconds) passes or nothing is pending. Returns the resourceVersion to
+    carry on from, or None if it has expired and the deployments must be listed again.
+    """
 
-            ds_replicas = dstatus.replicas
-            ds_updated = dstatus.updated_replicas
-            ds_available = dstatus.available_replicas
-            ds_generation = dstatus.observed_generation
+    if resource_version is None:
+        deployments = api_instance.list_namespaced_deployment(namespace)
+        for deployment in deployments.items:
+            check_deployment(deployment, pending)
+        return deployments.metadata.resource_version
+
+    deployment_watch = watch.Watch()
+    try:
+        for event in deployment_watch.stream(
+            api_instance.list_namespaced_deployment,
+            namespace,
+            resource_version=resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=timeout
+        ):
+            resource_version = deployment_watch.resource_version or resource_version
+            if event["type"] in ("ADDED", "MODIFIED"):
+                check_deployment(event["object"], pending)
+            if not pending:
+                deployment_watch.stop()
+    except ApiException as e:
+        # 410 Gone: the resourceVersion is too old to resume from
+        if e.status != 410:
+            raise
+        return None
+
+    return resource_version
+
+
+def wait_for_deployments(deployment_names, namespace="default", timeout=60):
+    """Waits for a list of deployments to roll out at the same time. The deployments are
+    listed once and then followed with a single watch on the namespace, so every change is
+    pushed by the API server and each deployment is reported ready the moment it is, however
+    many replicas it has. Watches that end (the server closes them periodically) are resumed
+    from the last seen resourceVersion, and the deployments are listed again should that
+    version have expired. Returns True once all deployments are ready, and raises a
+    DeploymentTimeoutError naming the ones that aren't if the timeout (in seconds) passes.
+    """
 
-            # creating booleans for relevant comparisons
-            updated_replica_match = ds_updated == spec_replicas
-            replica_match = ds_replicas == spec_replicas
-            available_replica_match = ds_available == spec_replicas
-            generation_match = ds_generation >= spec_generation
+    deadline = monotonic() + timeout
+    pending = set(deployment_names)
+    resource_version = None
 
-            # checking if the deployment is ready
-            if (updated_replica_match and replica_match and available_replica_match and generation_match):
-                print("Deployment ready!")
-                return True
-            else:
-                print(f"Replicas: {ds_replicas}. Updated: {ds_updated}. Available: {ds_available}")
+    api_instance = client.AppsV1Api(get_api_client())
 
-        # TODO: generate and throw an actual exception
-        print("Timeout!")
+    while pending:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise DeploymentTimeoutError(sorted(pending), timeout)
+
+        resource_version = follow_deployments(
+            api_instance, namespace, pending, resource_version, max(1, int(remaining))
+        )
+
+    return True
 
 
 def deploy_secret(secret_name, secret_data, namespace="default"):
@@ -78,8 +322,7 @@ def deploy_secret(secret_name, secret_data, namespace="default"):
     api_version = "v1"
     kind = "Secret"
 
-    config.load_kube_config()
-    k8 = client.CoreV1Api()
+    k8 = client.CoreV1Api(get_api_client())
     body = client.V1Secret(api_version=api_version, kind=kind, metadata=secret_metadata, string_data=secret_data)
 
     # Try the post request. If it fails, handle the 409 response by trying a patch request instead
@@ -93,11 +336,126 @@ def deploy_secret(secret_name, secret_data, namespace="default"):
     return resp
 
 
+def secret_manifest(secret_name, secret_data, namespace="default"):
+    """Returns the manifest dict of an opaque secret holding the values of secret_data."""
+
+    data = {key: base64.b64encode(value.encode()).decode() for key, value in secret_data.items()}
+
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "type": "Opaque",
+        "metadata": {"name": secret_name, "namespace": namespace},
+        "data": data
+    }
+
+
+def deploy_secrets(secrets, namespace="default"):
+    """Creates or updates several secrets in one batch. The secrets param must be a dict
+    of secret names and secret_data dicts, as accepted by deploy_secret. The secrets are
+    server-side applied in parallel, so existing secrets are updated in a single request
+    rather than after a rejected create. Returns a list of the applied secrets.
+    """
+
+    manifests = [secret_manifest(name, data, namespace) for name, data in secrets.items()]
+
+    return apply_objects(manifests, namespace)
+
+
+def deploy_config_map(config_map_name, config_map_data, namespace="default"):
+    """Creates or replaces a config map with the values specified in the config_map_data
+    param. Like secrets, this param must be a dict of entry names and values. If the config
+    map already exists it is replaced so that removed entries disappear as well. Returns
+    the config map object that has been created/replaced.
+    """
+
+    config_map_metadata = {"name": config_map_name, "namespace": "default"}
+    api_version = "v1"
+    kind = "ConfigMap"
+
+    k8 = client.CoreV1Api(get_api_client())
+    body = client.V1ConfigMap(api_version=api_version, kind=kind, metadata=config_map_metadata, data=config_map_data)
+
+    # Try the post request. If it fails, handle the 409 response by trying a replace request instead
+    try:
+        resp = k8.create_namespaced_config_map(namespace, body)
+    except ApiException as e:
+        if e.status == 409:
+            print("Config map already exists! Updating...")
+            resp = k8.replace_namespaced_config_map(name=config_map_name, namespace=namespace, body=body)
+        else:
+            raise
+
+    return resp
+
+
 def delete_deployment(deployment_name):
     """Deletes a deployment - usually as a part of a config refresh."""
 
-    config.load_kube_config()
+    api_instance = client.AppsV1Api(get_api_client())
+    api_instance.delete_namespaced_deployment(deployment_name, "default")
+
+
+def scale_deployment(deployment_name, replicas, namespace="default"):
+    """Sets the number of replicas of a deployment without touching the rest of its spec."""
+
+    api_instance = client.AppsV1Api(get_api_client())
+    body = {"spec": {"replicas": replicas}}
+    resp = api_instance.patch_namespaced_deployment_scale(deployment_name, namespace, body)
+
+    return resp
+
+
+def get_pod_usage(label_selector, namespace="default"):
+    """Fetches the current cpu and memory use of the pods matching a label selector from
+    the metrics API (the same numbers as `kubectl top pods`). Metrics are sampled by the
+    cluster every 15 to 60 seconds. Returns a dict of pod names and dicts with the cpu
+    use in cores and memory use in MB, summed over the pod's containers.
+    """
+
+    api_instance = client.CustomObjectsApi(get_api_client())
+    resp = api_instance.list_namespaced_custom_object(
+        "metrics.k8s.io", "v1beta1", namespace, "pods", label_selector=label_selector
+    )
+
+    usage = {}
+    for pod in resp["items"]:
+        containers = [c["usage"] for c in pod["containers"]]
+        usage[pod["metadata"]["name"]] = {
+            "cpu": float(sum(parse_quantity(c["cpu"]) for c in containers)),
+            "memory_mb": float(sum(parse_quantity(c["memory"]) for c in containers)) / 1024 ** 2
+        }
+
+    return usage
+
+
+def proxy_service_request(service_name, path, method="GET", fields=None, port=80, namespace="default",
+                          binary=False):
+    """Sends an http request to a service inside the cluster through the API server's
+    service proxy, so no port-forward or external ingress is needed. Fields are sent
+    form encoded. The request reuses the shared client's server, credentials and a pooled
+    http session. Returns the response body as a string, or as bytes if binary is set.
+    """
+
+    configuration = get_api_client().configuration
+
+    with _clients_lock:
+        if "http" not in _clients:
+            _clients["http"] = requests.Session()
+        session = _clients["http"]
+
+    url = f"{configuration.host}/api/v1/namespaces/{namespace}/services/{service_name}:{port}/proxy/{path}"
+
+    # refreshes the token first if it has expired
+    headers = {}
+    token = configuration.get_api_key_with_prefix("authorization")
+    if token:
+        headers["Authorization"] = token
+
+    cert = (configuration.cert_file, configuration.key_file) if configuration.cert_file else None
+    verify = configuration.ssl_ca_cert or configuration.verify_ssl
+
+    resp = session.request(method, url, data=fields, headers=headers, cert=cert, verify=verify, timeout=60)
+    resp.raise_for_status()
 
-    with client.ApiClient() as api_client:
-        api_instance = client.AppsV1Api(api_client)
-        api_instance.delete_namespaced_deployment(deployment_name, "default")
+    return resp.content if binary else resp.text
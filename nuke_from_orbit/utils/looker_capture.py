@@ -0,0 +1,184 @@
+import os
+import json
+import looker_sdk
+from looker_sdk import models40 as models
+
+PLAN_VERSION = 1
+
+# the parts of a query that determine its results
+QUERY_FIELDS = [
+    "model",
+    "view",
+    "fields",
+    "pivots",
+    "fill_fields",
+    "filters",
+    "filter_expression",
+    "sorts",
+    "limit",
+    "column_limit",
+    "total",
+    "row_total",
+    "subtotals",
+    "dynamic_fields",
+    "query_timezone"
+]
+
+
+def get_looker_sdk(host, client_id, client_secret):
+    """Creates and returns a Looker API 4.0 client authenticated with the provided
+    API3 credentials.
+    """
+
+    # the sdk reads its settings from the environment when no ini file is present
+    os.environ["LOOKERSDK_BASE_URL"] = host
+    os.environ["LOOKERSDK_CLIENT_ID"] = client_id
+    os.environ["LOOKERSDK_CLIENT_SECRET"] = client_secret
+
+    sdk = looker_sdk.init40()
+
+    return sdk
+
+
+def fetch_dashboard(dashboard_id, sdk):
+    """Fetches a dashboard along with its elements, filters and layouts."""
+
+    dashboard = sdk.dashboard(str(dashboard_id))
+
+    return dashboard
+
+
+def tile_query(element):
+    """Returns the query behind a dashboard element, whether it's a query tile,
+    a look tile or a result maker. Returns None for elements that don't run a single
+    query (e.g. text tiles or merged results).
+    """
+
+    if element.query:
+        return element.query
+    if element.look and element.look.query:
+        return element.look.query
+    if element.result_maker and element.result_maker.query:
+        return element.result_maker.query
+
+    return None
+
+
+def tile_filter_fields(element):
+    """Returns a dict mapping dashboard filter names to the fields they filter
+    on for the provided dashboard element.
+    """
+
+    listens = {}
+    filterables = (element.result_maker.filterables if element.result_maker else None) or []
+    for filterable in filterables:
+        for listen in filterable.listen or []:
+            listens[listen.dashboard_filter_name] = listen.field
+
+    return listens
+
+
+def layout_positions(dashboard):
+    """Returns a dict mapping element ids to their (row, column) in the dashboard's
+    active layout. Elements without a position are left out.
+    """
+
+    positions = {}
+    layouts = dashboard.dashboard_layouts or []
+    active = [layout for layout in layouts if layout.active] or layouts[:1]
+    for layout in active:
+        for component in layout.dashboard_layout_components or []:
+            positions[component.dashboard_element_id] = (component.row or 0, component.column or 0)
+
+    return positions
+
+
+def resolve_filters(dashboard, filter_overrides=None):
+    """Returns a dict of dashboard filter names and the value each filter will be run
+    with. Values default to the dashboard's default filter values and can be overridden
+    with the filter_overrides dict.
+    """
+
+    filter_values = {f.name: f.default_value for f in dashboard.dashboard_filters or []}
+    filter_values.update(filter_overrides or {})
+
+    return {name: value for name, value in filter_values.items() if value}
+
+
+def resolve_tiles(dashboard, filter_values):
+    """Accepts a dashboard and the filter values to apply and returns the list of tiles
+    that run queries, in the order the dashboard lays them out. Each tile is a dict with
+    the element id, title, layout group (row) and the query body with dashboard filters
+    applied. Returns a tuple of the tile list and the number of skipped elements.
+    """
+
+    positions = layout_positions(dashboard)
+    tiles = []
+    skipped = 0
+
+    for index, element in enumerate(dashboard.dashboard_elements or []):
+        query = tile_query(element)
+        if query is None:
+            skipped += 1
+            continue
+
+        body = {field: getattr(query, field, None) for field in QUERY_FIELDS}
+        body = {k: v for k, v in body.items() if v is not None}
+        filters = dict(body.get("filters") or {})
+        for filter_name, field in tile_filter_fields(element).items():
+            if filter_name in filter_values:
+                filters[field] = filter_values[filter_name]
+        if filters:
+            body["filters"] = filters
+
+        row, column = positions.get(element.id, (index, 0))
+        tiles.append({
+            "id": element.id,
+            "title": element.title or element.title_text or f"tile {element.id}",
+            "group": row,
+            "column": column,
+            "query": body
+        })
+
+    tiles.sort(key=lambda tile: (tile["group"], tile["column"]))
+
+    return tiles, skipped
+
+
+def capture_dashboard(dashboard_id, sdk, filter_overrides=None, max_concurrency=6, count_rows=True):
+    """Resolves a dashboard into a replay plan. Every tile's filtered query is created
+    on the instance so it can be replayed by id, and optionally run once to record the
+    expected row count. Returns the plan as a dict.
+    """
+
+    dashboard = fetch_dashboard(dashboard_id, sdk)
+    filter_values = resolve_filters(dashboard, filter_overrides)
+    tiles, skipped = resolve_tiles(dashboard, filter_values)
+
+    for tile in tiles:
+        query = sdk.create_query(models.WriteQuery(**tile["query"]))
+        tile["query_id"] = query.id
+        tile["slug"] = query.slug
+        if count_rows:
+            rows = json.loads(sdk.run_query(query.id, "json"))
+            tile["expected_rows"] = len(rows)
+
+    plan = {
+        "version": PLAN_VERSION,
+        "dashboard_id": str(dashboard_id),
+        "title": dashboard.title,
+        "filters": filter_values,
+        "max_concurrency": max_concurrency,
+        "skipped_elements": skipped,
+        "tiles": tiles
+    }
+
+    return plan
+
+
+def write_plan(plan, plan_file):
+    """Writes a replay plan to the provided path as json."""
+
+    plan_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(plan_file, "w") as f:
+        json.dump(plan, f, indent=2, sort_keys=True)
@@ -1,15 +1,34 @@
-import os
+import concurrent.futures
+import json
+import random
 import yaml
 import subprocess
 import shutil
+from google.api_core.exceptions import GoogleAPICallError
 from googleapiclient.errors import HttpError
 from pathlib import Path
 from jinja2 import Template
-from nuke_from_orbit.utils import gke_cluster, cloud_build, kubernetes_deploy
-from time import sleep
+from nuke_from_orbit.utils import gke_cluster, cloud_build, kubernetes_deploy, looker_capture, capacity, results
+from time import sleep, monotonic
 
 SCRIPT_PATH = Path(__file__).parent
-APPLY_COMMAND = ["kubectl", "apply", "-f"]
+REPLAY_PLAN_PATH = SCRIPT_PATH.parent.parent.joinpath("locust_test_scripts", "replay_plans")
+CONTENT_MIX_PATH = SCRIPT_PATH.parent.parent.joinpath("locust_test_scripts", "content_mixes")
+CALIBRATION_PATH = SCRIPT_PATH.parent.parent.joinpath("locust_test_scripts", "calibrations")
+RESULTS_PATH = SCRIPT_PATH.parent.parent.joinpath("results")
+RESULTS_DISK_SUFFIX = "-results"
+SCRIPT_CONFIG_MAP = "locust-scripts"
+
+# how long (in seconds) to wait on long running operations before giving up
+OPERATION_TIMEOUT = 1800
+DISK_OPERATION_TIMEOUT = 300
+IP_OPERATION_TIMEOUT = 300
+
+# cloud build statuses that mean the build is over without success
+BUILD_FAILURE_STATUSES = {"FAILURE", "INTERNAL_ERROR", "TIMEOUT", "CANCELLED", "EXPIRED"}
+
+# how long (in seconds) to wait on the locust deployments to roll out
+ROLLOUT_TIMEOUT = 600
 
 
 class BColors:
@@ -62,6 +81,32 @@ class TagMatchError(Exception):
         return f"{BColors.FAIL}{self.message}{BColors.ENDC}"
 
 
+class OperationFailedError(Exception):
+    """Exception raised if a long running operation finishes without success."""
+
+    def __init__(self, operation, detail, message="Operation failed!"):
+        self.operation = operation
+        self.detail = detail
+        self.message = f"{message} {operation}: {detail}"
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{BColors.FAIL}{self.message}{BColors.ENDC}"
+
+
+class OperationTimeoutError(Exception):
+    """Exception raised if a long running operation isn't done in time."""
+
+    def __init__(self, operation, timeout, message="Operation timed out!"):
+        self.operation = operation
+        self.timeout = timeout
+        self.message = f"{message} {operation} not done after {timeout} seconds"
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{BColors.FAIL}{self.message}{BColors.ENDC}"
+
+
 def check_required_args(user_config, external=False):
     """Checks a user config dict against required args and throws an error if any are missing.
     Returns a 1 if all required args are present.
@@ -94,21 +139,81 @@ def check_required_args(user_config, external=False):
 
 def check_worker_count(user_config):
     """Accepts a dict of user configs and confirms if the worker count is valid. If
-    the specified number of workers exceeds what the cluster can handle an exception
-    is thrown. Returns a 1 if worker count is acceptable.
+    the specified number of workers exceeds what the cluster can schedule an exception
+    is thrown. When autoscaling, the max worker count is checked against the max node
+    count as well. With a separate control pool the worker nodes are left to the workers,
+    and a warning is printed if the control pool looks too small for the master and
+    monitoring. Machine types whose resources can't be worked out are skipped with a
+    warning. Returns a 1 if worker count is acceptable.
     """
 
-    cores = int(user_config["gcp_cluster_machine_type"].split("-")[-1])
+    machine_type = user_config["gcp_cluster_machine_type"]
     node_count = int(user_config["gcp_cluster_node_count"])
     requested_workers = int(user_config["loadtest_worker_count"])
+    worker_cpu = float(user_config.get("loadtest_worker_cpu") or capacity.WORKER_CPU)
+    worker_memory_mb = int(user_config.get("loadtest_worker_memory_mb") or capacity.WORKER_MEMORY_MB)
+
+    control_machine_type = user_config.get("gcp_control_machine_type")
+    control_node_count = int(user_config.get("gcp_control_node_count") or 1)
+
+    unknown_types = [t for t in (machine_type, control_machine_type) if t and not capacity.known_machine_type(t)]
+    if unknown_types:
+        print(
+            f"{BColors.WARNING}Can't work out the resources of {', '.join(unknown_types)} nodes. "
+            f"Skipping the worker count check.{BColors.ENDC}"
+        )
+        return 1
+
+    checks = [(requested_workers, node_count)]
+    if user_config.get("loadtest_autoscale"):
+        max_node_count = int(user_config.get("gcp_cluster_max_node_count") or node_count)
+        checks.append((int(user_config["loadtest_max_worker_count"]), max_node_count))
+
+    # workers are packed by their resource requests into what GKE leaves for pods on each
+    # node, after room is made for the master and secondary services unless they have a pool
+    for workers, nodes in checks:
+        max_workers = capacity.max_workers(
+            machine_type, nodes, worker_cpu, worker_memory_mb, cluster_overhead=not control_machine_type
+        )
+        if workers > max_workers:
+            raise TooManyWorkersError(workers, max_workers)
+
+    if control_machine_type and not capacity.fits_cluster_overhead(control_machine_type, control_node_count):
+        print(
+            f"{BColors.WARNING}The control pool ({control_node_count} {control_machine_type} nodes) may be too small "
+            f"for the locust master and monitoring. Consider a larger gcp_control_machine_type.{BColors.ENDC}"
+        )
 
-    # Leave 2 cores for master and secondary service overhead
-    max_workers = (cores * node_count) - 2
+    return 1
 
-    if requested_workers > max_workers:
-        raise TooManyWorkersError(requested_workers, max_workers)
 
-    return 1
+def configure_autoscaling(user_config):
+    """Accepts a dict of user configs and checks the settings of autoscaled workers. The
+    worker count becomes the minimum and a max worker count is required. The users each
+    worker can run (which the master sizes the workers by) are taken from the calibration
+    profile of the test script unless set in the config. Returns the user config.
+    """
+
+    if not user_config.get("loadtest_autoscale"):
+        return user_config
+
+    if "loadtest_max_worker_count" not in user_config:
+        raise MissingRequiredArgsError({"loadtest_max_worker_count"})
+
+    if int(user_config["loadtest_max_worker_count"]) < int(user_config["loadtest_worker_count"]):
+        raise ValueError("loadtest_max_worker_count can't be lower than loadtest_worker_count")
+
+    if not user_config.get("loadtest_users_per_worker"):
+        test_script = user_config["loadtest_script_name"]
+        profile = capacity.load_profile(calibration_profile_path(test_script))
+        if profile is None:
+            raise capacity.CalibrationError(
+                f"Autoscaling needs the users each worker can run. Run `nfo calibrate` for {test_script} "
+                "or set loadtest_users_per_worker."
+            )
+        user_config["loadtest_users_per_worker"] = profile["users_per_worker"]
+
+    return user_config
 
 
 def set_variables(config_file, image_tag="v1", external=False):
@@ -127,7 +232,8 @@ def set_variables(config_file, image_tag="v1", external=False):
     # check required args
     check_required_args(flat_user_config, external)
 
-    # check worker count
+    # check autoscaling settings and worker count
+    configure_autoscaling(flat_user_config)
     check_worker_count(flat_user_config)
 
     # update config values to include image tag
@@ -146,6 +252,47 @@ def copy_test_script_to_docker(test_script):
 
     shutil.copy(test_script_path, target_path)
 
+    # replay plans and content mixes are loaded by scripts relative to their own location
+    for data_path in [REPLAY_PLAN_PATH, CONTENT_MIX_PATH]:
+        if data_path.is_dir():
+            data_target_path = target_path.parent.joinpath(data_path.name)
+            shutil.copytree(data_path, data_target_path, dirs_exist_ok=True)
+
+
+def collect_test_scripts(test_script):
+    """Accepts a file name (assumed to be in the root test_scripts directory) and returns
+    a dict of config map entries holding the test scripts and their data files. The chosen
+    script is shipped as tasks.py. Config map keys can't hold directories so files in the
+    replay plan and content mix directories are keyed as '<directory>--<file name>'.
+    """
+
+    scripts_path = SCRIPT_PATH.parent.parent.joinpath("locust_test_scripts")
+    scripts = {}
+
+    for script in sorted(scripts_path.glob("*.py")):
+        scripts[script.name] = script.read_text()
+    scripts["tasks.py"] = scripts_path.joinpath(test_script).read_text()
+
+    for data_path in [REPLAY_PLAN_PATH, CONTENT_MIX_PATH]:
+        if data_path.is_dir():
+            for data_file in sorted(data_path.iterdir()):
+                if data_file.is_file():
+                    scripts[f"{data_path.name}--{data_file.name}"] = data_file.read_text()
+
+    return scripts
+
+
+def deploy_test_scripts(user_config):
+    """Accepts a dict of validated user configs and ships the test scripts to the cluster
+    as a config map. The locust pods mount it and reload locust whenever it changes, which
+    allows for test script updates without rebuilding the image or cycling the pods.
+    """
+
+    test_script = user_config["loadtest_script_name"]
+
+    scripts = collect_test_scripts(test_script)
+    kubernetes_deploy.deploy_config_map(SCRIPT_CONFIG_MAP, scripts)
+
 
 def collect_kube_yaml_templates(external=False):
     """Assembles and returns the appropriate list of template kubernetes yamls
@@ -163,6 +310,7 @@ def collect_kube_yaml_templates(external=False):
     yamls = [
         template_path.joinpath("locust-controller.yaml"),
         template_path.joinpath("locust-worker-controller.yaml"),
+        template_path.joinpath("locust-worker-autoscaler.yaml"),
         template_path.joinpath("prometheus-config.yaml"),
         template_path.joinpath("prometheus-controller.yaml"),
         template_path.joinpath("grafana-config.yaml"),
@@ -193,71 +341,170 @@ def render_kubernetes_templates(values_dict, files):
             f.write(rendered)
 
 
+def wait_for_operation(check, operation, timeout=OPERATION_TIMEOUT, backoff=True):
+    """Calls the check function until the long running operation it tracks is done. The check
+    must return a tuple of a boolean (True once the operation is done) and a status to print,
+    and raise an OperationFailedError if the operation failed. Checks that block until the
+    operation is done (like the compute wait endpoints) should set backoff to False so they are
+    called back to back - otherwise checks are retried with jittered exponential backoff.
+    Raises an OperationTimeoutError if the operation isn't done within the timeout (in seconds).
+    Returns the final status.
+    """
+
+    deadline = monotonic() + timeout
+    interval = 1
+
+    while True:
+        done, status = check()
+        print(f"{operation}: {status}")
+        if done:
+            return status
+
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise OperationTimeoutError(operation, timeout)
+
+        if backoff:
+            # equal jitter keeps parallel waiters from polling in lockstep
+            sleep(min(random.uniform(interval / 2, interval), remaining))
+            interval = min(interval * 2, 30)
+
+
+def check_compute_operation(task):
+    """Accepts a compute operation dict and returns a tuple of whether the operation is done and
+    its status. Raises an OperationFailedError if the operation finished with errors.
+    """
+
+    status = task["status"]
+    if status == "DONE" and task.get("error"):
+        errors = task["error"].get("errors", [])
+        detail = "; ".join(e.get("message", e.get("code", "")) for e in errors) or task["error"]
+        raise OperationFailedError(task.get("name"), detail)
+
+    return (status == "DONE", status)
+
+
+def check_gke_operation(task):
+    """Accepts a GKE operation and returns a tuple of whether the operation is done and its
+    status. Raises an OperationFailedError if the operation finished with an error.
+    """
+
+    status = task.status.name
+    if status == "DONE" and task.error and task.error.code:
+        raise OperationFailedError(task.name, task.error.message or task.status_message)
+
+    return (status == "DONE", f"{status}. {task.detail}")
+
+
+def check_build_status(status):
+    """Accepts a cloud build status and returns a tuple of whether the build is done and its
+    status. Raises an OperationFailedError if the build is over without success.
+    """
+
+    if status in BUILD_FAILURE_STATUSES:
+        raise OperationFailedError("Cloud Build", status)
+
+    return (status == "SUCCESS", status)
+
+
+def wait_for_build(operation, operation_name, timeout=OPERATION_TIMEOUT):
+    """Blocks on the long running operation of a cloud build until the build is over. Raises
+    an OperationFailedError if the build is over without success and an OperationTimeoutError
+    if it isn't over within the timeout (in seconds). Returns the final status.
+    """
+
+    print(f"{operation_name}: waiting for the build to finish...")
+    try:
+        build = operation.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        raise OperationTimeoutError(operation_name, timeout)
+    except GoogleAPICallError as e:
+        raise OperationFailedError(operation_name, e.message)
+
+    _, status = check_build_status(build.status.name)
+    print(f"{operation_name}: {status}")
+
+    return status
+
+
+def persistent_disk_sizes(user_config):
+    """Accepts a dict of validated user configs and returns the GCE persistent disks the load
+    test uses as a dict of sizes in GB by disk name. The prometheus disk is always used, the
+    results disk only when request samples are recorded.
+    """
+
+    name = user_config["loadtest_name"]
+    disks = {name: 50}
+    if user_config.get("loadtest_record_samples"):
+        disks[f"{name}{RESULTS_DISK_SUFFIX}"] = user_config.get("loadtest_results_disk_gb") or 50
+
+    return disks
+
+
 def deploy_persistent_disk(user_config):
-    """Accepts a dict of validated user configs and uses them to build a GCE persistent disk.
-    First we check to see if the disk currently exists (i.e. persisted from last session) If
-    the disk does not exist it is created. This disk will be used as a persistent volume for
-    prometheus to retain data.
+    """Accepts a dict of validated user configs and uses them to build the GCE persistent disks.
+    First we check to see if each disk currently exists (i.e. persisted from last session) If
+    the disk does not exist it is created. These disks will be used as persistent volumes for
+    prometheus and the recorded latency samples to retain data.
     """
 
     # set variables from user config
-    name = user_config["loadtest_name"]
     project = user_config["gcp_project_id"]
     zone = user_config["gcp_zone"]
 
     # create the compute client. we're relying on the environment variable to be set for credentials
     client = gke_cluster.get_compute_client()
 
-    try:
-        gke_cluster.fetch_zonal_disk(name, project, zone, client)
-        print(f"Found persistent disk {name}. Attaching to cluster...")
-    except HttpError:
-        print("No existing persistent disk found. Creating...")
-        disk_task = gke_cluster.create_zonal_disk(name, project, zone, client)
+    for name, size_gb in persistent_disk_sizes(user_config).items():
+        try:
+            gke_cluster.fetch_zonal_disk(name, project, zone, client)
+            print(f"Found persistent disk {name}. Attaching to cluster...")
+        except HttpError:
+            print(f"No existing persistent disk {name} found. Creating...")
+            disk_task = gke_cluster.create_zonal_disk(name, project, zone, client, size_gb)
 
-        running = True
-        while running:
-            status = gke_cluster.compute_zonal_task_status(disk_task, project, zone, client)
-            print(f"Creating persistent disk {name}: {status}")
-            if status == "DONE":
-                running = False
-            else:
-                sleep(2)
+            wait_for_operation(
+                lambda: check_compute_operation(gke_cluster.wait_compute_zonal_task(disk_task, project, zone, client)),
+                f"Creating persistent disk {name}",
+                timeout=DISK_OPERATION_TIMEOUT,
+                backoff=False
+            )
 
 
 def destroy_persistent_disk(user_config):
-    """Accepts a dict of validated user configs and uses them to destroy a GCE persistent disk.
-    Tracks the status of the job and confirms successful deletion.
+    """Accepts a dict of validated user configs and uses them to destroy the GCE persistent disks.
+    The results disk is removed too if it exists, even when samples are no longer recorded.
+    Tracks the status of the jobs and confirms successful deletion.
     """
 
     # set variables from user config
-    name = user_config["loadtest_name"]
+    loadtest_name = user_config["loadtest_name"]
     project = user_config["gcp_project_id"]
     zone = user_config["gcp_zone"]
 
     # create the compute client. we're relying on the environment variable to be set for credentials
     client = gke_cluster.get_compute_client()
 
-    try:
-        gke_cluster.fetch_zonal_disk(name, project, zone, client)
-        print(f"Found persistent disk {name}. Deleting...")
-        disk_task = gke_cluster.delete_zonal_disk(name, project, zone, client)
-
-        running = True
-        while running:
-            status = gke_cluster.compute_zonal_task_status(disk_task, project, zone, client)
-            print(f"Deleting persistent disk {name}: {status}")
-            if status == "DONE":
-                running = False
-            else:
-                sleep(2)
-    except HttpError:
-        print("No persistent disk exists. Moving on!")
+    for name in [loadtest_name, f"{loadtest_name}{RESULTS_DISK_SUFFIX}"]:
+        try:
+            gke_cluster.fetch_zonal_disk(name, project, zone, client)
+            print(f"Found persistent disk {name}. Deleting...")
+            disk_task = gke_cluster.delete_zonal_disk(name, project, zone, client)
+
+            wait_for_operation(
+                lambda: check_compute_operation(gke_cluster.wait_compute_zonal_task(disk_task, project, zone, client)),
+                f"Deleting persistent disk {name}",
+                timeout=DISK_OPERATION_TIMEOUT,
+                backoff=False
+            )
+        except HttpError:
+            print(f"No persistent disk {name} exists. Moving on!")
 
 
 def deploy_ip_address(user_config):
     """Accepts a dict of validated user configs and uses them to deploy a global ip
-    address that is used for the gke ingress controller (if appropriate).
+    address that is used for the gke ingress controller (if appropriate). An existing
+    address of the same name is reused.
     """
 
     # set variables from user config
@@ -267,16 +514,22 @@ def deploy_ip_address(user_config):
     # create the compute client. we're relying on the environment variable to be set for credentials
     client = gke_cluster.get_compute_client()
 
+    # a parked cluster keeps its address
+    try:
+        gke_cluster.fetch_ip_address(name, project, client)
+        print(f"Found global IP address {name}. Reusing...")
+        return
+    except HttpError:
+        pass
+
     address_task = gke_cluster.create_global_ip(name, project, client)
 
-    running = True
-    while running:
-        status = gke_cluster.compute_task_status(address_task, project, client)
-        print(f"Global IP Address {name}: {status}")
-        if status == "DONE":
-            running = False
-        else:
-            sleep(2)
+    wait_for_operation(
+        lambda: check_compute_operation(gke_cluster.wait_compute_task(address_task, project, client)),
+        f"Global IP Address {name}",
+        timeout=IP_OPERATION_TIMEOUT,
+        backoff=False
+    )
 
 
 def get_ip_address(user_config):
@@ -313,14 +566,12 @@ def destroy_ip_address(user_config):
 
     address_delete_task = gke_cluster.delete_global_ip(name, project, client)
 
-    running = True
-    while running:
-        status = gke_cluster.compute_task_status(address_delete_task, project, client)
-        print(f"Delete Global IP Address {name}: {status}")
-        if status == "DONE":
-            running = False
-        else:
-            sleep(2)
+    wait_for_operation(
+        lambda: check_compute_operation(gke_cluster.wait_compute_task(address_delete_task, project, client)),
+        f"Delete Global IP Address {name}",
+        timeout=IP_OPERATION_TIMEOUT,
+        backoff=False
+    )
 
 
 def deploy_gke(user_config):
@@ -335,25 +586,146 @@ def deploy_gke(user_config):
     zone = user_config["gcp_zone"]
     node_count = user_config["gcp_cluster_node_count"]
     machine_type = user_config["gcp_cluster_machine_type"]
+    max_node_count = user_config.get("gcp_cluster_max_node_count")
 
     # create the gke client. we're relying on the environment variable to be set for credentials
     client = gke_cluster.get_gke_client()
 
-    gke_task = gke_cluster.setup_gke_cluster(name, project, zone, node_count, machine_type, client)
-
-    running = True
-    while running:
-        status = gke_cluster.gke_task_status(gke_task, project, zone, client)
-        print(f"GKE Status {name}: {status.status.name}. {status.detail}")
-        if status.status.name == "DONE":
-            running = False
-        else:
-            sleep(2)
+    gke_task = gke_cluster.setup_gke_cluster(
+        name,
+        project,
+        zone,
+        node_count,
+        machine_type,
+        client,
+        max_node_count=max_node_count,
+        control_machine_type=user_config.get("gcp_control_machine_type"),
+        control_node_count=int(user_config.get("gcp_control_node_count") or 1),
+        preemptible=bool(user_config.get("gcp_worker_preemptible"))
+    )
+
+    # the container API has no wait endpoint so operations are polled with backoff
+    wait_for_operation(
+        lambda: check_gke_operation(gke_cluster.gke_task_status(gke_task, project, zone, client)),
+        f"GKE Status {name}"
+    )
 
     # create entry for kubeconfig file
     gke_cluster.setup_cluster_auth_file(name, project, zone, client)
 
 
+def resize_gke(user_config, node_count):
+    """Accepts a dict of validated user configs and a node count and resizes the load test
+    node pool of the existing GKE cluster to that many nodes. Awaits the results.
+    """
+
+    # set variables from user config
+    name = user_config["loadtest_name"]
+    project = user_config["gcp_project_id"]
+    zone = user_config["gcp_zone"]
+
+    # create the gke client. we're relying on the environment variable to be set for credentials
+    client = gke_cluster.get_gke_client()
+
+    resize_task = gke_cluster.resize_node_pool(name, project, zone, node_count, client)
+
+    wait_for_operation(
+        lambda: check_gke_operation(gke_cluster.gke_task_status(resize_task, project, zone, client)),
+        f"GKE Resize Status {name}"
+    )
+
+
+def reuse_gke(user_config):
+    """Accepts a dict of validated user configs and reuses an existing (usually parked)
+    GKE cluster by resizing its node pool to the configured node count, which takes a
+    fraction of the time of creating a cluster. If there is no cluster to reuse a new one
+    is deployed instead. The kubeconfig entry is refreshed either way.
+    """
+
+    # set variables from user config
+    name = user_config["loadtest_name"]
+    project = user_config["gcp_project_id"]
+    zone = user_config["gcp_zone"]
+    node_count = user_config["gcp_cluster_node_count"]
+    machine_type = user_config["gcp_cluster_machine_type"]
+
+    # create the gke client. we're relying on the environment variable to be set for credentials
+    client = gke_cluster.get_gke_client()
+
+    cluster = gke_cluster.get_gke_cluster(name, project, zone, client)
+    if cluster is None:
+        print(f"No cluster {name} to reuse. Creating...")
+        deploy_gke(user_config)
+        return
+
+    # node pools are fixed at creation
+    pool_names = {pool.name for pool in cluster.node_pools}
+    if (gke_cluster.CONTROL_POOL_NAME in pool_names) != bool(user_config.get("gcp_control_machine_type")):
+        print(
+            f"{BColors.WARNING}The node pools of cluster {name} don't match gcp_control_machine_type. "
+            f"Tear it down to add or remove the control pool.{BColors.ENDC}"
+        )
+
+    # the machine type of a node pool is fixed at creation, autoscaling can be changed
+    autoscaling = gke_cluster.node_pool_autoscaling(node_count, user_config.get("gcp_cluster_max_node_count"))
+    for pool in cluster.node_pools:
+        if pool.name != gke_cluster.NODE_POOL_NAME:
+            continue
+        if pool.config.machine_type != machine_type:
+            print(
+                f"{BColors.WARNING}Reusing cluster {name} with {pool.config.machine_type} nodes instead of "
+                f"{machine_type}. Tear it down to change the machine type.{BColors.ENDC}"
+            )
+        current = gke_cluster.node_pool_autoscaling(
+            pool.autoscaling.min_node_count, pool.autoscaling.enabled and pool.autoscaling.max_node_count
+        )
+        if current != autoscaling:
+            print(f"Updating node pool autoscaling of cluster {name}...")
+            autoscaling_task = gke_cluster.set_node_pool_autoscaling(name, project, zone, autoscaling, client)
+            wait_for_operation(
+                lambda: check_gke_operation(gke_cluster.gke_task_status(autoscaling_task, project, zone, client)),
+                f"GKE Autoscaling Status {name}"
+            )
+
+    print(f"Found cluster {name}. Resizing to {node_count} nodes...")
+    resize_gke(user_config, node_count)
+
+    # the endpoint can change while the cluster is parked
+    gke_cluster.setup_cluster_auth_file(name, project, zone, client)
+
+
+def park_gke(user_config):
+    """Accepts a dict of validated user configs and scales the load test node pool of the
+    GKE cluster down to the configured standby node count (zero by default) so that it can
+    be reused by the next setup without paying for idle nodes. Autoscaling of the pool is
+    turned off first, otherwise the cluster autoscaler would add nodes back for the pods left
+    pending. reuse_gke turns it back on. The control pool, if any, keeps its nodes so that
+    the master and monitoring stay up.
+    """
+
+    # set variables from user config
+    name = user_config["loadtest_name"]
+    project = user_config["gcp_project_id"]
+    zone = user_config["gcp_zone"]
+    standby_node_count = user_config.get("gcp_cluster_standby_node_count", 0)
+
+    # create the gke client. we're relying on the environment variable to be set for credentials
+    client = gke_cluster.get_gke_client()
+
+    cluster = gke_cluster.get_gke_cluster(name, project, zone, client)
+    pools = cluster.node_pools if cluster is not None else []
+    if any(pool.name == gke_cluster.NODE_POOL_NAME and pool.autoscaling.enabled for pool in pools):
+        print(f"Turning off node pool autoscaling of cluster {name}...")
+        autoscaling = gke_cluster.node_pool_autoscaling(standby_node_count)
+        autoscaling_task = gke_cluster.set_node_pool_autoscaling(name, project, zone, autoscaling, client)
+        wait_for_operation(
+            lambda: check_gke_operation(gke_cluster.gke_task_status(autoscaling_task, project, zone, client)),
+            f"GKE Autoscaling Status {name}"
+        )
+
+    resize_gke(user_config, standby_node_count)
+
+
 def destroy_gke(user_config):
     """Accepts a dict of validated user configs and uses it to destroy the specified
     GKE cluster. Awaits the results and confirms successful deletion.
@@ -369,14 +741,10 @@ def destroy_gke(user_config):
 
     gke_delete_task = gke_cluster.delete_gke_cluster(name, project, zone, client)
 
-    running = True
-    while running:
-        status = gke_cluster.gke_task_status(gke_delete_task, project, zone, client)
-        print(f"GKE Delete Status {name}: {status.status.name}. {status.detail}")
-        if status.status.name == "DONE":
-            running = False
-        else:
-            sleep(2)
+    wait_for_operation(
+        lambda: check_gke_operation(gke_cluster.gke_task_status(gke_delete_task, project, zone, client)),
+        f"GKE Delete Status {name}"
+    )
 
     # delete entry in kubeconfig file
     gke_cluster.teardown_cluster_auth_file(name, project, zone)
@@ -401,11 +769,16 @@ def set_kubernetes_context(user_config):
 
     subprocess.run(set_context_command)
 
+    # the kubernetes clients were set up for the previous context
+    kubernetes_deploy.reset_clients()
+
 
 def deploy_test_container_image(user_config):
     """Accepts a dict of validated user configs and uses them to configure and send
     a cloud build job that copies the test script into the docker directory, creates
     the load test container image and uploads it to your GCP project's Container Registry.
+    If an image was already built from an identical build context it is tagged with the
+    image tag instead of being rebuilt.
     """
 
     # set variables from user config
@@ -417,24 +790,38 @@ def deploy_test_container_image(user_config):
     # copy test script into docker directory in prep for building
     copy_test_script_to_docker(test_script)
 
+    # images are tagged by the digest of their build context as well as the image tag
+    docker_path = SCRIPT_PATH.parent.joinpath("docker-image")
+    digest = cloud_build.hash_build_context(docker_path)
+    build_context_tag = cloud_build.context_tag(digest)
+
+    # skip the build entirely if an image was already built from the same context
+    registry_session = cloud_build.get_registry_session()
+    manifest = cloud_build.get_image_manifest(project, name, build_context_tag, registry_session)
+    if manifest:
+        cloud_build.tag_image(project, name, manifest, image_tag, registry_session)
+        print(f"Build context unchanged, reusing image {name}:{build_context_tag} as {name}:{image_tag}")
+        return
+
+    # the base image only needs building when realbrowserlocusts or its dockerfile change
+    base_digest = cloud_build.hash_build_context(docker_path, include=cloud_build.BASE_IMAGE_PATHS)
+    base_tag = cloud_build.context_tag(base_digest)
+    base_manifest = cloud_build.get_image_manifest(project, f"{name}-base", base_tag, registry_session)
+
     # create build and storage clients
     build_client = cloud_build.get_build_client()
     storage_client = cloud_build.get_storage_client()
 
     # upload the tgz of the docker image directory to cloud storage
-    bucket, blob = cloud_build.upload_source(project, storage_client)
+    bucket, blob = cloud_build.upload_source(project, storage_client, digest)
 
     # trigger the build
-    build_task = cloud_build.build_test_image(name, project, image_tag, bucket, blob, build_client)
+    build_operation = cloud_build.build_test_image(
+        name, project, image_tag, bucket, blob, build_client, build_context_tag,
+        base_tag=base_tag, build_base=base_manifest is None
+    )
 
-    running = True
-    while running:
-        status = cloud_build.build_status(build_task, project, build_client)
-        print(f"Cloud Build {name} {build_task}: {status}")
-        if status == "SUCCESS":
-            running = False
-        else:
-            sleep(2)
+    wait_for_build(build_operation, f"Cloud Build {name} {build_operation.metadata.build.id}")
 
 
 def deploy_looker_secret(user_config):
@@ -451,22 +838,23 @@ def deploy_looker_secret(user_config):
     looker_pass = user_config.get("looker_pass")
     looker_api_client_id = user_config.get("looker_api_client_id")
     looker_api_client_secret = user_config.get("looker_api_client_secret")
+    looker_embed_secret = user_config.get("looker_embed_secret")
 
     # set host secret
-    host_secret = "website-host"
-    host_secret_value = {"host": looker_host}
-    kubernetes_deploy.deploy_secret(host_secret, host_secret_value)
+    secrets = {"website-host": {"host": looker_host}}
 
     # conditionally set secrets
     if looker_user and looker_pass:
-        creds_secret = "website-creds"
-        creds_secret_value = {"username": looker_user, "password": looker_pass}
-        kubernetes_deploy.deploy_secret(creds_secret, creds_secret_value)
+        secrets["website-creds"] = {"username": looker_user, "password": looker_pass}
 
     if looker_api_client_id and looker_api_client_secret:
-        api_secret = "api-creds"
-        api_secret_value = {"client_id": looker_api_client_id, "client_secret": looker_api_client_secret}
-        kubernetes_deploy.deploy_secret(api_secret, api_secret_value)
+        secrets["api-creds"] = {"client_id": looker_api_client_id, "client_secret": looker_api_client_secret}
+
+    if looker_embed_secret:
+        secrets["embed-secret"] = {"secret": looker_embed_secret}
+
+    # all secrets go out in one batch
+    kubernetes_deploy.deploy_secrets(secrets)
 
 
 def deploy_oauth_secret(user_config):
@@ -484,6 +872,179 @@ def deploy_oauth_secret(user_config):
     kubernetes_deploy.deploy_secret(oauth_secret, oauth_secret_value)
 
 
+def capture_replay_plan(user_config, dashboard_id, filter_overrides=None, plan_name=None,
+                        max_concurrency=6, count_rows=True):
+    """Accepts a dict of validated user configs and a dashboard id and captures the
+    queries behind the dashboard's tiles into a replay plan that API based tests can
+    run without a browser. The plan is written to the replay_plans directory next to
+    the test scripts. Returns the path of the plan file.
+    """
+
+    # set variables from user config
+    looker_api_url = user_config.get("looker_api_url") or user_config["looker_host"]
+    client_id = user_config.get("looker_api_client_id")
+    client_secret = user_config.get("looker_api_client_secret")
+
+    if not (client_id and client_secret):
+        raise MissingRequiredArgsError({"looker_api_client_id", "looker_api_client_secret"})
+
+    sdk = looker_capture.get_looker_sdk(looker_api_url, client_id, client_secret)
+
+    print(f"Capturing dashboard {dashboard_id}...")
+    plan = looker_capture.capture_dashboard(dashboard_id, sdk, filter_overrides, max_concurrency, count_rows)
+
+    plan_file = REPLAY_PLAN_PATH.joinpath(plan_name or f"dashboard_{dashboard_id}.json")
+    looker_capture.write_plan(plan, plan_file)
+
+    print(f"Captured {len(plan['tiles'])} tiles ({plan['skipped_elements']} skipped) to {plan_file}")
+
+    return plan_file
+
+
+def calibration_profile_path(test_script):
+    """Returns the path of the calibration profile of a test script."""
+
+    return CALIBRATION_PATH.joinpath(f"{Path(test_script).stem}.yaml")
+
+
+def locust_request(path, fields=None):
+    """Sends a request to the locust master's web API through the kubernetes API server.
+    Requests with fields are posted. Returns the response body.
+    """
+
+    method = "POST" if fields else "GET"
+
+    return kubernetes_deploy.proxy_service_request("lm-pod", path, method, fields)
+
+
+def fetch_results(user_config):
+    """Accepts a dict of validated user configs and downloads the latency logs recorded by the
+    locust master into the results directory of the load test. Logs already downloaded are
+    skipped unless their size changed, i.e. the master was still writing to them. Returns
+    the local paths of every log of the test.
+    """
+
+    results_dir = RESULTS_PATH.joinpath(user_config["loadtest_name"])
+    results_dir.mkdir(parents=True, exist_ok=True)
+
+    for result_file in json.loads(locust_request("results")):
+        local_file = results_dir.joinpath(Path(result_file["name"]).name)
+        if local_file.exists() and local_file.stat().st_size == result_file["size"]:
+            continue
+        print(f"Downloading {result_file['name']} ({result_file['size'] / 1024 / 1024:.1f}MB)...")
+        content = kubernetes_deploy.proxy_service_request("lm-pod", f"results/{result_file['name']}", binary=True)
+        local_file.write_bytes(content)
+
+    return results.list_result_files(results_dir)
+
+
+def worker_usage():
+    """Returns the cpu (cores) and memory (MB) use of the busiest locust worker pod."""
+
+    usage = kubernetes_deploy.get_pod_usage("app=lw-pod")
+
+    return max(usage.values(), key=lambda u: u["cpu"])
+
+
+def calibrate_worker(user_config, max_users, target_p95_ms, step_users=1, step_duration=60,
+                     warmup=15, sample_interval=5):
+    """Accepts a dict of validated user configs and runs a short calibration of the test
+    script against a single worker of the deployed load test. Users are added step_users
+    at a time until the p95 response time exceeds target_p95_ms (in milliseconds) or
+    max_users is reached. Each step is measured for step_duration seconds after warmup
+    seconds, recording the p95, requests per second and the worker's cpu and memory use.
+    The resulting profile is written next to the test scripts and the workers are scaled
+    back up. Returns the path of the profile file.
+    """
+
+    # set variables from user config
+    test_script = user_config["loadtest_script_name"]
+    machine_type = user_config["gcp_cluster_machine_type"]
+    worker_count = int(user_config["loadtest_worker_count"])
+    step_load = str(user_config.get("loadtest_step_load")).lower() == "true"
+
+    print("Scaling to a single worker for calibration...")
+    locust_request("stop")
+    kubernetes_deploy.scale_deployment("lw-pod", 1)
+    kubernetes_deploy.wait_for_deployment("lw-pod", timeout=ROLLOUT_TIMEOUT)
+
+    # let the metrics catch up with the idle worker
+    sleep(warmup)
+    baseline = worker_usage()
+    print(f"Idle worker: {baseline['cpu']:.2f} cores, {baseline['memory_mb']:.0f}MB")
+
+    steps = []
+    try:
+        for users in range(step_users, max_users + 1, step_users):
+            fields = {"locust_count": users, "hatch_rate": users}
+            if step_load:
+                fields.update({"step_locust_count": users, "step_duration": f"{step_duration}s"})
+            locust_request("swarm", fields)
+
+            # only measure once every user is up and running
+            sleep(warmup)
+            locust_request("stats/reset")
+
+            # sample at least once, even when the step is shorter than the interval
+            samples = []
+            deadline = monotonic() + step_duration
+            while True:
+                sleep(min(sample_interval, step_duration))
+                stats = json.loads(locust_request("stats/requests"))
+                samples.append(stats.get("current_response_time_percentile_95"))
+                if monotonic() >= deadline:
+                    break
+
+            usage = worker_usage()
+            step = {
+                "users": users,
+                "p95_ms": capacity.median_p95(samples),
+                "rps": round(stats.get("total_rps", 0), 2),
+                "fail_ratio": round(stats.get("fail_ratio", 0), 3),
+                "cpu": round(usage["cpu"], 3),
+                "memory_mb": round(usage["memory_mb"])
+            }
+            steps.append(step)
+            print(
+                f"{users} users: p95 {step['p95_ms']}ms, {step['rps']} rps, "
+                f"{step['cpu']} cores, {step['memory_mb']}MB"
+            )
+
+            if step["p95_ms"] is not None and step["p95_ms"] > target_p95_ms:
+                break
+    finally:
+        locust_request("stop")
+        print(f"Scaling back to {worker_count} workers...")
+        kubernetes_deploy.scale_deployment("lw-pod", worker_count)
+
+    profile = capacity.build_profile(test_script, machine_type, target_p95_ms, baseline, steps)
+    profile_file = calibration_profile_path(test_script)
+    capacity.save_profile(profile, profile_file)
+
+    return profile_file
+
+
+def plan_capacity(user_config, target_users, machine_family=None):
+    """Accepts a dict of validated user configs and a target number of users and uses the
+    calibration profile of the test script to recommend the machine type, node count and
+    worker count (and worker size) to run them with. Returns a tuple of a dict of the
+    recommended config values and the profile they are based on.
+    """
+
+    test_script = user_config["loadtest_script_name"]
+    profile_file = calibration_profile_path(test_script)
+
+    profile = capacity.load_profile(profile_file)
+    if profile is None:
+        raise capacity.CalibrationError(
+            f"No calibration profile found for {test_script}. Run `nfo calibrate` first."
+        )
+
+    plan = capacity.plan_capacity(profile, target_users, machine_family)
+
+    return (plan, profile)
+
+
 def compare_tags(new_tag):
     """Accepts a container tag and compares it to the existing tag in the locust deployment.
     If the tags are the same then an exception is raised. Returns 1 if the tags are distinct.
@@ -505,7 +1066,7 @@ def compare_tags(new_tag):
 def deploy_locust(cycle=False):
     """Deploys the locust services and deployments to kubernetes. If the cycle argument is
     set to True then the deployments will be deleted prior to deployment (to be used during
-    update commands).
+    update commands). Waits until both deployments have rolled out.
     """
 
     render_path = SCRIPT_PATH.joinpath("rendered")
@@ -515,23 +1076,16 @@ def deploy_locust(cycle=False):
         kubernetes_deploy.delete_deployment("lw-pod")
         kubernetes_deploy.delete_deployment("lm-pod")
 
-    # roll out locust services and deployments
-    locust_master = str(render_path.joinpath("locust-controller.yaml"))
-    locust_worker = str(render_path.joinpath("locust-worker-controller.yaml"))
-
-    wait_command = ["kubectl", "rollout", "status"]
-
-    lm_command = APPLY_COMMAND + [locust_master]
-    lm_wait_command = wait_command + ["deployment/lm-pod"]
-    lw_command = APPLY_COMMAND + [locust_worker]
-    lw_wait_command = wait_command + ["deployment/lw-pod"]
+    # roll out locust services and deployments. workers keep retrying the master until it's up.
+    # the autoscaler file is empty unless workers are autoscaled
+    locust_yamls = [
+        str(render_path.joinpath("locust-controller.yaml")),
+        str(render_path.joinpath("locust-worker-controller.yaml")),
+        str(render_path.joinpath("locust-worker-autoscaler.yaml"))
+    ]
 
-    locust_commands = [lm_command, lm_wait_command, lw_command, lw_wait_command]
-    win_exec = ["cmd.exe", "/c"]
-    for command in locust_commands:
-        if os.name == "nt":
-            command = win_exec + command
-        subprocess.run(command)
+    kubernetes_deploy.apply_manifests(locust_yamls)
+    kubernetes_deploy.wait_for_deployments(["lm-pod", "lw-pod"], timeout=ROLLOUT_TIMEOUT)
 
 
 def deploy_external():
@@ -545,12 +1099,7 @@ def deploy_external():
         str(render_path.joinpath("config-default.yaml"))
     ]
 
-    win_exec = ["cmd.exe", "/c"]
-    for yml in external_yamls:
-        command = APPLY_COMMAND + [yml]
-        if os.name == "nt":
-            command = win_exec + command
-        subprocess.run(command)
+    kubernetes_deploy.apply_manifests(external_yamls)
 
 
 def deploy_secondary():
@@ -565,9 +1114,4 @@ def deploy_secondary():
         str(render_path.joinpath("grafana-controller.yaml"))
     ]
 
-    win_exec = ["cmd.exe", "/c"]
-    for yml in secondary_yamls:
-        command = APPLY_COMMAND + [yml]
-        if os.name == "nt":
-            command = win_exec + command
-        subprocess.run(command)
+    kubernetes_deploy.apply_manifests(secondary_yamls)
@@ -0,0 +1,118 @@
+import csv
+import math
+import struct
+from array import array
+from pathlib import Path
+
+# layout of the latency logs written by the locust master (see realbrowserlocusts/recorder.py)
+MAGIC = b"NFOLAT01"
+STRING_RECORD = 1
+SAMPLE_RECORD = 2
+STRING_HEADER = struct.Struct("<BIH")
+SAMPLE = struct.Struct("<BdIIIfB")
+FILE_SUFFIX = ".nfolat"
+
+PERCENTILES = [50, 90, 95, 99]
+
+# columns samples can be summarised by
+GROUP_BY = ["name", "group", "worker"]
+
+
+class ResultsFormatError(Exception):
+    """Exception raised if a file is not a latency log."""
+
+    def __init__(self, path, message="Not a latency log:"):
+        self.path = path
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message} {self.path}"
+
+
+def read_samples(path):
+    """Reads a latency log and yields its samples as tuples of start time (unix seconds),
+    group, name, worker, response time (ms) and success. A partly written record at the
+    end of the file, as found in the file the master is still writing, is left out.
+    """
+
+    data = Path(path).read_bytes()
+    if not data.startswith(MAGIC):
+        raise ResultsFormatError(path)
+
+    strings = {}
+    offset = len(MAGIC)
+    while offset < len(data):
+        record_type = data[offset]
+        if record_type == STRING_RECORD:
+            if offset + STRING_HEADER.size > len(data):
+                break
+            _, string_id, length = STRING_HEADER.unpack_from(data, offset)
+            offset += STRING_HEADER.size
+            if offset + length > len(data):
+                break
+            strings[string_id] = data[offset:offset + length].decode("utf-8", errors="replace")
+            offset += length
+        elif record_type == SAMPLE_RECORD:
+            if offset + SAMPLE.size > len(data):
+                break
+            _, start, group_id, name_id, worker_id, response_time, success = SAMPLE.unpack_from(data, offset)
+            offset += SAMPLE.size
+            yield start, strings[group_id], strings[name_id], strings[worker_id], response_time, bool(success)
+        else:
+            raise ResultsFormatError(path, f"Unknown record type {record_type} at byte {offset} of")
+
+
+def list_result_files(directory):
+    """Returns the latency logs in a directory, oldest first."""
+
+    return sorted(Path(directory).glob(f"*{FILE_SUFFIX}"))
+
+
+def percentile(sorted_values, percent):
+    """Returns the nearest-rank percentile of a sorted sequence of values."""
+
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+
+    return sorted_values[rank - 1]
+
+
+def summarize(paths, by="name"):
+    """Accepts latency log paths and summarises every sample in them by name, group or worker.
+    Percentiles are exact, worked out from all samples rather than from histogram buckets.
+    Returns a list of dicts with the key, count, failures, percentiles and max response time
+    (ms), sorted by key.
+    """
+
+    if by not in GROUP_BY:
+        raise ValueError(f"Can't summarise by {by}, use one of {', '.join(GROUP_BY)}")
+    column = GROUP_BY.index(by)
+
+    # response times are kept as float32 like in the logs, so millions of samples stay small
+    response_times = {}
+    failures = {}
+    for path in paths:
+        for start, group, name, worker, response_time, success in read_samples(path):
+            key = (name, group, worker)[column]
+            response_times.setdefault(key, array("f")).append(response_time)
+            failures[key] = failures.get(key, 0) + (not success)
+
+    summary = []
+    for key in sorted(response_times):
+        values = sorted(response_times[key])
+        row = {by: key, "count": len(values), "failures": failures[key]}
+        for percent in PERCENTILES:
+            row[f"p{percent}"] = round(percentile(values, percent), 1)
+        row["max"] = round(values[-1], 1)
+        summary.append(row)
+
+    return summary
+
+
+def write_summary_csv(summary, path):
+    """Writes a summary of latency logs to a csv file."""
+
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(summary[0]) if summary else GROUP_BY[:1])
+        writer.writeheader()
+        writer.writerows(summary)
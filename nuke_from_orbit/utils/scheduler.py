@@ -0,0 +1,109 @@
+import concurrent.futures
+from time import monotonic
+
+
+class Step:
+    """A unit of work in a dependency graph. The function is called with the given args
+    once every step named in depends_on has finished successfully.
+    """
+
+    def __init__(self, name, function, *args, depends_on=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.depends_on = list(depends_on or [])
+
+    def run(self):
+        return self.function(*self.args)
+
+
+class StepDependencyError(Exception):
+    """Exception raised if steps can't be ordered because of missing or circular dependencies."""
+
+    def __init__(self, steps, message="Steps have missing or circular dependencies!"):
+        self.steps = steps
+        self.message = f"{message} {', '.join(sorted(steps))}"
+        super().__init__(self.message)
+
+
+def check_steps(steps):
+    """Accepts a list of steps and makes sure they can all be run: names are unique, every
+    dependency is a known step and there are no cycles. Returns a dict of steps by name.
+    """
+
+    by_name = {}
+    for step in steps:
+        if step.name in by_name:
+            raise ValueError(f"Duplicate step name {step.name}")
+        by_name[step.name] = step
+
+    # peel off steps whose dependencies are all resolved until nothing changes
+    resolved = set()
+    remaining = dict(by_name)
+    while remaining:
+        ready = [name for name, step in remaining.items() if set(step.depends_on) <= resolved]
+        if not ready:
+            raise StepDependencyError(remaining)
+        for name in ready:
+            resolved.add(name)
+            del remaining[name]
+
+    return by_name
+
+
+def run_steps(steps, max_workers=4):
+    """Accepts a list of steps and runs each one on a thread pool as soon as its dependencies
+    have finished, with at most max_workers steps running at a time. The start, end and
+    duration of each step is printed as it happens. If a step raises, no further steps are
+    started, running steps are allowed to finish and the first exception is re-raised.
+    Returns a dict of step durations in seconds, in the order the steps finished.
+    """
+
+    by_name = check_steps(steps)
+    pending = dict(by_name)
+    done = set()
+    durations = {}
+    running = {}
+    error = None
+    start = monotonic()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # submit everything that is unblocked, in declaration order
+            if error is None:
+                for name in [n for n, s in pending.items() if set(s.depends_on) <= done]:
+                    step = pending.pop(name)
+                    print(f"[{monotonic() - start:7.1f}s] Starting {name}")
+                    running[executor.submit(_timed, step)] = name
+
+            if not running:
+                break
+
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    durations[name] = future.result()
+                except Exception as e:
+                    print(f"[{monotonic() - start:7.1f}s] Failed {name}")
+                    if error is None:
+                        error = e
+                    continue
+                done.add(name)
+                print(f"[{monotonic() - start:7.1f}s] Finished {name} in {durations[name]:.1f}s")
+
+    if error is not None:
+        raise error
+
+    print(f"[{monotonic() - start:7.1f}s] All steps finished")
+
+    return durations
+
+
+def _timed(step):
+    """Runs a step and returns how long it took."""
+
+    started = monotonic()
+    step.run()
+
+    return monotonic() - started
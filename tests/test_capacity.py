@@ -0,0 +1,123 @@
+import pytest
+from nuke_from_orbit.utils import capacity
+
+
+MOCK_PROFILE = {
+    "script": "scenario2.py",
+    "machine_type": "c2-standard-8",
+    "users_per_worker": 4,
+    "worker_cpu": 1.5,
+    "worker_memory_mb": 3000
+}
+
+
+def test_allocatable_cpu():
+    assert capacity.allocatable_cpu(1) == pytest.approx(0.94)
+    assert capacity.allocatable_cpu(8) == pytest.approx(7.91)
+
+
+def test_allocatable_memory():
+    # 25% of 4GB, 20% of the next 4GB, 10% of the next 8GB and 6% of the rest plus eviction
+    assert capacity.allocatable_memory_mb(32768) == pytest.approx(32768 - 1024 - 819.2 - 819.2 - 983.04 - 100)
+
+
+def test_machine_resources():
+    assert capacity.machine_resources("c2-standard-8") == (8, 32768)
+    assert capacity.machine_resources("custom-8") == (8, None)
+
+
+def test_machine_resources_shared_core():
+    assert capacity.machine_resources("e2-medium") == (1, 4096)
+    assert capacity.machine_resources("g1-small") == (1, 1740)
+    assert capacity.workers_per_node("e2-medium", worker_memory_mb=1024) == 0
+    assert capacity.fits_cluster_overhead("e2-medium", 1)
+
+
+def test_machine_resources_custom():
+    assert capacity.machine_resources("custom-4-8192") == (4, 8192)
+    assert capacity.machine_resources("n2-custom-8-65536-ext") == (8, 65536)
+
+
+def test_machine_resources_unknown():
+    with pytest.raises(capacity.UnknownMachineTypeError):
+        capacity.machine_resources("e2-tiny")
+
+    assert not capacity.known_machine_type("e2-tiny")
+    assert capacity.known_machine_type("e2-micro")
+
+
+def test_max_workers():
+    assert capacity.max_workers("c2-standard-8", 3) == 21
+    assert capacity.max_workers("c2-standard-8", 3, worker_cpu=2) == 9
+    assert capacity.max_workers("e2-highcpu-2", 1) == 0
+    assert capacity.max_workers("c2-standard-8", 3, worker_cpu=2, cluster_overhead=False) == 9
+    assert capacity.max_workers("e2-highcpu-2", 1, worker_memory_mb=1024, cluster_overhead=False) == 1
+
+
+def test_fits_cluster_overhead():
+    assert capacity.fits_cluster_overhead("e2-standard-2", 1)
+    assert not capacity.fits_cluster_overhead("e2-highcpu-2", 1)
+    assert capacity.fits_cluster_overhead("e2-highcpu-2", 2)
+
+
+def test_worker_size():
+    assert capacity.worker_size(MOCK_PROFILE) == (1.8, 3600)
+    assert capacity.worker_size({**MOCK_PROFILE, "worker_cpu": 0.5, "worker_memory_mb": 1000}) == (1, 2048)
+
+
+def test_plan_capacity():
+    plan = capacity.plan_capacity(MOCK_PROFILE, 10)
+
+    assert plan["loadtest_worker_count"] == 3
+    assert plan["gcp_cluster_machine_type"] == "c2-standard-8"
+    assert plan["gcp_cluster_node_count"] == 1
+    assert capacity.max_workers(plan["gcp_cluster_machine_type"], plan["gcp_cluster_node_count"], 1.8, 3600) >= 3
+
+
+def test_plan_capacity_other_family():
+    plan = capacity.plan_capacity(MOCK_PROFILE, 100, "n2-standard")
+
+    assert plan["gcp_cluster_machine_type"].startswith("n2-standard-")
+    assert plan["loadtest_worker_count"] == 25
+
+
+def test_plan_capacity_unknown_family():
+    with pytest.raises(ValueError):
+        capacity.plan_capacity(MOCK_PROFILE, 10, "z9-standard")
+
+
+def test_build_profile():
+    baseline = {"cpu": 0.05, "memory_mb": 300}
+    steps = [
+        {"users": 1, "p95_ms": 4000, "cpu": 0.4, "memory_mb": 700},
+        {"users": 2, "p95_ms": 4500, "cpu": 0.8, "memory_mb": 1100},
+        {"users": 3, "p95_ms": 9000, "cpu": 1.6, "memory_mb": 1500}
+    ]
+
+    profile = capacity.build_profile("scenario2.py", "c2-standard-8", 5000, baseline, steps)
+
+    assert profile["users_per_worker"] == 2
+    assert profile["worker_cpu"] == 0.8
+    assert profile["memory_per_user_mb"] == 400
+
+
+def test_build_profile_over_target():
+    steps = [{"users": 1, "p95_ms": 9000, "cpu": 0.4, "memory_mb": 700}]
+
+    with pytest.raises(capacity.CalibrationError):
+        capacity.build_profile("scenario2.py", "c2-standard-8", 5000, {"cpu": 0, "memory_mb": 300}, steps)
+
+
+def test_median_p95():
+    assert capacity.median_p95([None, 0, 100, 300, 200]) == 200
+    assert capacity.median_p95([None, 0]) is None
+
+
+def test_save_and_load_profile(tmp_path):
+    profile_file = tmp_path.joinpath("calibrations", "scenario2.yaml")
+
+    assert capacity.load_profile(profile_file) is None
+
+    capacity.save_profile(MOCK_PROFILE, profile_file)
+
+    assert capacity.load_profile(profile_file) == MOCK_PROFILE
@@ -1,6 +1,8 @@
 from nuke_from_orbit import cli
 from nuke_from_orbit.commands import setup_commands, teardown_commands
-from nuke_from_orbit.commands import update_config_commands, update_test_commands
+from nuke_from_orbit.commands import update_config_commands, update_test_commands, update_script_commands
+from nuke_from_orbit.commands import capture_commands, pool_commands, calibrate_commands, plan_commands
+from nuke_from_orbit.commands import results_commands
 from click.testing import CliRunner
 
 
@@ -22,7 +24,7 @@ def test_setup_config_file_only(mocker):
     runner = CliRunner()
     result = runner.invoke(cli.setup, ["--config-file", "test_config.yaml"])
     assert result.exit_code == 0
-    setup_commands.main.assert_called_with(config_file="test_config.yaml", external=False, persistence=True)
+    setup_commands.main.assert_called_with(config_file="test_config.yaml", external=False, persistence=True, reuse=False)
 
 
 def test_setup_no_persist(mocker):
@@ -30,7 +32,7 @@ def test_setup_no_persist(mocker):
     runner = CliRunner()
     result = runner.invoke(cli.setup, ["--config-file", "test_config.yaml", "--no-persistence"])
     assert result.exit_code == 0
-    setup_commands.main.assert_called_with(config_file="test_config.yaml", external=False, persistence=False)
+    setup_commands.main.assert_called_with(config_file="test_config.yaml", external=False, persistence=False, reuse=False)
 
 
 def test_setup_external(mocker):
@@ -38,7 +40,7 @@ def test_setup_external(mocker):
     runner = CliRunner()
     result = runner.invoke(cli.setup, ["--config-file", "test_config.yaml", "--external"])
     assert result.exit_code == 0
-    setup_commands.main.assert_called_with(config_file="test_config.yaml", external=True, persistence=True)
+    setup_commands.main.assert_called_with(config_file="test_config.yaml", external=True, persistence=True, reuse=False)
 
 
 def test_setup_external_no_persistence(mocker):
@@ -46,7 +48,32 @@ def test_setup_external_no_persistence(mocker):
     runner = CliRunner()
     result = runner.invoke(cli.setup, ["--config-file", "test_config.yaml", "--external", "--no-persistence"])
     assert result.exit_code == 0
-    setup_commands.main.assert_called_with(config_file="test_config.yaml", external=True, persistence=False)
+    setup_commands.main.assert_called_with(config_file="test_config.yaml", external=True, persistence=False, reuse=False)
+
+
+def test_setup_reuse(mocker):
+    mocker.patch("nuke_from_orbit.commands.setup_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.setup, ["--config-file", "test_config.yaml", "--reuse"])
+    assert result.exit_code == 0
+    setup_commands.main.assert_called_with(
+        config_file="test_config.yaml", external=False, persistence=True, reuse=True
+    )
+
+
+def test_pool_park_no_config(mocker):
+    mocker.patch("nuke_from_orbit.commands.pool_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.park)
+    assert result.exit_code == 2
+
+
+def test_pool_park(mocker):
+    mocker.patch("nuke_from_orbit.commands.pool_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.park, ["--config-file", "test_config.yaml"])
+    assert result.exit_code == 0
+    pool_commands.main.assert_called_with(config_file="test_config.yaml")
 
 
 def test_teardown_no_config_file(mocker):
@@ -113,3 +140,101 @@ def test_update_test(mocker):
     result = runner.invoke(cli.test, ["--config-file", "test_config.yaml", "--tag", "v2"])
     assert result.exit_code == 0
     update_test_commands.main.assert_called_with(config_file="test_config.yaml", tag="v2")
+
+
+def test_update_script_no_config(mocker):
+    mocker.patch("nuke_from_orbit.commands.update_script_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.script)
+    assert result.exit_code == 2
+
+
+def test_update_script(mocker):
+    mocker.patch("nuke_from_orbit.commands.update_script_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.script, ["--config-file", "test_config.yaml"])
+    assert result.exit_code == 0
+    update_script_commands.main.assert_called_with(config_file="test_config.yaml")
+
+
+def test_capture_no_dashboard_id(mocker):
+    mocker.patch("nuke_from_orbit.commands.capture_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.capture, ["--config-file", "test_config.yaml"])
+    assert result.exit_code == 2
+
+
+def test_capture(mocker):
+    mocker.patch("nuke_from_orbit.commands.capture_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.capture, ["--config-file", "test_config.yaml", "--dashboard-id", "1"])
+    assert result.exit_code == 0
+    capture_commands.main.assert_called_with(
+        config_file="test_config.yaml",
+        dashboard_id="1",
+        filter=(),
+        output=None,
+        max_concurrency=6,
+        row_counts=True
+    )
+
+
+def test_capture_filters(mocker):
+    mocker.patch("nuke_from_orbit.commands.capture_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.capture,
+        ["--config-file", "test_config.yaml", "--dashboard-id", "1", "--filter", "Date=7 days", "--no-row-counts"]
+    )
+    assert result.exit_code == 0
+    capture_commands.main.assert_called_with(
+        config_file="test_config.yaml",
+        dashboard_id="1",
+        filter=("Date=7 days",),
+        output=None,
+        max_concurrency=6,
+        row_counts=False
+    )
+
+
+def test_calibrate_no_target(mocker):
+    mocker.patch("nuke_from_orbit.commands.calibrate_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.calibrate, ["--config-file", "test_config.yaml"])
+    assert result.exit_code == 2
+
+
+def test_calibrate(mocker):
+    mocker.patch("nuke_from_orbit.commands.calibrate_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.calibrate, ["--config-file", "test_config.yaml", "--target-p95", "8000"])
+    assert result.exit_code == 0
+    calibrate_commands.main.assert_called_with(
+        config_file="test_config.yaml", target_p95=8000, max_users=20, step_users=1, step_duration=60
+    )
+
+
+def test_calibrate_rejects_empty_steps(mocker):
+    mocker.patch("nuke_from_orbit.commands.calibrate_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.calibrate, ["--config-file", "test_config.yaml", "--target-p95", "8000", "--step-duration", "0"]
+    )
+    assert result.exit_code == 2
+    calibrate_commands.main.assert_not_called()
+
+
+def test_plan(mocker):
+    mocker.patch("nuke_from_orbit.commands.plan_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.plan, ["--config-file", "test_config.yaml", "--users", "500"])
+    assert result.exit_code == 0
+    plan_commands.main.assert_called_with(config_file="test_config.yaml", users=500, machine_family=None)
+
+
+def test_results(mocker):
+    mocker.patch("nuke_from_orbit.commands.results_commands.main")
+    runner = CliRunner()
+    result = runner.invoke(cli.results, ["--config-file", "test_config.yaml", "--by", "worker"])
+    assert result.exit_code == 0
+    results_commands.main.assert_called_with(config_file="test_config.yaml", by="worker")
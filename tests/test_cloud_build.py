@@ -1,3 +1,4 @@
+import io
 import tarfile
 from pathlib import Path
 from nuke_from_orbit.utils import cloud_build
@@ -14,14 +15,24 @@ class MockBucket:
         self.name = name
 
     @staticmethod
-    def blob(blob_name):
+    def blob(blob_name, chunk_size=None):
         return MockBlob()
 
 
 class MockBlob:
+    md5_hash = None
+
+    @staticmethod
+    def exists():
+        return False
+
+    @staticmethod
+    def reload():
+        pass
+
     @staticmethod
-    def upload_from_filename(filename):
-        return filename
+    def open(mode, **kwargs):
+        return io.BytesIO()
 
 
 class MockStorageClient:
@@ -79,36 +90,104 @@ def test_get_or_create_bucket_no_exist(mocker):
 def test_upload_source_return(mocker):
     mocker.patch("time.time").return_value = 1234
     mocker.patch("nuke_from_orbit.utils.cloud_build.get_or_create_bucket").return_value = MockBucket(name="foo")
-    mocker.patch("tempfile.TemporaryDirectory").return_value.__enter__.return_value = "tempdirname"
-    mocker.patch("tarfile.open").return_value.__enter__.return_value.add.return_value = "mocktar"
+    mocker.patch("nuke_from_orbit.utils.cloud_build.write_source_tar")
 
     resp = cloud_build.upload_source("foo_project", "foo_client")
     assert resp == ("foo_project_cloudbuild", "source/loadtest-source-1234.tgz")
 
 
-def test_upload_source_tar_add_call(mocker):
+def test_upload_source_tar_write_call(mocker):
 
     docker_path = ROOT_DIR.joinpath("docker-image").resolve()
 
     mocker.patch("time.time").return_value = 1234
     mocker.patch("nuke_from_orbit.utils.cloud_build.get_or_create_bucket").return_value = MockBucket(name="foo")
-    mocker.patch("tempfile.TemporaryDirectory").return_value.__enter__.return_value = "tempdirname"
-    mocker.patch("tarfile.open").return_value.__enter__.return_value.add
+    mocker.patch("nuke_from_orbit.utils.cloud_build.write_source_tar")
 
     cloud_build.upload_source("foo_project", "foo_client")
-    tarfile.open.return_value.__enter__.return_value.add.assert_called_with(docker_path, arcname=".")
+    assert cloud_build.write_source_tar.call_args[0][0] == docker_path
 
 
-def test_upload_source_blob_upload_call(mocker):
+def test_upload_source_blob_open_call(mocker):
     mocker.patch("time.time").return_value = 1234
     mocker.patch("nuke_from_orbit.utils.cloud_build.get_or_create_bucket").return_value = MockBucket(name="foo")
-    mocker.patch("tempfile.TemporaryDirectory").return_value.__enter__.return_value = "tempdirname"
-    mocker.patch("tarfile.open").return_value.__enter__.return_value.add.return_value = "mocktar"
+    mocker.patch("nuke_from_orbit.utils.cloud_build.write_source_tar")
 
-    mocker.patch.object(MockBlob, "upload_from_filename")
+    mocker.patch.object(MockBlob, "open")
 
     cloud_build.upload_source("foo_project", "foo_client")
-    MockBlob.upload_from_filename.assert_called_with(Path("tempdirname/source.tgz"))
+    MockBlob.open.assert_called_with("wb", ignore_flush=True, content_type="application/gzip")
+
+
+def test_upload_source_skips_identical_blob(mocker):
+    mocker.patch("nuke_from_orbit.utils.cloud_build.get_or_create_bucket").return_value = MockBucket(name="foo")
+    mocker.patch("nuke_from_orbit.utils.cloud_build.source_md5").return_value = "md5"
+    mocker.patch.object(MockBlob, "exists").return_value = True
+    mocker.patch.object(MockBlob, "md5_hash", "md5")
+    mocker.patch.object(MockBlob, "open")
+
+    resp = cloud_build.upload_source("foo_project", "foo_client", "abc123")
+    assert resp == ("foo_project_cloudbuild", "source/loadtest-source-abc123.tgz")
+    MockBlob.open.assert_not_called()
+
+
+def test_upload_source_replaces_changed_blob(mocker):
+    mocker.patch("nuke_from_orbit.utils.cloud_build.get_or_create_bucket").return_value = MockBucket(name="foo")
+    mocker.patch("nuke_from_orbit.utils.cloud_build.source_md5").return_value = "md5"
+    mocker.patch("nuke_from_orbit.utils.cloud_build.write_source_tar")
+    mocker.patch.object(MockBlob, "exists").return_value = True
+    mocker.patch.object(MockBlob, "md5_hash", "other_md5")
+    mocker.patch.object(MockBlob, "open")
+
+    cloud_build.upload_source("foo_project", "foo_client", "abc123")
+    MockBlob.open.assert_called_once()
+
+
+def test_write_source_tar_deterministic(tmp_path):
+    tmp_path.joinpath("Dockerfile").write_text("FROM foo")
+    tmp_path.joinpath("tasks").mkdir()
+    tmp_path.joinpath("tasks", "tasks.py").write_text("print('foo')")
+
+    first, second = io.BytesIO(), io.BytesIO()
+    cloud_build.write_source_tar(tmp_path, first)
+    tmp_path.joinpath("tasks", "tasks.py").touch()
+    cloud_build.write_source_tar(tmp_path, second)
+    assert first.getvalue() == second.getvalue()
+
+    first.seek(0)
+    with tarfile.open(fileobj=first) as tar:
+        assert tar.getnames() == ["Dockerfile", "tasks", "tasks/tasks.py"]
+        assert all(member.mtime == 0 for member in tar.getmembers())
+
+
+def test_write_source_tar_ignores_files(tmp_path):
+    tmp_path.joinpath(".nfoignore").write_text("# comment\n*.log\nscratch/\n")
+    tmp_path.joinpath("Dockerfile").write_text("FROM foo")
+    tmp_path.joinpath("build.log").write_text("foo")
+    tmp_path.joinpath("scratch").mkdir()
+    tmp_path.joinpath("scratch", "notes.txt").write_text("foo")
+    tmp_path.joinpath("__pycache__").mkdir()
+    tmp_path.joinpath("__pycache__", "tasks.cpython-38.pyc").write_bytes(b"foo")
+
+    tar_file = io.BytesIO()
+    cloud_build.write_source_tar(tmp_path, tar_file)
+    tar_file.seek(0)
+    with tarfile.open(fileobj=tar_file) as tar:
+        assert tar.getnames() == [".nfoignore", "Dockerfile"]
+
+
+def test_is_ignored():
+    patterns = ["__pycache__/", "*.pyc", "/docs/*.md"]
+    assert cloud_build.is_ignored("foo/__pycache__", True, patterns)
+    assert not cloud_build.is_ignored("foo/__pycache__", False, patterns)
+    assert cloud_build.is_ignored("foo/bar.pyc", False, patterns)
+    assert cloud_build.is_ignored("docs/readme.md", False, patterns)
+    assert not cloud_build.is_ignored("foo/docs/readme.md", False, patterns)
+
+
+def test_source_md5(tmp_path):
+    tmp_path.joinpath("Dockerfile").write_text("FROM foo")
+    assert cloud_build.source_md5(tmp_path) == cloud_build.source_md5(tmp_path)
 
 
 def test_build_test_image(mocker):
@@ -116,9 +195,9 @@ def test_build_test_image(mocker):
     mocker.patch.object(mock_build_client, "create_build").return_value.metadata.build.id = "abc123"
     mocker.patch("google.cloud.devtools.cloudbuild.CreateBuildRequest").return_value = "foo"
 
-    task_id = cloud_build.build_test_image("taco", "cat", "v1", "foo_bucket", "foo_blob", mock_build_client)
+    operation = cloud_build.build_test_image("taco", "cat", "v1", "foo_bucket", "foo_blob", mock_build_client)
 
-    assert task_id == "abc123"
+    assert operation.metadata.build.id == "abc123"
 
 
 def test_build_test_image_request(mocker):
@@ -129,15 +208,36 @@ def test_build_test_image_request(mocker):
                 "object_": "foo_blob"
             }
         },
-        "images": ["gcr.io/cat/taco:v1"],
+        "images": ["gcr.io/cat/taco:v1", "gcr.io/cat/taco-base:latest"],
         "steps": [
+            {
+                "name": "gcr.io/cloud-builders/docker",
+                "entrypoint": "bash",
+                "args": ["-c", "docker pull gcr.io/cat/taco-base:latest || exit 0"]
+            },
+            {
+                "name": "gcr.io/cloud-builders/docker",
+                "args": [
+                    "build",
+                    "--network",
+                    "cloudbuild",
+                    "-f",
+                    "Dockerfile.base",
+                    "--cache-from",
+                    "gcr.io/cat/taco-base:latest",
+                    "-t",
+                    "gcr.io/cat/taco-base:latest",
+                    "."
+                ]
+            },
             {
                 "name": "gcr.io/cloud-builders/docker",
                 "args": [
                     "build",
                     "--network",
                     "cloudbuild",
-                    "--no-cache",
+                    "--build-arg",
+                    "BASE_IMAGE=gcr.io/cat/taco-base:latest",
                     "-t",
                     "gcr.io/cat/taco:v1",
                     "."
@@ -170,3 +270,113 @@ def test_build_status_request(mocker):
 
     cloud_build.build_status("abc123", "foo_project", mock_build_client)
     cloudbuild.GetBuildRequest.assert_called_with(project_id="foo_project", id="abc123")
+
+
+def test_upload_source_digest_blob_name(mocker):
+    mocker.patch("nuke_from_orbit.utils.cloud_build.get_or_create_bucket").return_value = MockBucket(name="foo")
+    mocker.patch("nuke_from_orbit.utils.cloud_build.write_source_tar")
+
+    resp = cloud_build.upload_source("foo_project", "foo_client", "abc123")
+    assert resp == ("foo_project_cloudbuild", "source/loadtest-source-abc123.tgz")
+
+
+def test_hash_build_context_stable(tmp_path):
+    tmp_path.joinpath("Dockerfile").write_text("FROM foo")
+    tmp_path.joinpath("tasks").mkdir()
+    tmp_path.joinpath("tasks", "tasks.py").write_text("print('foo')")
+
+    assert cloud_build.hash_build_context(tmp_path) == cloud_build.hash_build_context(tmp_path)
+
+
+def test_hash_build_context_changes_with_content(tmp_path):
+    tmp_path.joinpath("Dockerfile").write_text("FROM foo")
+    tmp_path.joinpath("tasks.py").write_text("print('foo')")
+    digest = cloud_build.hash_build_context(tmp_path)
+
+    tmp_path.joinpath("tasks.py").write_text("print('bar')")
+    assert cloud_build.hash_build_context(tmp_path) != digest
+
+
+def test_hash_build_context_ignores_bytecode(tmp_path):
+    tmp_path.joinpath("tasks.py").write_text("print('foo')")
+    digest = cloud_build.hash_build_context(tmp_path)
+
+    tmp_path.joinpath("__pycache__").mkdir()
+    tmp_path.joinpath("__pycache__", "tasks.cpython-38.pyc").write_bytes(b"foo")
+    assert cloud_build.hash_build_context(tmp_path) == digest
+
+
+def test_hash_build_context_include(tmp_path):
+    tmp_path.joinpath("Dockerfile.base").write_text("FROM foo")
+    tmp_path.joinpath("tasks.py").write_text("print('foo')")
+    digest = cloud_build.hash_build_context(tmp_path, include=["Dockerfile.base"])
+
+    tmp_path.joinpath("tasks.py").write_text("print('bar')")
+    assert cloud_build.hash_build_context(tmp_path, include=["Dockerfile.base"]) == digest
+
+
+def test_context_tag():
+    assert cloud_build.context_tag("a" * 64) == "ctx-" + "a" * 24
+
+
+def test_get_image_manifest_found(mocker):
+    mock_session = mocker.Mock()
+    mock_session.get.return_value.status_code = 200
+    mock_session.get.return_value.content = b"manifest"
+    mock_session.get.return_value.headers = {"Content-Type": "foo/bar"}
+
+    manifest = cloud_build.get_image_manifest("cat", "taco", "ctx-abc", mock_session)
+    assert manifest == (b"manifest", "foo/bar")
+    assert mock_session.get.call_args[0][0] == "https://gcr.io/v2/cat/taco/manifests/ctx-abc"
+
+
+def test_get_image_manifest_missing(mocker):
+    mock_session = mocker.Mock()
+    mock_session.get.return_value.status_code = 404
+
+    assert cloud_build.get_image_manifest("cat", "taco", "ctx-abc", mock_session) is None
+
+
+def test_tag_image(mocker):
+    mock_session = mocker.Mock()
+
+    cloud_build.tag_image("cat", "taco", (b"manifest", "foo/bar"), "v2", mock_session)
+    mock_session.put.assert_called_with(
+        "https://gcr.io/v2/cat/taco/manifests/v2", data=b"manifest", headers={"Content-Type": "foo/bar"}
+    )
+
+
+def test_build_test_image_context_tag_request(mocker):
+    mock_build_client = MockBuildClient()
+    mocker.patch.object(mock_build_client, "create_build").return_value.metadata.build.id = "abc123"
+    mocker.patch("google.cloud.devtools.cloudbuild.CreateBuildRequest")
+
+    cloud_build.build_test_image("taco", "cat", "v1", "foo_bucket", "foo_blob", mock_build_client, "ctx-abc")
+    build = cloudbuild.CreateBuildRequest.call_args[1]["build"]
+    assert build["images"][:2] == ["gcr.io/cat/taco:v1", "gcr.io/cat/taco:ctx-abc"]
+    assert build["steps"][-1]["args"][-5:] == ["-t", "gcr.io/cat/taco:v1", "-t", "gcr.io/cat/taco:ctx-abc", "."]
+
+
+def test_build_test_image_base_tag_request(mocker):
+    mock_build_client = MockBuildClient()
+    mocker.patch.object(mock_build_client, "create_build").return_value.metadata.build.id = "abc123"
+    mocker.patch("google.cloud.devtools.cloudbuild.CreateBuildRequest")
+
+    cloud_build.build_test_image("taco", "cat", "v1", "foo_bucket", "foo_blob", mock_build_client, base_tag="ctx-def")
+    build = cloudbuild.CreateBuildRequest.call_args[1]["build"]
+    assert build["images"] == ["gcr.io/cat/taco:v1", "gcr.io/cat/taco-base:ctx-def", "gcr.io/cat/taco-base:latest"]
+    assert "BASE_IMAGE=gcr.io/cat/taco-base:ctx-def" in build["steps"][-1]["args"]
+
+
+def test_build_test_image_existing_base_request(mocker):
+    mock_build_client = MockBuildClient()
+    mocker.patch.object(mock_build_client, "create_build").return_value.metadata.build.id = "abc123"
+    mocker.patch("google.cloud.devtools.cloudbuild.CreateBuildRequest")
+
+    cloud_build.build_test_image(
+        "taco", "cat", "v1", "foo_bucket", "foo_blob", mock_build_client, base_tag="ctx-def", build_base=False
+    )
+    build = cloudbuild.CreateBuildRequest.call_args[1]["build"]
+    assert build["images"] == ["gcr.io/cat/taco:v1"]
+    assert len(build["steps"]) == 1
+    assert "BASE_IMAGE=gcr.io/cat/taco-base:ctx-def" in build["steps"][0]["args"]
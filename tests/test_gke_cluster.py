@@ -0,0 +1,26 @@
+from nuke_from_orbit.utils import gke_cluster
+
+
+def create_cluster_request(mocker, **kwargs):
+    client = mocker.Mock()
+    gke_cluster.setup_gke_cluster("nfo", "my-project", "us-central1-c", 3, "c2-standard-8", client, **kwargs)
+    return client.create_cluster.call_args.kwargs["request"]
+
+
+def test_setup_gke_cluster(mocker):
+    request = create_cluster_request(mocker)
+
+    assert request.parent == "projects/my-project/locations/us-central1-c"
+    assert [pool.name for pool in request.cluster.node_pools] == [gke_cluster.NODE_POOL_NAME]
+    assert not request.cluster.node_pools[0].config.preemptible
+    assert not request.cluster.node_pools[0].config.taints
+
+
+def test_setup_gke_cluster_preemptible_workers(mocker):
+    request = create_cluster_request(mocker, control_machine_type="e2-standard-2", preemptible=True)
+    worker_pool, control_pool = request.cluster.node_pools
+
+    assert worker_pool.config.preemptible
+    assert worker_pool.config.taints[0].key == gke_cluster.POOL_LABEL
+    assert control_pool.name == gke_cluster.CONTROL_POOL_NAME
+    assert not control_pool.config.preemptible
@@ -0,0 +1,266 @@
+import json
+import pytest
+from types import SimpleNamespace
+from nuke_from_orbit.utils import kubernetes_deploy
+
+
+MOCK_MANIFESTS = """---
+kind: Service
+apiVersion: v1
+metadata:
+  name: lm-pod
+---
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: lm-pod
+---
+"""
+
+
+@pytest.fixture(autouse=True)
+def reset_clients():
+    kubernetes_deploy.reset_clients()
+    yield
+    kubernetes_deploy.reset_clients()
+
+
+class MockDynamicClient:
+    """Mirrors DynamicClient.patch as of kubernetes 18.20, which predates server_side_apply."""
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.applied = []
+        self.requests = []
+        self.resources = SimpleNamespace(get=lambda api_version, kind: SimpleNamespace(kind=kind, namespaced=True))
+
+    def patch(self, resource, body=None, name=None, namespace=None, **kwargs):
+        if name in self.fail:
+            raise RuntimeError("mock failure")
+        params = dict(kwargs.get("query_params", []))
+        self.requests.append(kwargs)
+        self.applied.append((resource.kind, name, namespace, params.get("fieldManager")))
+        return json.loads(body)
+
+
+def test_load_manifests(tmp_path):
+    manifest_file = tmp_path.joinpath("locust-controller.yaml")
+    manifest_file.write_text(MOCK_MANIFESTS)
+
+    manifests = kubernetes_deploy.load_manifests([str(manifest_file)])
+
+    assert [kubernetes_deploy.manifest_name(m) for m in manifests] == ["service/lm-pod", "deployment/lm-pod"]
+
+
+def test_apply_manifests(mocker, tmp_path):
+    manifest_file = tmp_path.joinpath("locust-controller.yaml")
+    manifest_file.write_text(MOCK_MANIFESTS)
+    dynamic_client = MockDynamicClient()
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.config.load_kube_config")
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.dynamic.DynamicClient").return_value = dynamic_client
+
+    applied = kubernetes_deploy.apply_manifests([str(manifest_file)])
+
+    assert len(applied) == 2
+    assert sorted(dynamic_client.applied) == [
+        ("Deployment", "lm-pod", "default", "nuke-from-orbit"),
+        ("Service", "lm-pod", "default", "nuke-from-orbit")
+    ]
+    assert dynamic_client.requests[0] == {
+        "content_type": "application/apply-patch+yaml",
+        "query_params": [("fieldManager", "nuke-from-orbit"), ("force", "true")]
+    }
+
+
+def test_apply_objects_uses_manifest_namespace(mocker):
+    dynamic_client = MockDynamicClient()
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.config.load_kube_config")
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.dynamic.DynamicClient").return_value = dynamic_client
+    manifest = {
+        "apiVersion": "rbac.authorization.k8s.io/v1",
+        "kind": "RoleBinding",
+        "metadata": {"name": "mock-binding", "namespace": "kube-system"}
+    }
+
+    kubernetes_deploy.apply_objects([manifest])
+
+    assert dynamic_client.applied == [("RoleBinding", "mock-binding", "kube-system", "nuke-from-orbit")]
+
+
+def test_apply_manifests_reports_failures(mocker, tmp_path):
+    manifest_file = tmp_path.joinpath("locust-controller.yaml")
+    manifest_file.write_text(MOCK_MANIFESTS)
+    dynamic_client = MockDynamicClient(fail=["lm-pod"])
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.config.load_kube_config")
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.dynamic.DynamicClient").return_value = dynamic_client
+
+    with pytest.raises(kubernetes_deploy.ManifestApplyError) as e:
+        kubernetes_deploy.apply_manifests([str(manifest_file)])
+
+    assert sorted(name for name, _ in e.value.failures) == ["deployment/lm-pod", "service/lm-pod"]
+
+
+def mock_deployment(replicas, updated, available, generation=2, observed=2, name="lm-pod"):
+    return SimpleNamespace(
+        spec=SimpleNamespace(replicas=replicas),
+        metadata=SimpleNamespace(name=name, generation=generation),
+        status=SimpleNamespace(
+            replicas=replicas,
+            updated_replicas=updated,
+            available_replicas=available,
+            observed_generation=observed
+        )
+    )
+
+
+class MockWatch:
+    """Replays one list of events per stream call. An exception in place of a list is raised."""
+
+    streams = []
+    calls = []
+
+    def __init__(self):
+        self.resource_version = None
+        self.stopped = False
+
+    def stream(self, func, namespace, **kwargs):
+        MockWatch.calls.append(kwargs)
+        events = MockWatch.streams.pop(0)
+        if isinstance(events, Exception):
+            raise events
+        for resource_version, event in events:
+            self.resource_version = resource_version
+            yield event
+            if self.stopped:
+                return
+
+    def stop(self):
+        self.stopped = True
+
+
+def mock_apps_api(mocker, deployments, streams):
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.config.load_kube_config")
+    api = mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.client.AppsV1Api").return_value
+    api.list_namespaced_deployment.return_value = SimpleNamespace(
+        items=deployments, metadata=SimpleNamespace(resource_version="100")
+    )
+    MockWatch.streams = list(streams)
+    MockWatch.calls = []
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.watch.Watch", MockWatch)
+
+    return api
+
+
+def test_wait_for_deployments_already_ready(mocker):
+    api = mock_apps_api(mocker, [mock_deployment(1, 1, 1), mock_deployment(3, 3, 3, name="lw-pod")], [])
+
+    assert kubernetes_deploy.wait_for_deployments(["lm-pod", "lw-pod"])
+    api.list_namespaced_deployment.assert_called_once()
+    assert MockWatch.calls == []
+
+
+def test_wait_for_deployments_watches_changes(mocker):
+    streams = [
+        [
+            ("101", {"type": "MODIFIED", "object": mock_deployment(3, 3, 1, name="lw-pod")}),
+            ("102", {"type": "MODIFIED", "object": mock_deployment(3, 3, 3, name="lw-pod")})
+        ]
+    ]
+    mock_apps_api(mocker, [mock_deployment(1, 1, 1), mock_deployment(3, 0, 0, name="lw-pod")], streams)
+
+    assert kubernetes_deploy.wait_for_deployments(["lm-pod", "lw-pod"])
+    assert MockWatch.calls[0]["resource_version"] == "100"
+
+
+def test_wait_for_deployments_resumes_watch(mocker):
+    streams = [
+        [("105", {"type": "MODIFIED", "object": mock_deployment(3, 3, 1, name="lw-pod")})],
+        [("106", {"type": "MODIFIED", "object": mock_deployment(3, 3, 3, name="lw-pod")})]
+    ]
+    mock_apps_api(mocker, [mock_deployment(3, 0, 0, name="lw-pod")], streams)
+
+    kubernetes_deploy.wait_for_deployment("lw-pod")
+
+    assert [c["resource_version"] for c in MockWatch.calls] == ["100", "105"]
+
+
+def test_wait_for_deployments_relists_after_gone(mocker):
+    streams = [
+        kubernetes_deploy.ApiException(status=410),
+        [("201", {"type": "MODIFIED", "object": mock_deployment(3, 3, 3, name="lw-pod")})]
+    ]
+    api = mock_apps_api(mocker, [mock_deployment(3, 0, 0, name="lw-pod")], streams)
+
+    kubernetes_deploy.wait_for_deployment("lw-pod")
+
+    assert api.list_namespaced_deployment.call_count == 2
+
+
+def test_wait_for_deployments_timeout(mocker):
+    mock_apps_api(mocker, [mock_deployment(3, 0, 0, name="lw-pod")], [[]])
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.monotonic", side_effect=[0, 1, 5, 11])
+
+    with pytest.raises(kubernetes_deploy.DeploymentTimeoutError) as e:
+        kubernetes_deploy.wait_for_deployment("lw-pod", timeout=10)
+
+    assert e.value.deployments == ["lw-pod"]
+
+
+def test_get_api_client_is_shared(mocker):
+    load_mock = mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.config.load_kube_config")
+
+    api_client = kubernetes_deploy.get_api_client()
+
+    assert kubernetes_deploy.get_api_client() is api_client
+    assert api_client.configuration.connection_pool_maxsize == kubernetes_deploy.CONNECTION_POOL_SIZE
+    load_mock.assert_called_once()
+
+    kubernetes_deploy.reset_clients()
+
+    assert kubernetes_deploy.get_api_client() is not api_client
+    assert load_mock.call_count == 2
+
+
+def test_deploy_secrets(mocker):
+    dynamic_client = MockDynamicClient()
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.config.load_kube_config")
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.dynamic.DynamicClient").return_value = dynamic_client
+
+    applied = kubernetes_deploy.deploy_secrets({
+        "website-host": {"host": "https://looker.example.com"},
+        "website-creds": {"username": "dudefella", "password": "hunter2"}
+    })
+
+    assert sorted(dynamic_client.applied) == [
+        ("Secret", "website-creds", "default", "nuke-from-orbit"),
+        ("Secret", "website-host", "default", "nuke-from-orbit")
+    ]
+    host_secret = [a for a in applied if a["metadata"]["name"] == "website-host"][0]
+    assert host_secret["data"] == {"host": "aHR0cHM6Ly9sb29rZXIuZXhhbXBsZS5jb20="}
+
+
+def test_deployment_ready():
+    assert kubernetes_deploy.deployment_ready(mock_deployment(3, 3, 3))
+    assert not kubernetes_deploy.deployment_ready(mock_deployment(3, 3, None))
+    assert not kubernetes_deploy.deployment_ready(mock_deployment(3, 3, 3, observed=1))
+
+
+def test_deploy_config_map_replaces_existing(mocker):
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.config.load_kube_config")
+    api = mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.client.CoreV1Api").return_value
+    api.create_namespaced_config_map.side_effect = kubernetes_deploy.ApiException(status=409)
+
+    kubernetes_deploy.deploy_config_map("locust-scripts", {"tasks.py": ""})
+
+    api.replace_namespaced_config_map.assert_called_once()
+
+
+def test_deploy_config_map_raises_other_errors(mocker):
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.config.load_kube_config")
+    api = mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.client.CoreV1Api").return_value
+    api.create_namespaced_config_map.side_effect = kubernetes_deploy.ApiException(status=403)
+
+    with pytest.raises(kubernetes_deploy.ApiException):
+        kubernetes_deploy.deploy_config_map("locust-scripts", {"tasks.py": ""})
+
+    api.replace_namespaced_config_map.assert_not_called()
@@ -0,0 +1,135 @@
+import json
+from types import SimpleNamespace
+from nuke_from_orbit.utils import looker_capture
+
+
+def make_query(**kwargs):
+    fields = {field: None for field in looker_capture.QUERY_FIELDS}
+    fields.update(kwargs)
+    return SimpleNamespace(**fields)
+
+
+def make_element(element_id, query=None, look=None, listens=None, title=None):
+    filterables = None
+    if listens:
+        listen = [SimpleNamespace(dashboard_filter_name=k, field=v) for k, v in listens.items()]
+        filterables = [SimpleNamespace(listen=listen)]
+    result_maker = SimpleNamespace(query=None, filterables=filterables)
+    return SimpleNamespace(
+        id=element_id,
+        title=title,
+        title_text=None,
+        query=query,
+        look=look,
+        result_maker=result_maker
+    )
+
+
+def make_dashboard(elements, filters=None, components=None):
+    dashboard_filters = [SimpleNamespace(name=k, default_value=v) for k, v in (filters or {}).items()]
+    layout_components = [
+        SimpleNamespace(dashboard_element_id=k, row=row, column=column)
+        for k, (row, column) in (components or {}).items()
+    ]
+    layouts = [SimpleNamespace(active=True, dashboard_layout_components=layout_components)]
+    return SimpleNamespace(
+        title="Mock Dashboard",
+        dashboard_elements=elements,
+        dashboard_filters=dashboard_filters,
+        dashboard_layouts=layouts
+    )
+
+
+class MockSdk:
+    def __init__(self, dashboard):
+        self._dashboard = dashboard
+        self.created = []
+
+    def dashboard(self, dashboard_id):
+        return self._dashboard
+
+    def create_query(self, body):
+        self.created.append(body)
+        return SimpleNamespace(id=str(100 + len(self.created)), slug=f"slug{len(self.created)}")
+
+    def run_query(self, query_id, result_format):
+        return json.dumps([{"a": 1}, {"a": 2}])
+
+
+def test_tile_query_look():
+    query = make_query(model="m", view="v")
+    element = make_element("1", look=SimpleNamespace(query=query))
+    assert looker_capture.tile_query(element) is query
+
+
+def test_tile_query_text_tile():
+    element = make_element("1")
+    assert looker_capture.tile_query(element) is None
+
+
+def test_resolve_filters_defaults_and_overrides():
+    dashboard = make_dashboard([], filters={"Date": "7 days", "State": "", "Brand": "Levi's"})
+    filters = looker_capture.resolve_filters(dashboard, {"Date": "30 days"})
+    assert filters == {"Date": "30 days", "Brand": "Levi's"}
+
+
+def test_resolve_tiles_applies_filters():
+    query = make_query(model="m", view="v", fields=["v.a"], filters={"v.b": "x"})
+    element = make_element("1", query=query, listens={"Date": "v.date", "State": "v.state"})
+    dashboard = make_dashboard([element])
+
+    tiles, skipped = looker_capture.resolve_tiles(dashboard, {"Date": "7 days"})
+
+    assert skipped == 0
+    assert tiles[0]["query"] == {
+        "model": "m",
+        "view": "v",
+        "fields": ["v.a"],
+        "filters": {"v.b": "x", "v.date": "7 days"}
+    }
+
+
+def test_resolve_tiles_layout_order():
+    elements = [
+        make_element("1", query=make_query(model="m", view="v"), title="bottom"),
+        make_element("2", query=make_query(model="m", view="v"), title="top right"),
+        make_element("3", query=make_query(model="m", view="v"), title="top left"),
+        make_element("4", title="text tile")
+    ]
+    dashboard = make_dashboard(elements, components={"1": (6, 0), "2": (0, 12), "3": (0, 0)})
+
+    tiles, skipped = looker_capture.resolve_tiles(dashboard, {})
+
+    assert skipped == 1
+    assert [t["title"] for t in tiles] == ["top left", "top right", "bottom"]
+    assert [t["group"] for t in tiles] == [0, 0, 6]
+
+
+def test_capture_dashboard(mocker):
+    mocker.patch("looker_sdk.models40.WriteQuery", side_effect=lambda **kwargs: kwargs)
+    element = make_element("1", query=make_query(model="m", view="v"), title="tile")
+    sdk = MockSdk(make_dashboard([element], filters={"Date": "7 days"}))
+
+    plan = looker_capture.capture_dashboard("5", sdk, max_concurrency=4)
+
+    assert plan["dashboard_id"] == "5"
+    assert plan["max_concurrency"] == 4
+    assert plan["filters"] == {"Date": "7 days"}
+    assert plan["tiles"][0]["query_id"] == "101"
+    assert plan["tiles"][0]["expected_rows"] == 2
+
+
+def test_capture_dashboard_no_row_counts(mocker):
+    mocker.patch("looker_sdk.models40.WriteQuery", side_effect=lambda **kwargs: kwargs)
+    element = make_element("1", query=make_query(model="m", view="v"), title="tile")
+    sdk = MockSdk(make_dashboard([element]))
+
+    plan = looker_capture.capture_dashboard("5", sdk, count_rows=False)
+
+    assert "expected_rows" not in plan["tiles"][0]
+
+
+def test_write_plan(tmp_path):
+    plan_file = tmp_path.joinpath("plans", "dashboard_5.json")
+    looker_capture.write_plan({"version": 1, "tiles": []}, plan_file)
+    assert json.loads(plan_file.read_text()) == {"version": 1, "tiles": []}
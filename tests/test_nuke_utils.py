@@ -0,0 +1,376 @@
+import concurrent.futures
+import json
+import pytest
+import yaml
+from types import SimpleNamespace
+from google.api_core.exceptions import GoogleAPICallError
+from nuke_from_orbit.utils import nuke_utils
+
+
+def test_wait_for_operation_returns_when_done(mocker):
+    mock_sleep = mocker.patch("nuke_from_orbit.utils.nuke_utils.sleep")
+    statuses = iter([(False, "PENDING"), (False, "RUNNING"), (True, "DONE")])
+
+    status = nuke_utils.wait_for_operation(lambda: next(statuses), "Mock operation")
+
+    assert status == "DONE"
+    assert mock_sleep.call_count == 2
+
+
+def test_wait_for_operation_backs_off(mocker):
+    mock_sleep = mocker.patch("nuke_from_orbit.utils.nuke_utils.sleep")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.random.uniform", side_effect=lambda low, high: high)
+    statuses = iter([(False, "RUNNING")] * 7 + [(True, "DONE")])
+
+    nuke_utils.wait_for_operation(lambda: next(statuses), "Mock operation")
+
+    intervals = [c.args[0] for c in mock_sleep.call_args_list]
+    assert intervals == [1, 2, 4, 8, 16, 30, 30]
+
+
+def test_wait_for_operation_without_backoff(mocker):
+    mock_sleep = mocker.patch("nuke_from_orbit.utils.nuke_utils.sleep")
+    statuses = iter([(False, "RUNNING"), (True, "DONE")])
+
+    nuke_utils.wait_for_operation(lambda: next(statuses), "Mock operation", backoff=False)
+
+    mock_sleep.assert_not_called()
+
+
+def test_wait_for_operation_times_out(mocker):
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.sleep")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.monotonic", side_effect=[0, 5, 11])
+
+    with pytest.raises(nuke_utils.OperationTimeoutError):
+        nuke_utils.wait_for_operation(lambda: (False, "RUNNING"), "Mock operation", timeout=10)
+
+
+def test_wait_for_operation_surfaces_failure(mocker):
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.sleep")
+
+    with pytest.raises(nuke_utils.OperationFailedError):
+        nuke_utils.wait_for_operation(lambda: nuke_utils.check_build_status("FAILURE"), "Mock build")
+
+
+def test_check_compute_operation():
+    assert nuke_utils.check_compute_operation({"status": "RUNNING"}) == (False, "RUNNING")
+    assert nuke_utils.check_compute_operation({"status": "DONE"}) == (True, "DONE")
+
+    failed = {
+        "name": "mock-task",
+        "status": "DONE",
+        "error": {"errors": [{"code": "QUOTA_EXCEEDED", "message": "Quota exceeded"}]}
+    }
+    with pytest.raises(nuke_utils.OperationFailedError) as e:
+        nuke_utils.check_compute_operation(failed)
+    assert e.value.detail == "Quota exceeded"
+
+
+def test_check_gke_operation():
+    running = SimpleNamespace(
+        name="mock-task",
+        status=SimpleNamespace(name="RUNNING"),
+        detail="Creating nodes",
+        error=None,
+        status_message=""
+    )
+    assert nuke_utils.check_gke_operation(running) == (False, "RUNNING. Creating nodes")
+
+    failed = SimpleNamespace(
+        name="mock-task",
+        status=SimpleNamespace(name="DONE"),
+        detail="",
+        error=SimpleNamespace(code=8, message="Insufficient regional quota"),
+        status_message=""
+    )
+    with pytest.raises(nuke_utils.OperationFailedError):
+        nuke_utils.check_gke_operation(failed)
+
+
+def test_check_build_status():
+    assert nuke_utils.check_build_status("WORKING") == (False, "WORKING")
+    assert nuke_utils.check_build_status("SUCCESS") == (True, "SUCCESS")
+
+
+class MockBuildOperation:
+    def __init__(self, status=None, error=None):
+        self.status = status
+        self.error = error
+        self.timeout = None
+
+    def result(self, timeout=None):
+        self.timeout = timeout
+        if self.error:
+            raise self.error
+        return SimpleNamespace(status=SimpleNamespace(name=self.status))
+
+
+def test_wait_for_build():
+    operation = MockBuildOperation("SUCCESS")
+
+    assert nuke_utils.wait_for_build(operation, "Mock build", timeout=60) == "SUCCESS"
+    assert operation.timeout == 60
+
+
+def test_wait_for_build_surfaces_failure():
+    with pytest.raises(nuke_utils.OperationFailedError):
+        nuke_utils.wait_for_build(MockBuildOperation(error=GoogleAPICallError("Build failed")), "Mock build")
+
+    with pytest.raises(nuke_utils.OperationFailedError):
+        nuke_utils.wait_for_build(MockBuildOperation("CANCELLED"), "Mock build")
+
+
+def test_wait_for_build_times_out():
+    with pytest.raises(nuke_utils.OperationTimeoutError):
+        nuke_utils.wait_for_build(MockBuildOperation(error=concurrent.futures.TimeoutError()), "Mock build")
+
+
+MOCK_GKE_CONFIG = {
+    "loadtest_name": "mock-test",
+    "gcp_project_id": "mock-project",
+    "gcp_zone": "mock-zone",
+    "gcp_cluster_node_count": 3,
+    "gcp_cluster_machine_type": "c2-standard-8"
+}
+
+
+def mock_node_pool(enabled=False, min_node_count=0, max_node_count=0):
+    return SimpleNamespace(
+        name="load-test-pool",
+        config=SimpleNamespace(machine_type="c2-standard-8"),
+        autoscaling=SimpleNamespace(enabled=enabled, min_node_count=min_node_count, max_node_count=max_node_count)
+    )
+
+
+def test_reuse_gke_resizes_existing_cluster(mocker):
+    pool = mock_node_pool()
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_client")
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_cluster").return_value = SimpleNamespace(node_pools=[pool])
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.setup_cluster_auth_file")
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.set_node_pool_autoscaling")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.resize_gke")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_gke")
+
+    nuke_utils.reuse_gke(MOCK_GKE_CONFIG)
+
+    nuke_utils.resize_gke.assert_called_with(MOCK_GKE_CONFIG, 3)
+    nuke_utils.deploy_gke.assert_not_called()
+    nuke_utils.gke_cluster.set_node_pool_autoscaling.assert_not_called()
+
+
+def test_reuse_gke_updates_autoscaling(mocker):
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_client")
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_cluster").return_value = SimpleNamespace(
+        node_pools=[mock_node_pool()]
+    )
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.setup_cluster_auth_file")
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.set_node_pool_autoscaling")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.wait_for_operation")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.resize_gke")
+
+    nuke_utils.reuse_gke({**MOCK_GKE_CONFIG, "gcp_cluster_max_node_count": 6})
+
+    autoscaling = nuke_utils.gke_cluster.set_node_pool_autoscaling.call_args.args[3]
+    assert autoscaling == {"enabled": True, "min_node_count": 3, "max_node_count": 6}
+
+
+def test_reuse_gke_creates_missing_cluster(mocker):
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_client")
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_cluster").return_value = None
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.resize_gke")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_gke")
+
+    nuke_utils.reuse_gke(MOCK_GKE_CONFIG)
+
+    nuke_utils.deploy_gke.assert_called_with(MOCK_GKE_CONFIG)
+    nuke_utils.resize_gke.assert_not_called()
+
+
+def test_park_gke(mocker):
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_client")
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_cluster").return_value = SimpleNamespace(
+        node_pools=[mock_node_pool()]
+    )
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.set_node_pool_autoscaling")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.resize_gke")
+
+    nuke_utils.park_gke(MOCK_GKE_CONFIG)
+    nuke_utils.resize_gke.assert_called_with(MOCK_GKE_CONFIG, 0)
+
+    nuke_utils.park_gke({**MOCK_GKE_CONFIG, "gcp_cluster_standby_node_count": 1})
+    nuke_utils.resize_gke.assert_called_with({**MOCK_GKE_CONFIG, "gcp_cluster_standby_node_count": 1}, 1)
+    nuke_utils.gke_cluster.set_node_pool_autoscaling.assert_not_called()
+
+
+def test_park_gke_turns_off_autoscaling(mocker):
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_client")
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.get_gke_cluster").return_value = SimpleNamespace(
+        node_pools=[mock_node_pool(enabled=True, min_node_count=3, max_node_count=6)]
+    )
+    mocker.patch("nuke_from_orbit.utils.gke_cluster.set_node_pool_autoscaling")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.wait_for_operation")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.resize_gke")
+
+    nuke_utils.park_gke(MOCK_GKE_CONFIG)
+
+    autoscaling = nuke_utils.gke_cluster.set_node_pool_autoscaling.call_args.args[3]
+    assert autoscaling == {"enabled": False}
+    nuke_utils.resize_gke.assert_called_with(MOCK_GKE_CONFIG, 0)
+
+
+def test_check_worker_count():
+    config = {**MOCK_GKE_CONFIG, "loadtest_worker_count": 20}
+    assert nuke_utils.check_worker_count(config) == 1
+
+    with pytest.raises(nuke_utils.TooManyWorkersError):
+        nuke_utils.check_worker_count({**config, "loadtest_worker_cpu": 2})
+
+
+def test_check_worker_count_control_pool(capsys):
+    config = {
+        **MOCK_GKE_CONFIG,
+        "gcp_cluster_machine_type": "e2-highcpu-2",
+        "loadtest_worker_count": 3,
+        "loadtest_worker_memory_mb": 1024
+    }
+
+    with pytest.raises(nuke_utils.TooManyWorkersError):
+        nuke_utils.check_worker_count(config)
+
+    assert nuke_utils.check_worker_count({**config, "gcp_control_machine_type": "e2-standard-2"}) == 1
+    assert "control pool" not in capsys.readouterr().out
+
+    nuke_utils.check_worker_count({**config, "gcp_control_machine_type": "e2-highcpu-2"})
+    assert "control pool" in capsys.readouterr().out
+
+
+def test_check_worker_count_unknown_machine_type(capsys):
+    config = {**MOCK_GKE_CONFIG, "loadtest_worker_count": 20, "gcp_control_machine_type": "e2-tiny"}
+
+    assert nuke_utils.check_worker_count(config) == 1
+    assert "e2-tiny" in capsys.readouterr().out
+
+    assert nuke_utils.check_worker_count({**config, "gcp_control_machine_type": "e2-medium"}) == 1
+    assert "Skipping" not in capsys.readouterr().out
+
+
+def test_check_worker_count_autoscaled():
+    config = {
+        **MOCK_GKE_CONFIG,
+        "loadtest_worker_count": 5,
+        "loadtest_autoscale": True,
+        "loadtest_max_worker_count": 40
+    }
+
+    with pytest.raises(nuke_utils.TooManyWorkersError):
+        nuke_utils.check_worker_count(config)
+
+    assert nuke_utils.check_worker_count({**config, "gcp_cluster_max_node_count": 6}) == 1
+
+
+def test_configure_autoscaling(mocker, tmp_path):
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.CALIBRATION_PATH", tmp_path)
+    config = {
+        **MOCK_GKE_CONFIG,
+        "loadtest_script_name": "scenario2.py",
+        "loadtest_worker_count": 5,
+        "loadtest_autoscale": True
+    }
+
+    with pytest.raises(nuke_utils.MissingRequiredArgsError):
+        nuke_utils.configure_autoscaling(dict(config))
+
+    config["loadtest_max_worker_count"] = 20
+    with pytest.raises(nuke_utils.capacity.CalibrationError):
+        nuke_utils.configure_autoscaling(dict(config))
+
+    tmp_path.joinpath("scenario2.yaml").write_text("users_per_worker: 4\n")
+    assert nuke_utils.configure_autoscaling(dict(config))["loadtest_users_per_worker"] == 4
+    assert nuke_utils.configure_autoscaling({**config, "loadtest_users_per_worker": 2})["loadtest_users_per_worker"] == 2
+
+
+def test_calibrate_worker(mocker, tmp_path):
+    p95_by_users = {1: 3000, 2: 4000, 3: 9000}
+    state = {"users": 0}
+
+    def mock_locust_request(path, fields=None):
+        if path == "swarm":
+            state["users"] = fields["locust_count"]
+        if path == "stats/requests":
+            return json.dumps({
+                "current_response_time_percentile_95": p95_by_users[state["users"]],
+                "total_rps": state["users"] / 4,
+                "fail_ratio": 0
+            })
+        return ""
+
+    def mock_usage(label_selector):
+        return {"lw-pod-1": {"cpu": 0.05 + 0.5 * state["users"], "memory_mb": 300 + 400 * state["users"]}}
+
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.locust_request", side_effect=mock_locust_request)
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.sleep")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.monotonic", side_effect=range(0, 1000, 30))
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.CALIBRATION_PATH", tmp_path)
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.scale_deployment")
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.wait_for_deployment")
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.get_pod_usage", side_effect=mock_usage)
+
+    config = {**MOCK_GKE_CONFIG, "loadtest_script_name": "scenario2.py", "loadtest_worker_count": 10}
+    profile_file = nuke_utils.calibrate_worker(config, max_users=5, target_p95_ms=5000)
+
+    profile = yaml.safe_load(profile_file.read_text())
+    assert profile_file.name == "scenario2.yaml"
+    assert profile["users_per_worker"] == 2
+    assert profile["memory_per_user_mb"] == 400
+    assert [s["users"] for s in profile["steps"]] == [1, 2, 3]
+    nuke_utils.kubernetes_deploy.scale_deployment.assert_called_with("lw-pod", 10)
+
+
+def test_calibrate_worker_samples_short_steps(mocker, tmp_path):
+    stats = json.dumps({"current_response_time_percentile_95": 3000, "total_rps": 2, "fail_ratio": 0})
+    mocker.patch(
+        "nuke_from_orbit.utils.nuke_utils.locust_request",
+        side_effect=lambda path, fields=None: stats if path == "stats/requests" else ""
+    )
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.sleep")
+    # the step is over by the time the clock is read again
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.monotonic", side_effect=range(0, 1000, 100))
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.CALIBRATION_PATH", tmp_path)
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.scale_deployment")
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.wait_for_deployment")
+    mocker.patch(
+        "nuke_from_orbit.utils.kubernetes_deploy.get_pod_usage",
+        return_value={"lw-pod-1": {"cpu": 0.5, "memory_mb": 700}}
+    )
+
+    config = {**MOCK_GKE_CONFIG, "loadtest_script_name": "scenario2.py", "loadtest_worker_count": 10}
+    profile_file = nuke_utils.calibrate_worker(config, max_users=2, target_p95_ms=5000, step_duration=1)
+
+    profile = yaml.safe_load(profile_file.read_text())
+    assert [s["p95_ms"] for s in profile["steps"]] == [3000, 3000]
+    assert profile["steps"][0]["rps"] == 2
+
+
+def test_persistent_disk_sizes():
+    assert nuke_utils.persistent_disk_sizes(MOCK_GKE_CONFIG) == {"mock-test": 50}
+
+    config = {**MOCK_GKE_CONFIG, "loadtest_record_samples": True, "loadtest_results_disk_gb": 200}
+    assert nuke_utils.persistent_disk_sizes(config) == {"mock-test": 50, "mock-test-results": 200}
+
+
+def test_fetch_results(mocker, tmp_path):
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.RESULTS_PATH", tmp_path)
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.locust_request").return_value = json.dumps([
+        {"name": "samples-1.nfolat", "size": 4},
+        {"name": "samples-2.nfolat", "size": 8}
+    ])
+    mocker.patch("nuke_from_orbit.utils.kubernetes_deploy.proxy_service_request").return_value = b"12345678"
+    tmp_path.joinpath("mock-test").mkdir()
+    tmp_path.joinpath("mock-test", "samples-1.nfolat").write_bytes(b"1234")
+
+    files = nuke_utils.fetch_results(MOCK_GKE_CONFIG)
+
+    assert [f.name for f in files] == ["samples-1.nfolat", "samples-2.nfolat"]
+    nuke_utils.kubernetes_deploy.proxy_service_request.assert_called_once_with(
+        "lm-pod", "results/samples-2.nfolat", binary=True
+    )
@@ -0,0 +1,88 @@
+import pytest
+from nuke_from_orbit.utils import results
+
+
+def write_log(path, samples, truncate=0):
+    """Writes samples of (group, name, worker, response time, success) the way the master does."""
+
+    strings = {}
+    data = bytearray(results.MAGIC)
+
+    def string_id(value):
+        if value not in strings:
+            strings[value] = len(strings)
+            encoded = value.encode("utf-8")
+            data.extend(results.STRING_HEADER.pack(results.STRING_RECORD, strings[value], len(encoded)))
+            data.extend(encoded)
+        return strings[value]
+
+    for i, (group, name, worker, response_time, success) in enumerate(samples):
+        ids = string_id(group), string_id(name), string_id(worker)
+        data.extend(results.SAMPLE.pack(results.SAMPLE_RECORD, 1600000000 + i, *ids, response_time, success))
+
+    path.write_bytes(bytes(data[:len(data) - truncate]))
+    return path
+
+
+def test_read_samples(tmp_path):
+    log = write_log(tmp_path.joinpath("a.nfolat"), [
+        ("Async", "dashboard", "worker-1", 1200.5, True),
+        ("Async", "tile", "worker-2", 300, False)
+    ])
+
+    samples = list(results.read_samples(log))
+
+    assert samples[0] == (1600000000, "Async", "dashboard", "worker-1", 1200.5, True)
+    assert samples[1][1:] == ("Async", "tile", "worker-2", 300, False)
+
+
+def test_read_samples_skips_partial_record(tmp_path):
+    log = write_log(tmp_path.joinpath("a.nfolat"), [("Async", "dashboard", "worker-1", 100, True)] * 3, truncate=5)
+
+    assert len(list(results.read_samples(log))) == 2
+
+
+def test_read_samples_rejects_other_files(tmp_path):
+    path = tmp_path.joinpath("a.nfolat")
+    path.write_bytes(b"not a log")
+
+    with pytest.raises(results.ResultsFormatError):
+        list(results.read_samples(path))
+
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    assert results.percentile(values, 50) == 50
+    assert results.percentile(values, 99) == 99
+    assert results.percentile([7], 95) == 7
+
+
+def test_summarize(tmp_path):
+    first = write_log(tmp_path.joinpath("a.nfolat"), [
+        ("Async", "dashboard", "worker-1", float(ms), ms != 1) for ms in range(1, 51)
+    ])
+    second = write_log(tmp_path.joinpath("b.nfolat"), [
+        ("Async", "dashboard", "worker-2", float(ms), True) for ms in range(51, 101)
+    ] + [("Async", "tile", "worker-2", 5.0, True)])
+
+    summary = results.summarize([first, second])
+
+    assert summary[0] == {
+        "name": "dashboard", "count": 100, "failures": 1,
+        "p50": 50, "p90": 90, "p95": 95, "p99": 99, "max": 100
+    }
+    assert summary[1]["name"] == "tile"
+    assert [row["worker"] for row in results.summarize([first, second], by="worker")] == ["worker-1", "worker-2"]
+
+    with pytest.raises(ValueError):
+        results.summarize([first], by="dashboard")
+
+
+def test_write_summary_csv(tmp_path):
+    summary = [{"name": "dashboard", "count": 1, "failures": 0, "p50": 1.0, "p90": 1.0, "p95": 1.0, "p99": 1.0, "max": 1.0}]
+
+    results.write_summary_csv(summary, tmp_path.joinpath("summary.csv"))
+
+    lines = tmp_path.joinpath("summary.csv").read_text().splitlines()
+    assert lines == ["name,count,failures,p50,p90,p95,p99,max", "dashboard,1,0,1.0,1.0,1.0,1.0,1.0"]
@@ -0,0 +1,62 @@
+import pytest
+import threading
+from nuke_from_orbit.utils import scheduler
+
+
+def test_run_steps_respects_dependencies():
+    calls = []
+    steps = [
+        scheduler.Step("c", calls.append, "c", depends_on=["a", "b"]),
+        scheduler.Step("a", calls.append, "a"),
+        scheduler.Step("b", calls.append, "b", depends_on=["a"])
+    ]
+
+    durations = scheduler.run_steps(steps)
+
+    assert calls == ["a", "b", "c"]
+    assert list(durations) == ["a", "b", "c"]
+
+
+def test_run_steps_overlaps_independent_steps():
+    # both steps must be running at once for either to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    steps = [
+        scheduler.Step("a", barrier.wait),
+        scheduler.Step("b", barrier.wait)
+    ]
+
+    scheduler.run_steps(steps, max_workers=2)
+
+
+def test_run_steps_stops_after_failure():
+    calls = []
+
+    def fail():
+        raise RuntimeError("mock failure")
+
+    steps = [
+        scheduler.Step("a", fail),
+        scheduler.Step("b", calls.append, "b", depends_on=["a"])
+    ]
+
+    with pytest.raises(RuntimeError):
+        scheduler.run_steps(steps)
+
+    assert calls == []
+
+
+def test_check_steps_cycle():
+    steps = [
+        scheduler.Step("a", print, depends_on=["b"]),
+        scheduler.Step("b", print, depends_on=["a"])
+    ]
+
+    with pytest.raises(scheduler.StepDependencyError):
+        scheduler.check_steps(steps)
+
+
+def test_check_steps_missing_dependency():
+    steps = [scheduler.Step("a", print, depends_on=["missing"])]
+
+    with pytest.raises(scheduler.StepDependencyError):
+        scheduler.check_steps(steps)
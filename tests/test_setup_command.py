@@ -83,6 +83,30 @@ def test_main_run_threads_no_persistence_no_external(mocker):
     nuke_utils.deploy_persistent_disk.assert_not_called()
 
 
+def test_main_run_threads_no_persistence_record_samples(mocker):
+    user_config = {**MOCK_USER_CONFIG, "loadtest_record_samples": True}
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.set_variables").return_value = user_config
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_gke")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_test_container_image")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_ip_address")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_persistent_disk")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.get_ip_address")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.collect_kube_yaml_templates")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.render_kubernetes_templates")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.set_kubernetes_context")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_looker_secret")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_oauth_secret")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_external")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_locust")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_secondary")
+
+    setup_commands.main(config_file="mock_config.yaml", external=False, persistence=False)
+
+    # the locust master mounts the results disk, so it's created anyway
+    nuke_utils.deploy_persistent_disk.assert_called_with(user_config)
+    nuke_utils.deploy_locust.assert_called_once()
+
+
 def test_main_run_threads_persistence_external(mocker):
     mocker.patch("nuke_from_orbit.utils.nuke_utils.set_variables").return_value = MOCK_USER_CONFIG
     mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_gke")
@@ -409,3 +433,41 @@ def test_main_deploy_secondary(mocker):
     # determine if context call occurs before deployment
     expected_call_order = [mocker.call.context_mock(MOCK_USER_CONFIG), mocker.call.deploy_mock()]
     assert parent_mock.mock_calls == expected_call_order
+
+
+def test_main_deploy_secondary_waits_on_persistent_disk(mocker):
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.set_variables").return_value = MOCK_USER_CONFIG
+    run_steps = mocker.patch("nuke_from_orbit.utils.scheduler.run_steps")
+
+    setup_commands.main(config_file="mock_config.yaml", external=False, persistence=True)
+    steps = {step.name: step for step in run_steps.call_args.args[0]}
+    assert "persistent disk" in steps["secondary"].depends_on
+
+    setup_commands.main(config_file="mock_config.yaml", external=False, persistence=False)
+    steps = {step.name: step for step in run_steps.call_args.args[0]}
+    assert steps["secondary"].depends_on == ["context", "templates"]
+
+
+def test_main_reuse_gke(mocker):
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.set_variables").return_value = MOCK_USER_CONFIG
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_gke")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.reuse_gke")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_test_container_image")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_ip_address")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_persistent_disk")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.get_ip_address")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.collect_kube_yaml_templates")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.render_kubernetes_templates")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.set_kubernetes_context")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_looker_secret")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_oauth_secret")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_external")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_locust")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_secondary")
+    mocker.patch("nuke_from_orbit.utils.nuke_utils.deploy_test_scripts")
+
+    setup_commands.main(config_file="mock_config.yaml", external=False, persistence=True, reuse=True)
+
+    nuke_utils.reuse_gke.assert_called_with(MOCK_USER_CONFIG)
+    nuke_utils.deploy_gke.assert_not_called()
+    nuke_utils.deploy_test_scripts.assert_called_with(MOCK_USER_CONFIG)